@@ -0,0 +1,52 @@
+"""
+Classifier selection.
+
+XSPAND_CLASSIFIER=tensorflow (the default) loads the Keras model from
+app.imageurl_classify. XSPAND_CLASSIFIER=stub needs neither TensorFlow nor
+network access and returns deterministic labels derived from the image URL,
+for offline development and load tests.
+"""
+import hashlib
+import os
+import time
+
+CLASSIFIER = os.getenv("XSPAND_CLASSIFIER", "tensorflow").lower()
+# Simulated inference time of the stub classifier
+STUB_LATENCY_MS = float(os.getenv("XSPAND_STUB_CLASSIFIER_LATENCY_MS", "0"))
+
+CLASS_LABELS = [
+    'Atelectasis', 'Cardiomegaly', 'Consolidation', 'Edema',
+    'Effusion', 'Emphysema', 'Fibrosis', 'Infiltration',
+    'Mass', 'Nodule', 'Pleural_Thickening', 'Pneumonia',
+    'Pneumothorax'
+]
+
+class StubClassifier:
+    def __init__(self, latency_ms: float = STUB_LATENCY_MS):
+        self.class_labels = list(CLASS_LABELS)
+        self.latency = latency_ms / 1000.0
+
+    def classify(self, image_source, is_url=True):
+        if self.latency:
+            time.sleep(self.latency)
+        # The same image always gets the same one or two labels
+        digest = hashlib.sha256(str(image_source).encode()).digest()
+        labels, confidences = [], []
+        for byte in digest[1:2 + digest[0] % 2]:
+            label = self.class_labels[byte % len(self.class_labels)]
+            if label not in labels:
+                labels.append(label)
+                confidences.append(0.5 + byte / 510)
+        return {
+            "labels": ", ".join(labels),
+            "confidence_scores": ", ".join(f"{confidence:.4f}" for confidence in confidences)
+        }
+
+def create_classifier(kind: str = CLASSIFIER):
+    if kind == "stub":
+        return StubClassifier()
+    if kind == "tensorflow":
+        # Imported here so the stub never needs TensorFlow installed
+        from app.imageurl_classify import ImageClassifier
+        return ImageClassifier()
+    raise ValueError(f"Unknown classifier: {kind}")
@@ -0,0 +1,142 @@
+import asyncio
+import contextlib
+import math
+import os
+import time
+from collections import deque
+from fastapi import HTTPException
+from app.core.metrics import Counter, Gauge
+
+# Classifications run at once; each holds a model forward pass and an image download
+INFERENCE_CONCURRENCY = int(os.getenv("XSPAND_INFERENCE_CONCURRENCY", "2"))
+# Classifications allowed to wait for a slot before new ones are turned away
+INFERENCE_QUEUE_SIZE = int(os.getenv("XSPAND_INFERENCE_QUEUE_SIZE", "16"))
+# Longest a classification waits for a slot before giving up
+INFERENCE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("XSPAND_INFERENCE_QUEUE_TIMEOUT_SECONDS", "10"))
+
+QUEUE_DEPTH = Gauge("xspand_admission_queue_depth", "Requests waiting for an admission slot", ["pool"])
+IN_FLIGHT = Gauge("xspand_admission_in_flight", "Requests holding an admission slot", ["pool"])
+REJECTED = Counter("xspand_admission_rejected_total", "Requests shed with 503", ["pool", "reason"])
+
+class Overloaded(HTTPException):
+    """
+    503 raised when a request is shed; carries Retry-After.
+    """
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Server busy ({name}), retry in {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded FIFO wait queue. A request that finds
+    the queue full, or waits longer than queue_timeout, gets an immediate
+    503 with a Retry-After estimated from the recent service time, instead
+    of piling up until every client times out.
+
+    Used from the event loop only, so no locking is needed.
+    """
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters = deque()
+        # Moving average of how long a slot is held, for Retry-After
+        self._service_time = None
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record(time.monotonic() - started)
+            self.release()
+
+    async def acquire(self):
+        if self.in_flight < self.max_concurrent and not self.queue_depth:
+            self.in_flight += 1
+            self.admitted += 1
+            self._export()
+            return
+        if self.queue_depth >= self.max_queue:
+            self.rejected_full += 1
+            REJECTED.labels(self.name, "queue_full").inc()
+            raise Overloaded(self.name, self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._export()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                self.admitted += 1
+                return
+            self.rejected_timeout += 1
+            REJECTED.labels(self.name, "queue_timeout").inc()
+            raise Overloaded(self.name, self.retry_after())
+        except asyncio.CancelledError:
+            if not self._abandon(waiter):
+                self.release()
+            raise
+        self.admitted += 1
+
+    def _abandon(self, waiter) -> bool:
+        # False if the slot was handed over before the waiter gave up
+        if waiter.done():
+            return False
+        waiter.cancel()
+        with contextlib.suppress(ValueError):
+            self._waiters.remove(waiter)
+        self._export()
+        return True
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter so it can't be overtaken
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._export()
+                return
+        self.in_flight -= 1
+        self._export()
+
+    def _export(self):
+        QUEUE_DEPTH.labels(self.name).set(self.queue_depth)
+        IN_FLIGHT.labels(self.name).set(self.in_flight)
+
+    def _record(self, seconds: float):
+        if self._service_time is None:
+            self._service_time = seconds
+        else:
+            self._service_time = 0.8 * self._service_time + 0.2 * seconds
+
+    def retry_after(self) -> int:
+        service_time = self._service_time or 1.0
+        return max(1, math.ceil((self.queue_depth + 1) * service_time / self.max_concurrent))
+
+    def get_stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_service_seconds": round(self._service_time, 4) if self._service_time is not None else None
+        }
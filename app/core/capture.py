@@ -0,0 +1,93 @@
+"""
+Traffic capture for performance regression testing.
+
+CaptureMiddleware records one JSON line per sampled request: when it
+started, method, route template, path, query, JSON body, status, latency
+and response size. Requests are sanitised before they are written: headers
+are dropped (except Accept, which picks NDJSON streaming), personal fields
+are replaced with valid placeholders and signed URLs lose their query
+string. Document IDs in paths and bodies are kept so the traffic can be
+replayed against a copy of the same data (python -m app.loadtest.replay).
+
+Lines are written by a background thread to a size-rotated file, like
+logging's RotatingFileHandler (traffic.jsonl, traffic.jsonl.1, ...).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+from logging.handlers import QueueListener, RotatingFileHandler
+from urllib.parse import parse_qsl, urlsplit, urlunsplit
+
+CAPTURE_FILE = os.getenv("XSPAND_CAPTURE_FILE", os.path.join("captures", "traffic.jsonl"))
+# Fraction of requests captured; 0 disables capture
+CAPTURE_SAMPLE_RATE = float(os.getenv("XSPAND_CAPTURE_SAMPLE_RATE", "0"))
+CAPTURE_MAX_BYTES = int(os.getenv("XSPAND_CAPTURE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Rotated files kept next to CAPTURE_FILE
+CAPTURE_BACKUPS = int(os.getenv("XSPAND_CAPTURE_BACKUPS", "5"))
+# Larger request bodies are recorded as truncated, without content
+CAPTURE_MAX_BODY_BYTES = int(os.getenv("XSPAND_CAPTURE_MAX_BODY_BYTES", str(64 * 1024)))
+
+# Personal data replaced before writing; placeholders still pass validation
+REDACTED_FIELDS = {
+    "full_name": "Redacted",
+    "email": "redacted@example.org",
+    "email_address": "redacted@example.org",
+    "contact_number": "+10000000000",
+    "password": "redacted",
+    "radiologist_report": "Redacted"
+}
+# Fields holding URLs whose query string may carry a signature
+URL_FIELDS = {"image_url"}
+
+def _strip_url_query(url: str) -> str:
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+def sanitize_body(value, key: str = None):
+    if isinstance(value, dict):
+        return {k: sanitize_body(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize_body(item, key) for item in value]
+    if isinstance(value, str):
+        if key in REDACTED_FIELDS:
+            return REDACTED_FIELDS[key]
+        if key in URL_FIELDS:
+            return _strip_url_query(value)
+    return value
+
+def sanitize_query(query_string: bytes) -> list:
+    """
+    [name, value] pairs of a raw query string, sanitised like a body.
+    """
+    return [
+        [name, sanitize_body(value, name)]
+        for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    ]
+
+class TrafficCapture:
+    def __init__(self, path: str = CAPTURE_FILE, max_bytes: int = CAPTURE_MAX_BYTES, backups: int = CAPTURE_BACKUPS):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue = queue.SimpleQueue()
+        self._listener = QueueListener(self._queue, self._handler)
+        self._listener.start()
+        self.captured = 0
+        atexit.register(self.close)
+
+    def record(self, entry: dict):
+        """
+        Queue one request for writing; never blocks on the file.
+        """
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        self._queue.put(logging.makeLogRecord({"msg": line}))
+        self.captured += 1
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+            self._handler.close()
@@ -0,0 +1,64 @@
+from app.database.firebase import FirebaseDB
+from app.database.storage import create_database
+from app.database.reference_cache import ReferenceCache
+from app.core.single_flight import SingleFlight
+from app.core.response_cache import ResponseCache
+from app.core.events import EventBus
+from app.services.disease_service import DiseaseService
+from app.services.patient_service import PatientService
+from app.services.user_service import UserService
+from app.services.xray_service import XRayService
+from app.services.worklist_service import WorklistService
+import os
+import time
+
+class AppContext:
+    """
+    Process-wide objects shared by every request: one FirebaseDB (and so one
+    Firestore client / gRPC channel) and the services built on top of it.
+    """
+    def __init__(self, db: FirebaseDB = None):
+        self.db = db if db is not None else create_database()
+        self.started_at = time.time()
+        self.reference_cache = ReferenceCache(self.db.db)
+        self.db.reference_cache = self.reference_cache
+        # Change notifications pushed to /events subscribers
+        self.events = EventBus()
+        self.disease_service = DiseaseService(self.db)
+        self.patient_service = PatientService(self.db, self.events)
+        self.user_service = UserService(self.db)
+        self.xray_service = XRayService(self.db, self.events)
+        self.worklist_service = WorklistService(self.db)
+        # Shared by SingleFlightMiddleware for identical concurrent GET requests
+        self.route_flights = SingleFlight("routes")
+        # Whole responses of the aggregate endpoints, dropped on writes to their collections
+        self.response_cache = ResponseCache()
+        self.db.write_listeners.append(self.response_cache.invalidate)
+
+    def start(self):
+        # The worklist ranks scans by disease severity, so warm the reference cache first
+        self.reference_cache.start()
+        self.worklist_service.start()
+
+    def close(self):
+        self.worklist_service.stop()
+        self.xray_service.close()
+        self.reference_cache.stop()
+        self.db.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "firestore_channels": FirebaseDB.open_channel_count(),
+            "reference_cache": self.reference_cache.get_stats(),
+            "disease_index": self.xray_service.disease_index.get_stats(),
+            "admission": {"inference": self.xray_service.inference_admission.get_stats()},
+            "response_cache": self.response_cache.get_stats(),
+            "worklist": self.worklist_service.get_stats(),
+            "events": self.events.get_stats(),
+            "single_flight": {
+                flight.name: flight.get_stats()
+                for flight in (self.route_flights, self.db.single_flight, self.xray_service.classify_flight)
+            }
+        }
@@ -0,0 +1,134 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Events kept for Last-Event-ID resumption
+EVENT_HISTORY_SIZE = int(os.getenv("XSPAND_EVENT_HISTORY_SIZE", "1000"))
+# Events buffered per subscriber before it is cut off
+SUBSCRIBER_BUFFER_SIZE = int(os.getenv("XSPAND_EVENT_SUBSCRIBER_BUFFER", "100"))
+
+UNVERIFIED_TOPIC = "unverified"
+
+def patient_topic(patient_id: str) -> str:
+    return f"patient:{patient_id}"
+
+def doctor_topic(doctor_id: str) -> str:
+    return f"doctor:{doctor_id}"
+
+def scan_topics(scan: dict, unverified: bool = False) -> list:
+    """
+    Topics a scan event goes to; unverified adds the radiologist queue topic.
+    """
+    topics = []
+    if scan.get("patient_id"):
+        topics.append(patient_topic(scan["patient_id"]))
+    if scan.get("doctor_id"):
+        topics.append(doctor_topic(scan["doctor_id"]))
+    if unverified:
+        topics.append(UNVERIFIED_TOPIC)
+    return topics
+
+class Event:
+    def __init__(self, event_id: str, event_type: str, topics, data: dict):
+        self.id = event_id
+        self.type = event_type
+        self.topics = frozenset(topics)
+        self.data = data
+        self.published_at = time.time()
+
+class Subscription:
+    def __init__(self, bus, topics, buffer_size: int):
+        self._bus = bus
+        self.topics = frozenset(topics)
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        # Set when the subscriber fell behind; it must reconnect with Last-Event-ID
+        self.overflowed = False
+
+    def wants(self, event: Event) -> bool:
+        return not self.topics or bool(self.topics & event.topics)
+
+    def offer(self, event: Event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self._bus.overflows += 1
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+class EventBus:
+    """
+    In-process publish/subscribe for change notifications. Publishing never
+    blocks: each subscriber has a bounded queue and a subscriber that falls
+    behind is cut off instead of slowing the publisher down. The last
+    EVENT_HISTORY_SIZE events are kept so a reconnecting client can resume
+    from its Last-Event-ID.
+
+    Event IDs carry this process's boot ID; an ID from another process (or
+    one too old for the history) can't be resumed and the client is told to
+    resync instead.
+    """
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE, buffer_size: int = SUBSCRIBER_BUFFER_SIZE):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.buffer_size = buffer_size
+        self._history = deque(maxlen=history_size)
+        self._sequence = itertools.count(1)
+        self._subscriptions = set()
+        self.published = 0
+        self.overflows = 0
+
+    def publish(self, event_type: str, topics, data: dict) -> Event:
+        """
+        Publish from the event loop thread.
+        """
+        event = Event(f"{self.boot_id}-{next(self._sequence)}", event_type, topics, data)
+        self._history.append(event)
+        self.published += 1
+        for subscription in list(self._subscriptions):
+            if subscription.wants(event):
+                subscription.offer(event)
+        return event
+
+    def subscribe(self, topics=(), last_event_id: str = None):
+        """
+        Returns (subscription, replay): replay holds the missed events after
+        last_event_id, or None if they can no longer be replayed.
+        """
+        subscription = Subscription(self, topics, self.buffer_size)
+        replay = []
+        if last_event_id:
+            replay = self._replay_after(last_event_id)
+            if replay is not None:
+                replay = [event for event in replay if subscription.wants(event)]
+        self._subscriptions.add(subscription)
+        return subscription, replay
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def _replay_after(self, last_event_id: str):
+        boot_id, _, sequence = last_event_id.partition("-")
+        if boot_id != self.boot_id or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        if self._history and int(self._history[0].id.split("-")[1]) > sequence + 1:
+            # Part of the gap has already been evicted from the history
+            return None
+        return [event for event in self._history if int(event.id.split("-")[1]) > sequence]
+
+    def get_stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "history": len(self._history),
+            "overflows": self.overflows
+        }
@@ -0,0 +1,498 @@
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+from app.database.unit_of_work import unit_of_work
+from app.database.request_cost import request_cost
+from app.routes.common import NDJSON_MEDIA_TYPE
+from app.core.response_cache import CACHED_ROUTES, CachedResponse
+from app.core.metrics import Gauge, Histogram
+from app.core.profiler import SamplingProfiler, profile_path
+from app.core.capture import CAPTURE_MAX_BODY_BYTES, CAPTURE_SAMPLE_RATE, TrafficCapture, sanitize_body, sanitize_query
+
+logger = logging.getLogger(__name__)
+
+UNIT_OF_WORK_ENABLED = os.getenv("XSPAND_UNIT_OF_WORK", "1") == "1"
+SINGLE_FLIGHT_ENABLED = os.getenv("XSPAND_SINGLE_FLIGHT", "1") == "1"
+# Responses larger than this are streamed to the leader only, never shared
+SINGLE_FLIGHT_MAX_BYTES = int(os.getenv("XSPAND_SINGLE_FLIGHT_MAX_BYTES", str(8 * 1024 * 1024)))
+# Endpoints whose responses never end (event feeds) and so can't be shared
+UNBOUNDED_STREAM_PATHS = {"/api/v1/events"}
+RESPONSE_CACHE_ENABLED = os.getenv("XSPAND_RESPONSE_CACHE", "1") == "1"
+# Debug mode: report each request's Firestore cost in X-Cost-* headers
+COST_HEADERS_ENABLED = os.getenv("XSPAND_DEBUG_COST_HEADERS", "0") == "1"
+# Requests sending X-Profile: <token> are profiled; unset disables the header
+PROFILE_TOKEN = os.getenv("XSPAND_PROFILE_TOKEN", "")
+# Fraction of requests profiled at random
+PROFILE_SAMPLE_RATE = float(os.getenv("XSPAND_PROFILE_SAMPLE_RATE", "0"))
+PROFILING_ENABLED = bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+CAPTURE_ENABLED = CAPTURE_SAMPLE_RATE > 0
+# Per-request headers that must not be replayed from a cached response
+UNCACHED_HEADERS = {b"x-document-reads", b"x-document-writes", b"x-document-hits", b"x-coalesced"}
+
+REQUEST_SECONDS = Histogram(
+    "xspand_http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge("xspand_http_requests_in_flight", "HTTP requests being served", ["method"])
+
+def route_template(scope) -> str:
+    """
+    The template of the route that served a finished request
+    (/patients/{patient_id}), for labelling it with bounded cardinality.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope["path"] in CACHED_ROUTES:
+        return scope["path"]
+    # Served without reaching the router (a coalesced follower): match it here
+    partial = "unmatched"
+    for route in scope["app"].router.routes:
+        match = route.matches(scope)[0]
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial == "unmatched":
+            partial = route.path
+    return partial
+
+class MetricsMiddleware:
+    """
+    Records request latency and in-flight requests for /metrics. Routes are
+    labelled by their template (/patients/{patient_id}), not the raw path,
+    to keep the number of series bounded. Event streams never finish and
+    are left out.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNBOUNDED_STREAM_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_SECONDS.labels(method, route_template(scope), str(status)).observe(time.perf_counter() - started)
+
+class RequestCostMiddleware:
+    """
+    Counts the Firestore queries and documents each request costs (see
+    app.database.request_cost) and logs a warning when a request goes over
+    the configured limits or repeats a query shape in a loop. In debug mode
+    the counts so far are returned in X-Cost-* headers; documents streamed
+    after the headers went out only show up in the warning.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNBOUNDED_STREAM_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        with request_cost() as cost:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and COST_HEADERS_ENABLED:
+                    headers = MutableHeaders(scope=message)
+                    headers["X-Cost-Queries"] = str(cost.queries)
+                    headers["X-Cost-Documents-Read"] = str(cost.documents_read)
+                    headers["X-Cost-Documents-Written"] = str(cost.documents_written)
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                problems = cost.problems()
+                if problems:
+                    logger.warning("Expensive request %s %s: %s", scope["method"], scope["path"], "; ".join(problems))
+
+class ProfilerMiddleware:
+    """
+    Profiles a request with the sampling profiler when it carries
+    X-Profile: <XSPAND_PROFILE_TOKEN>, or is picked at XSPAND_PROFILE_SAMPLE_RATE,
+    and writes a speedscope file named in the X-Profile-File response header.
+    Registered only when profiling is configured, so it costs nothing otherwise.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._triggered(scope):
+            await self.app(scope, receive, send)
+            return
+
+        path = profile_path(scope["method"], scope["path"])
+        # This coroutine's frame marks the request's own stacks on the event loop
+        profiler = SamplingProfiler(threading.get_ident(), sys._getframe())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Profile-File"] = os.path.basename(path)
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            try:
+                await run_in_threadpool(profiler.write, path, f"{scope['method']} {scope['path']}")
+            except OSError as e:
+                logger.warning("Error writing profile %s: %s", path, e)
+
+    @staticmethod
+    def _triggered(scope) -> bool:
+        if PROFILE_TOKEN:
+            token = dict(scope["headers"]).get(b"x-profile")
+            if token is not None and hmac.compare_digest(token, PROFILE_TOKEN.encode()):
+                return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+class CaptureMiddleware:
+    """
+    Records a sanitised copy of sampled requests (XSPAND_CAPTURE_SAMPLE_RATE)
+    with their status and latency to the rotating traffic capture file, for
+    replay with python -m app.loadtest.replay. Registered only when capture
+    is enabled.
+    """
+    def __init__(self, app, capture: TrafficCapture = None):
+        self.app = app
+        self.capture = capture or TrafficCapture()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNBOUNDED_STREAM_PATHS or random.random() >= CAPTURE_SAMPLE_RATE:
+            await self.app(scope, receive, send)
+            return
+
+        chunks, size = [], 0
+        status, response_bytes = 500, 0
+
+        async def receive_wrapper():
+            nonlocal size
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                size += len(body)
+                if size <= CAPTURE_MAX_BODY_BYTES:
+                    chunks.append(body)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            entry = {
+                "t": round(started_at, 6),
+                "method": scope["method"],
+                "route": route_template(scope),
+                "path": scope["path"],
+                "query": sanitize_query(scope["query_string"]),
+                "accept": dict(scope["headers"]).get(b"accept", b"").decode("latin-1") or None,
+                "body": None,
+                "status": status,
+                "duration_ms": round(duration * 1000, 3),
+                "response_bytes": response_bytes
+            }
+            if size > CAPTURE_MAX_BODY_BYTES:
+                entry["body_truncated"] = True
+            elif size:
+                try:
+                    entry["body"] = sanitize_body(json.loads(b"".join(chunks)))
+                except ValueError:
+                    # Only JSON bodies are replayable
+                    entry["body_truncated"] = True
+            self.capture.record(entry)
+
+class UnitOfWorkMiddleware:
+    """
+    Runs each HTTP request inside a FirebaseDB unit of work. Pending writes
+    are flushed just before the response starts, so a failed flush can still
+    be reported; error responses (status >= 400) discard them instead.
+    The request's backend reads, writes and identity-map hits are returned
+    in X-Document-Reads, X-Document-Writes and X-Document-Hits.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not UNIT_OF_WORK_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        db = scope["app"].state.context.db
+        with unit_of_work() as unit:
+            failed = False
+
+            async def send_wrapper(message):
+                nonlocal failed
+                if failed:
+                    return
+                if message["type"] == "http.response.start":
+                    if message["status"] < 400:
+                        try:
+                            await db.flush_unit_of_work()
+                        except Exception as e:
+                            failed = True
+                            await self._send_error(send, unit, getattr(e, "status_code", 500), getattr(e, "detail", str(e)))
+                            return
+                    else:
+                        discarded = unit.take_pending()
+                        if discarded:
+                            logger.info("Discarded %d pending writes for failed request %s", len(discarded), scope["path"])
+                    # Anything written after this point (e.g. while streaming) goes straight through
+                    unit.closed = True
+                    self._add_headers(MutableHeaders(scope=message), unit)
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _add_headers(headers: MutableHeaders, unit):
+        headers["X-Document-Reads"] = str(unit.reads)
+        headers["X-Document-Writes"] = str(unit.writes)
+        headers["X-Document-Hits"] = str(unit.hits)
+
+    async def _send_error(self, send, unit, status_code: int, detail):
+        body = json.dumps({"detail": f"Error saving changes: {detail}"}).encode()
+        headers = MutableHeaders(raw=[])
+        headers["content-type"] = "application/json"
+        headers["content-length"] = str(len(body))
+        self._add_headers(headers, unit)
+        await send({"type": "http.response.start", "status": status_code, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
+
+
+class SingleFlightMiddleware:
+    """
+    Coalesces identical concurrent GET requests (same path, query string and
+    Accept header): the first is executed and its response is replayed to
+    the requests that arrived while it was running. NDJSON streams, and
+    responses over SINGLE_FLIGHT_MAX_BYTES, are not shared; the waiting
+    requests then run on their own.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not SINGLE_FLIGHT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        accept = headers.get(b"accept", b"").decode("latin-1")
+        if NDJSON_MEDIA_TYPE in accept or scope["path"] in UNBOUNDED_STREAM_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        leader = False
+
+        async def execute():
+            nonlocal leader
+            leader = True
+            messages, size = [], 0
+
+            async def record(message):
+                nonlocal messages, size
+                if messages is not None:
+                    size += len(message.get("body", b""))
+                    if size > SINGLE_FLIGHT_MAX_BYTES:
+                        messages = None
+                    else:
+                        messages.append(message)
+                await send(message)
+
+            await self.app(scope, receive, record)
+            return messages
+
+        flights = scope["app"].state.context.route_flights
+        key = (scope["path"], scope["query_string"], accept)
+        messages = await flights.do(key, execute)
+        if leader:
+            return
+        if messages is None:
+            await self.app(scope, receive, send)
+            return
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message["headers"]) + [(b"x-coalesced", b"1")])
+            await send(message)
+
+
+class ResponseCacheMiddleware:
+    """
+    Serves the GET endpoints listed in CACHED_ROUTES from the ResponseCache.
+    Fresh entries are replayed as they are; entries past their TTL but
+    within stale-while-revalidate are replayed while one background request
+    recomputes them. Responses carry Cache-Control, Age and X-Cache
+    (HIT, STALE or MISS).
+    """
+    def __init__(self, app):
+        self.app = app
+        self._refreshes = set()
+
+    async def __call__(self, scope, receive, send):
+        policy = CACHED_ROUTES.get(scope.get("path")) if scope["type"] == "http" else None
+        if policy is None or scope["method"] != "GET" or not RESPONSE_CACHE_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        accept = dict(scope["headers"]).get(b"accept", b"").decode("latin-1")
+        if NDJSON_MEDIA_TYPE in accept:
+            await self.app(scope, receive, send)
+            return
+
+        cache = scope["app"].state.context.response_cache
+        key = (scope["path"], scope["query_string"], accept)
+        entry = cache.get(key)
+        if entry is not None:
+            fresh = entry.is_fresh()
+            if not fresh and cache.begin_refresh(key):
+                # A fresh context, so the refresh's reads aren't charged to this (finished) request
+                task = contextvars.Context().run(asyncio.ensure_future, self._refresh(scope, key, policy, cache))
+                self._refreshes.add(task)
+                task.add_done_callback(self._refreshes.discard)
+            headers = MutableHeaders(raw=list(entry.headers))
+            self._add_headers(headers, policy, "HIT" if fresh else "STALE", entry.age())
+            await send({"type": "http.response.start", "status": entry.status, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": entry.body})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                self._add_headers(MutableHeaders(scope=message), policy, "MISS", 0)
+            await send(message)
+
+        await self._fetch(scope, receive, send_wrapper, key, policy, cache)
+
+    async def _refresh(self, scope, key, policy, cache):
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def discard(message):
+            pass
+
+        try:
+            await self._fetch(dict(scope), receive, discard, key, policy, cache)
+        except Exception:
+            logger.exception("Background refresh of %s failed", scope["path"])
+        finally:
+            cache.end_refresh(key)
+
+    async def _fetch(self, scope, receive, send, key, policy, cache):
+        """
+        Run the request and store its response if it is a 200 and no write
+        to the policy's tags happened meanwhile.
+        """
+        generation = cache.generation(policy.tags)
+        start, body = None, []
+
+        async def record(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = [(name, value) for name, value in message["headers"] if name.lower() not in UNCACHED_HEADERS]
+                start = dict(message, headers=headers)
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, record)
+        if start is not None and start["status"] == 200:
+            cache.put(key, CachedResponse(200, start["headers"], b"".join(body), policy), generation)
+
+    @staticmethod
+    def _add_headers(headers: MutableHeaders, policy, status: str, age: float):
+        headers["Cache-Control"] = policy.cache_control
+        headers["Age"] = str(int(age))
+        headers["X-Cache"] = status
+
+
+class ETagMiddleware:
+    """
+    Adds a strong ETag (sha256 of the body) to successful GET responses and
+    answers If-None-Match with 304 Not Modified and no body. Streamed
+    responses (no Content-Length) are passed through untouched.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        if_none_match = dict(scope["headers"]).get(b"if-none-match", b"").decode("latin-1")
+        start, body, passthrough = None, [], False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if message["status"] != 200 or "content-length" not in headers:
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            content = b"".join(body)
+            headers = MutableHeaders(scope=start)
+            etag = headers.get("etag") or f'"{hashlib.sha256(content).hexdigest()}"'
+            headers["ETag"] = etag
+            if self._matches(if_none_match, etag):
+                del headers["content-length"]
+                if "content-type" in headers:
+                    del headers["content-type"]
+                await send(dict(start, status=304))
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send(start)
+            await send({"type": "http.response.body", "body": content})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _matches(if_none_match: str, etag: str) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in candidates
@@ -0,0 +1,164 @@
+"""
+Sampling profiler for single requests, written out in speedscope's file
+format (open at https://www.speedscope.app or with the speedscope CLI).
+
+A background thread samples the Python stacks every PROFILE_INTERVAL_MS
+while the request runs. Event-loop samples are kept only when the request's
+own coroutine chain is running; the rest of the time is shown as
+"[awaiting]" (I/O and other tasks), so the profile adds up to wall-clock
+time. Worker threads (Firestore round trips, image download, preprocessing
+and model.predict) are profiled whenever they are busy, one speedscope
+profile per thread; under concurrent load they may include work done for
+other requests. Other threads (listeners, cache refreshers) are left out.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+PROFILE_DIR = os.getenv("XSPAND_PROFILE_DIR", "profiles")
+# Profiles kept in PROFILE_DIR; the oldest are deleted beyond this
+PROFILE_KEEP = int(os.getenv("XSPAND_PROFILE_KEEP", "50"))
+PROFILE_INTERVAL_MS = float(os.getenv("XSPAND_PROFILE_INTERVAL_MS", "1"))
+PROFILE_SUFFIX = ".speedscope.json"
+
+AWAITING = ("[awaiting]", "", 0)
+# Pools request work runs on: run_in_threadpool and the inference executor
+WORKER_THREAD_PREFIXES = ("AnyIO worker thread", "inference", "ThreadPoolExecutor")
+# Modules an idle worker thread sits in while waiting for work
+IDLE_MODULES = (
+    os.sep + "threading.py", os.sep + "queue.py", os.sep + "selectors.py",
+    os.path.join("concurrent", "futures", "thread.py"), os.path.join("anyio", "_backends", "_asyncio.py")
+)
+
+class SamplingProfiler:
+    def __init__(self, loop_thread: int, request_frame, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.loop_thread = loop_thread
+        self.request_frame = request_frame
+        self.interval = interval_ms / 1000.0
+        self._frames = {}
+        self._threads = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self.started_at = None
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = (now - last) * 1000, now
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident == self.loop_thread:
+                    stack = self._request_stack(frame)
+                    name = "event loop"
+                else:
+                    name = names.get(ident, "")
+                    if not name.startswith(WORKER_THREAD_PREFIXES):
+                        continue
+                    stack = self._stack(frame)
+                    if self._is_idle(stack):
+                        continue
+                self._record(name, stack, weight)
+
+    def _request_stack(self, frame) -> list:
+        # Leaf-to-root until the request's own frame; [awaiting] if it isn't running
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            if frame is self.request_frame:
+                stack.reverse()
+                return [self._key(frame) for frame in stack]
+            frame = frame.f_back
+        return [AWAITING]
+
+    def _stack(self, frame) -> list:
+        stack = []
+        while frame is not None:
+            stack.append(self._key(frame))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    @staticmethod
+    def _key(frame) -> tuple:
+        code = frame.f_code
+        return (code.co_qualname, code.co_filename, code.co_firstlineno)
+
+    @staticmethod
+    def _is_idle(stack: list) -> bool:
+        return all(filename.endswith(IDLE_MODULES) for _, filename, _ in stack)
+
+    def _record(self, thread_name: str, stack: list, weight: float):
+        indices = []
+        for key in stack:
+            index = self._frames.get(key)
+            if index is None:
+                index = self._frames[key] = len(self._frames)
+            indices.append(index)
+        samples, weights = self._threads.setdefault(thread_name, ([], []))
+        samples.append(indices)
+        weights.append(weight)
+
+    def to_speedscope(self, name: str) -> dict:
+        frames = [{"name": key[0], "file": key[1], "line": key[2]} for key in self._frames]
+        end = self.duration * 1000
+        # The event loop (the request itself) first, so speedscope opens on it
+        threads = sorted(self._threads.items(), key=lambda item: item[0] != "event loop")
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "xspand",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": end,
+                    "samples": samples,
+                    "weights": weights
+                }
+                for thread_name, (samples, weights) in threads
+            ]
+        }
+
+    def write(self, path: str, name: str, keep: int = PROFILE_KEEP):
+        """
+        Write the profile to path and delete the oldest profiles in its
+        directory beyond keep.
+        """
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_speedscope(name), f)
+        profiles = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith(PROFILE_SUFFIX)),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in profiles[:max(0, len(profiles) - keep)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+def profile_path(method: str, path: str, directory: str = PROFILE_DIR) -> str:
+    slug = "".join(c if c.isalnum() else "_" for c in path.strip("/"))[:80] or "root"
+    stamp = time.strftime("%Y%m%dT%H%M%S") + f"{time.time() % 1:.6f}"[1:]
+    return os.path.join(directory, f"{stamp}-{method}-{slug}{PROFILE_SUFFIX}")
@@ -0,0 +1,138 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("XSPAND_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+class CachePolicy:
+    """
+    ttl: seconds a response is served as fresh. stale_while_revalidate:
+    further seconds it may be served while a background refresh runs.
+    tags: collections whose writes invalidate the response.
+    """
+    def __init__(self, ttl: float, stale_while_revalidate: float, tags):
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.tags = frozenset(tags)
+
+    @property
+    def cache_control(self) -> str:
+        return f"max-age={int(self.ttl)}, stale-while-revalidate={int(self.stale_while_revalidate)}"
+
+# Full paths of the aggregate GET endpoints worth caching
+CACHED_ROUTES = {
+    "/api/v1/patients/status": CachePolicy(5, 30, ["patients", "patient_scan_status"]),
+    "/api/v1/diseases/counts/all_patients": CachePolicy(5, 30, ["diseases", "disease_patient_counts"]),
+    "/api/v1/diseases/counts/current_patients": CachePolicy(5, 30, ["diseases", "disease_patient_counts"]),
+    "/api/v1/xrays/unverified": CachePolicy(5, 30, ["xray_scans"]),
+}
+
+class CachedResponse:
+    def __init__(self, status: int, headers: list, body: bytes, policy: CachePolicy):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.policy = policy
+        self.stored_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+    def is_fresh(self) -> bool:
+        return self.age() < self.policy.ttl
+
+    def is_usable(self) -> bool:
+        return self.age() < self.policy.ttl + self.policy.stale_while_revalidate
+
+class ResponseCache:
+    """
+    LRU cache of whole responses, bounded by the total size of the cached
+    bodies. Entries are dropped as soon as a write to one of their tags is
+    reported, so a client never reads around its own write.
+    """
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        # Bumped on every invalidation, so a response computed across a write isn't stored
+        self._generations = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry.is_usable():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.is_fresh():
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return entry
+
+    def generation(self, tags) -> tuple:
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in sorted(tags))
+
+    def put(self, key, entry: CachedResponse, generation: tuple):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation != tuple(self._generations.get(tag, 0) for tag in sorted(entry.policy.tags)):
+                return
+            self._remove(key)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, tag: str):
+        """
+        Write listener for FirebaseDB: drop every response tagged with tag.
+        """
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            stale = [key for key, entry in self._entries.items() if tag in entry.policy.tags]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def begin_refresh(self, key) -> bool:
+        """
+        Claim the background refresh of key; False if one is already running.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.body)
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
@@ -0,0 +1,61 @@
+import asyncio
+import copy
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    work, callers arriving while it is in flight wait for the same result
+    instead of repeating it. Nothing is cached once the call finishes.
+
+    The work runs in its own task, so a cancelled caller doesn't cancel it
+    for the others. Shared results are deep-copied per caller, so callers can
+    mutate what they get back.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._flights = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        Return the result of await fn(), shared with concurrent calls for key.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._run(key, fn)))
+            flight.task.add_done_callback(self._retrieve)
+            self._flights[key] = flight
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        flight.waiters += 1
+        result = await asyncio.shield(flight.task)
+        return copy.deepcopy(result) if flight.waiters > 1 else result
+
+    async def _run(self, key, fn):
+        try:
+            return await fn()
+        finally:
+            # Later callers start a fresh execution
+            self._flights.pop(key, None)
+
+    @staticmethod
+    def _retrieve(task):
+        # Every waiter may have been cancelled; don't log the error as unretrieved
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> dict:
+        total = self.executions + self.coalesced
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+            "coalesced_ratio": round(self.coalesced / total, 4) if total else 0.0
+        }
@@ -0,0 +1,193 @@
+"""
+Materialized aggregates kept in step with the documents they summarise.
+
+Helpers take the raw client and a transaction so several aggregates can be
+maintained inside one Firestore transaction. Firestore requires every read
+in a transaction to happen before the first write, so each aggregate has a
+read_* step and a write_* step.
+"""
+from app.models.enums import TreatmentStatus, Verify_status
+from app.database.versioning import stamped
+
+RELATIONS_COLLECTION = "doctor_patient_relations"
+DISEASE_COUNTS_COLLECTION = "disease_patient_counts"
+SCANS_COLLECTION = "xray_scans"
+PATIENTS_COLLECTION = "patients"
+PATIENT_STATUS_COLLECTION = "patient_scan_status"
+
+def relation_disease_counts(relation: dict) -> dict:
+    """
+    What one relation contributes to the counters: {disease_id: (total, ongoing)}.
+    """
+    if not relation or not relation.get("diagnosed_disease_id"):
+        return {}
+    ongoing = 1 if relation.get("treatment_status") == TreatmentStatus.ongoing else 0
+    return {relation["diagnosed_disease_id"]: (1, ongoing)}
+
+def disease_count_deltas(before: dict, after: dict) -> dict:
+    deltas = {}
+    for disease_id, (total, ongoing) in relation_disease_counts(after).items():
+        deltas[disease_id] = (total, ongoing)
+    for disease_id, (total, ongoing) in relation_disease_counts(before).items():
+        current_total, current_ongoing = deltas.get(disease_id, (0, 0))
+        deltas[disease_id] = (current_total - total, current_ongoing - ongoing)
+    return {disease_id: delta for disease_id, delta in deltas.items() if delta != (0, 0)}
+
+def read_documents(client, transaction, collection: str, doc_ids) -> dict:
+    """
+    Read several documents in one round trip: {doc_id: data or None}.
+    """
+    references = [client.collection(collection).document(doc_id) for doc_id in doc_ids]
+    if not references:
+        return {}
+    return {
+        snapshot.id: snapshot.to_dict() if snapshot.exists else None
+        for snapshot in client.get_all(references, transaction=transaction)
+    }
+
+def read_disease_counts(client, transaction, disease_ids, prefetched: dict = None) -> dict:
+    prefetched = prefetched or {}
+    counts = {disease_id: prefetched[disease_id] for disease_id in disease_ids if disease_id in prefetched}
+    missing = [disease_id for disease_id in disease_ids if disease_id not in prefetched]
+    counts.update(read_documents(client, transaction, DISEASE_COUNTS_COLLECTION, missing))
+    return counts
+
+def write_disease_counts(client, transaction, counts: dict, deltas: dict):
+    for disease_id, (total, ongoing) in deltas.items():
+        current = counts.get(disease_id) or {}
+        transaction.set(client.collection(DISEASE_COUNTS_COLLECTION).document(disease_id), stamped({
+            "disease_id": disease_id,
+            "total_patients": max(0, current.get("total_patients", 0) + total),
+            "ongoing_patients": max(0, current.get("ongoing_patients", 0) + ongoing)
+        }))
+
+def rebuild_disease_counts(client) -> int:
+    """
+    Recompute every counter from doctor_patient_relations. Returns the number
+    of counter documents written.
+    """
+    totals = {}
+    for doc in client.collection(RELATIONS_COLLECTION).stream():
+        for disease_id, (total, ongoing) in relation_disease_counts(doc.to_dict()).items():
+            current_total, current_ongoing = totals.get(disease_id, (0, 0))
+            totals[disease_id] = (current_total + total, current_ongoing + ongoing)
+
+    writes = []
+    for doc in client.collection(DISEASE_COUNTS_COLLECTION).stream():
+        if doc.id not in totals:
+            writes.append(("delete", doc.reference, None))
+    for disease_id, (total, ongoing) in totals.items():
+        writes.append(("set", client.collection(DISEASE_COUNTS_COLLECTION).document(disease_id), stamped({
+            "disease_id": disease_id,
+            "total_patients": total,
+            "ongoing_patients": ongoing
+        })))
+    _commit_in_batches(client, writes)
+    return len(totals)
+
+def patient_status_summary(patient_id: str, scan_count: int, verified_count: int, latest_scan_timestamp=None) -> dict:
+    if scan_count <= 0:
+        status = Verify_status.empty
+    elif verified_count > 0:
+        status = Verify_status.verified
+    else:
+        status = Verify_status.unverified
+    return {
+        "patient_id": patient_id,
+        "status": status.value,
+        "scan_count": max(0, scan_count),
+        "verified_count": max(0, verified_count),
+        "latest_scan_timestamp": latest_scan_timestamp
+    }
+
+def summarize_scans(patient_id: str, scans: list) -> dict:
+    timestamps = [scan["scan_timestamp"] for scan in scans if scan.get("scan_timestamp")]
+    return patient_status_summary(
+        patient_id,
+        len(scans),
+        sum(1 for scan in scans if scan.get("radiologist_id")),
+        max(timestamps) if timestamps else None
+    )
+
+def read_patient_status(client, transaction, scan_id: str, before: dict, after: dict, prefetched: dict = None) -> dict:
+    """
+    Work out the new summary of every patient a scan write touches. Patients
+    losing a scan, or without a summary yet, are recounted from their scans
+    (the latest timestamp can't be decremented); otherwise the stored summary
+    is adjusted in place. prefetched maps patient IDs to summaries already
+    read in this transaction. Only registered patients get a summary, so a
+    scan left behind by a deleted patient doesn't bring theirs back.
+    """
+    before_patient = before.get("patient_id") if before else None
+    after_patient = after.get("patient_id") if after else None
+    patient_ids = {before_patient, after_patient} - {None}
+    prefetched = prefetched or {}
+    stored = {patient_id: prefetched[patient_id] for patient_id in patient_ids if patient_id in prefetched}
+    stored.update(read_documents(client, transaction, PATIENT_STATUS_COLLECTION, patient_ids - set(prefetched)))
+    # Registered patients normally have a summary; check the others are registered at all
+    unsummarized = {patient_id for patient_id in patient_ids if stored.get(patient_id) is None}
+    if unsummarized:
+        patients = read_documents(client, transaction, PATIENTS_COLLECTION, unsummarized)
+        patient_ids -= {patient_id for patient_id in unsummarized if patients.get(patient_id) is None}
+
+    summaries = {}
+    for patient_id in patient_ids:
+        current = stored.get(patient_id)
+        retimed = before_patient == patient_id and after_patient == patient_id and \
+            before.get("scan_timestamp") != after.get("scan_timestamp")
+        if patient_id != after_patient or current is None or retimed:
+            query = client.collection(SCANS_COLLECTION).where("patient_id", "==", patient_id)
+            scans = [doc.to_dict() for doc in query.stream(transaction=transaction) if doc.id != scan_id]
+            if patient_id == after_patient:
+                scans.append(after)
+            summaries[patient_id] = summarize_scans(patient_id, scans)
+            continue
+
+        summary = current
+        scan_count = summary.get("scan_count", 0)
+        verified_count = summary.get("verified_count", 0)
+        if before_patient == patient_id:
+            verified_count -= 1 if before.get("radiologist_id") else 0
+        else:
+            scan_count += 1
+        verified_count += 1 if after.get("radiologist_id") else 0
+        timestamps = [t for t in (summary.get("latest_scan_timestamp"), after.get("scan_timestamp")) if t]
+        summaries[patient_id] = patient_status_summary(patient_id, scan_count, verified_count, max(timestamps) if timestamps else None)
+    return summaries
+
+def write_patient_status(client, transaction, summaries: dict):
+    for patient_id, summary in summaries.items():
+        transaction.set(client.collection(PATIENT_STATUS_COLLECTION).document(patient_id), stamped(summary))
+
+def rebuild_patient_status(client) -> int:
+    """
+    Recompute the status summary of every registered patient from
+    xray_scans. Returns the number of summaries written.
+    """
+    scans_by_patient = {}
+    for doc in client.collection(SCANS_COLLECTION).stream():
+        scan = doc.to_dict()
+        scans_by_patient.setdefault(scan.get("patient_id"), []).append(scan)
+
+    # Scans of deleted or never registered patients don't get a summary
+    patient_ids = {doc.id for doc in client.collection(PATIENTS_COLLECTION).stream()}
+    writes = []
+    for doc in client.collection(PATIENT_STATUS_COLLECTION).stream():
+        if doc.id not in patient_ids:
+            writes.append(("delete", doc.reference, None))
+    for patient_id in patient_ids:
+        summary = summarize_scans(patient_id, scans_by_patient.get(patient_id, []))
+        writes.append(("set", client.collection(PATIENT_STATUS_COLLECTION).document(patient_id), stamped(summary)))
+    _commit_in_batches(client, writes)
+    return len(patient_ids)
+
+def _commit_in_batches(client, writes, batch_size: int = 500):
+    # Firestore accepts at most 500 writes per batch
+    for start in range(0, len(writes), batch_size):
+        batch = client.batch()
+        for kind, reference, data in writes[start:start + batch_size]:
+            if kind == "delete":
+                batch.delete(reference)
+            else:
+                batch.set(reference, data)
+        batch.commit()
@@ -0,0 +1,332 @@
+"""
+Columnar snapshots of collections for offline analytics.
+
+Each collection is read page by page (FirebaseDB.iter_document_pages) and
+written as a zstd-compressed Parquet or Arrow IPC file, one row group per
+EXPORT_ROW_GROUP_ROWS documents, so memory stays bounded by a row group
+whatever the collection size. Pyarrow is only needed here and is imported
+when an export runs.
+
+Columns follow the pydantic model in app.models.schemas: document_id
+first, the model's fields in declaration order, then updated_at as a UTC
+timestamp. Every column but document_id is nullable; fields not on the
+model are left out and values that don't fit their column are written as
+null and counted per column.
+
+manifest.json in the output directory records every run: for each file
+its row count, size, SHA-256 and schema fingerprint, and for each
+collection the high-water mark the next run exports changes from. The
+mark is the run's start time less EXPORT_OVERLAP_SECONDS, so a write
+committed while the run was reading is never missed; such documents may
+appear in two files and consumers keep the row with the latest updated_at
+per document_id. Deletions are not exported, and a collection whose schema
+fingerprint changed gets a full export.
+"""
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Union, get_args, get_origin
+from app.models.schemas import Disease, Doctor, DoctorPatientRelation, Patient, Radiologist, XRayScan
+from app.database.pagination import MAX_PAGE_SIZE
+from app.database.versioning import UPDATED_AT, format_timestamp
+
+# Collections that can be exported, with the model their columns come from
+EXPORT_MODELS = {
+    "patients": Patient,
+    "doctors": Doctor,
+    "radiologists": Radiologist,
+    "diseases": Disease,
+    "xray_scans": XRayScan,
+    "doctor_patient_relations": DoctorPatientRelation
+}
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+# zstd or lz4 work for both formats
+EXPORT_COMPRESSION = os.getenv("XSPAND_EXPORT_COMPRESSION", "zstd")
+EXPORT_ROW_GROUP_ROWS = int(os.getenv("XSPAND_EXPORT_ROW_GROUP_ROWS", "10000"))
+# Margin under the run's start time for writes stamped before it but committed after
+EXPORT_OVERLAP_SECONDS = int(os.getenv("XSPAND_EXPORT_OVERLAP_SECONDS", "60"))
+MANIFEST_FILE = "manifest.json"
+DOCUMENT_ID_COLUMN = "document_id"
+CHECKSUM_READ_BYTES = 1024 * 1024
+INT64_RANGE = range(-2 ** 63, 2 ** 63)
+
+# Checked in order: bool is an int, and str/int enums are their value type
+_FIELD_KINDS = ((bool, "bool"), (int, "int64"), (float, "float64"), (str, "string"))
+
+def _field_kind(annotation) -> str:
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return _field_kind(args[0])
+    elif origin is list:
+        return f"list<{_field_kind(get_args(annotation)[0])}>"
+    elif isinstance(annotation, type):
+        for python_type, kind in _FIELD_KINDS:
+            if issubclass(annotation, python_type):
+                return kind
+    raise TypeError(f"No column type for {annotation!r}")
+
+def export_columns(model) -> list:
+    """
+    [(column, kind)] for a model; kind is string, int64, float64, bool,
+    timestamp or list<kind>.
+    """
+    columns = [(DOCUMENT_ID_COLUMN, "string")]
+    columns += [(name, _field_kind(field.annotation)) for name, field in model.model_fields.items()]
+    columns.append((UPDATED_AT, "timestamp"))
+    return columns
+
+def schema_fingerprint(columns: list) -> str:
+    return hashlib.sha256(json.dumps(columns).encode()).hexdigest()[:16]
+
+def _coerce(value, kind: str):
+    """
+    value as its column's Python type; raises ValueError or TypeError if it
+    doesn't fit.
+    """
+    if value is None:
+        return None
+    if kind.startswith("list<"):
+        if not isinstance(value, (list, tuple)):
+            raise TypeError(f"expected a list, got {type(value).__name__}")
+        return [_coerce(item, kind[5:-1]) for item in value]
+    if isinstance(value, Enum):
+        value = value.value
+    if kind == "string":
+        if isinstance(value, (str, int, float)):
+            return str(value)
+    elif kind == "bool":
+        if isinstance(value, bool):
+            return value
+    elif kind == "int64":
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, str):
+            value = int(value)
+        if isinstance(value, int) and not isinstance(value, bool) and value in INT64_RANGE:
+            return value
+    elif kind == "float64":
+        if isinstance(value, (int, float, str)) and not isinstance(value, bool):
+            return float(value)
+    elif kind == "timestamp":
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if isinstance(value, datetime):
+            return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    raise TypeError(f"{type(value).__name__} doesn't fit a {kind} column")
+
+class ColumnBuffer:
+    """
+    Documents converted to column lists, up to one row group.
+    """
+    def __init__(self, columns: list):
+        self.columns = columns
+        self.invalid = Counter()
+        self._reset()
+
+    def _reset(self):
+        self.values = {name: [] for name, _ in self.columns}
+        self.rows = 0
+
+    def add(self, doc_id: str, data: dict):
+        for name, kind in self.columns:
+            value = doc_id if name == DOCUMENT_ID_COLUMN else data.get(name)
+            try:
+                value = _coerce(value, kind)
+            except (TypeError, ValueError):
+                self.invalid[name] += 1
+                value = None
+            self.values[name].append(value)
+        self.rows += 1
+
+    def take(self) -> dict:
+        values = self.values
+        self._reset()
+        return values
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Columnar export needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+def _arrow_type(pa, kind: str):
+    if kind.startswith("list<"):
+        return pa.list_(_arrow_type(pa, kind[5:-1]))
+    return {
+        "string": pa.string(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "bool": pa.bool_(),
+        "timestamp": pa.timestamp("us", tz="UTC")
+    }[kind]
+
+def arrow_schema(columns: list):
+    pa = require_pyarrow()
+    return pa.schema([
+        pa.field(name, _arrow_type(pa, kind), nullable=name != DOCUMENT_ID_COLUMN)
+        for name, kind in columns
+    ])
+
+def _open_writer(pa, path: str, schema, format: str):
+    if format == "parquet":
+        return pa.parquet.ParquetWriter(path, schema, compression=EXPORT_COMPRESSION)
+    return pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression=EXPORT_COMPRESSION))
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(CHECKSUM_READ_BYTES)
+            if not block:
+                return digest.hexdigest()
+            digest.update(block)
+
+def load_manifest(directory: str) -> dict:
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"collections": {}, "runs": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(directory: str, manifest: dict):
+    """
+    Replace the manifest atomically, so readers never see half of it.
+    """
+    path = os.path.join(directory, MANIFEST_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(path + ".tmp", path)
+
+async def export_collection(db, collection: str, directory: str, run_id: str, format: str = "parquet",
+                            changed_since: str = None, row_group_rows: int = EXPORT_ROW_GROUP_ROWS,
+                            page_size: int = MAX_PAGE_SIZE) -> dict:
+    """
+    Write the collection's documents (those updated after changed_since, if
+    given) to one file under directory/collection. Returns its manifest
+    entry; a run that finds no documents writes no file.
+    """
+    pa = require_pyarrow()
+    columns = export_columns(EXPORT_MODELS[collection])
+    schema = arrow_schema(columns)
+    relative_path = os.path.join(collection, f"{collection}-{run_id}{EXPORT_FORMATS[format]}")
+    path = os.path.join(directory, relative_path)
+    # Written under a temporary name and renamed once complete
+    partial = path + ".partial"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    buffer = ColumnBuffer(columns)
+    writer, rows = None, 0
+
+    def flush():
+        nonlocal writer, rows
+        if writer is None:
+            writer = _open_writer(pa, partial, schema, format)
+        rows += buffer.rows
+        writer.write_table(pa.Table.from_pydict(buffer.take(), schema=schema))
+
+    try:
+        async for page in db.iter_document_pages(collection, changed_since, page_size):
+            for doc_id, data in page:
+                buffer.add(doc_id, data)
+            if buffer.rows >= row_group_rows:
+                flush()
+        if buffer.rows:
+            flush()
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(partial, path)
+    finally:
+        if writer is not None:
+            writer.close()
+            os.remove(partial)
+
+    entry = {
+        "collection": collection,
+        "mode": "incremental" if changed_since else "full",
+        "changed_since": changed_since,
+        "rows": rows,
+        "invalid_values": dict(buffer.invalid),
+        "schema_fingerprint": schema_fingerprint(columns),
+        "path": None,
+        "bytes": 0,
+        "sha256": None
+    }
+    if rows:
+        entry.update(path=relative_path, bytes=os.path.getsize(path), sha256=file_sha256(path))
+    return entry
+
+async def export_collections(db, directory: str, collections: list = None, format: str = "parquet",
+                             full: bool = False, row_group_rows: int = EXPORT_ROW_GROUP_ROWS) -> dict:
+    """
+    Export each collection, incrementally from its last high-water mark
+    unless full is set or it has none. The manifest is saved after every
+    collection, so an interrupted run keeps the ones it finished. Returns the
+    run's manifest entry.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {format}")
+    collections = collections or list(EXPORT_MODELS)
+    unknown = [collection for collection in collections if collection not in EXPORT_MODELS]
+    if unknown:
+        raise ValueError(f"No export schema for: {', '.join(unknown)}")
+    require_pyarrow()
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    started = datetime.now(timezone.utc)
+    high_water_mark = format_timestamp(started - timedelta(seconds=EXPORT_OVERLAP_SECONDS))
+    run = {
+        "run_id": started.strftime("%Y%m%dT%H%M%S%fZ"),
+        "started_at": format_timestamp(started),
+        "format": format,
+        "status": "running",
+        "files": []
+    }
+    manifest["runs"].append(run)
+
+    for collection in collections:
+        state = manifest["collections"].get(collection) or {}
+        fingerprint = schema_fingerprint(export_columns(EXPORT_MODELS[collection]))
+        incremental = not full and state.get("high_water_mark") and state.get("schema_fingerprint") == fingerprint
+        entry = await export_collection(
+            db, collection, directory, run["run_id"], format,
+            changed_since=state["high_water_mark"] if incremental else None, row_group_rows=row_group_rows
+        )
+        entry["high_water_mark"] = high_water_mark
+        run["files"].append(entry)
+        manifest["collections"][collection] = {"high_water_mark": high_water_mark, "schema_fingerprint": fingerprint}
+        save_manifest(directory, manifest)
+
+    run["status"] = "completed"
+    run["finished_at"] = format_timestamp(datetime.now(timezone.utc))
+    save_manifest(directory, manifest)
+    return run
+
+def verify_manifest(directory: str) -> list:
+    """
+    Problems found re-checking every file in the manifest against its
+    recorded size and checksum; empty if all match.
+    """
+    problems = []
+    for run in load_manifest(directory)["runs"]:
+        for entry in run["files"]:
+            if not entry["path"]:
+                continue
+            path = os.path.join(directory, entry["path"])
+            if not os.path.exists(path):
+                problems.append(f"{entry['path']}: missing")
+            elif os.path.getsize(path) != entry["bytes"]:
+                problems.append(f"{entry['path']}: {os.path.getsize(path)} bytes, expected {entry['bytes']}")
+            elif file_sha256(path) != entry["sha256"]:
+                problems.append(f"{entry['path']}: checksum mismatch")
+    return problems
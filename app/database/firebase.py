@@ -1,13 +1,130 @@
 from firebase_admin import firestore, auth
 from fastapi import HTTPException
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from app.models.schemas import PageRequest
+from app.models.enums import TreatmentStatus
+from app.database.pagination import DOCUMENT_ID, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, parse_order_by, encode_cursor, decode_cursor
+from app.database.local_backend import LocalClient
+from app.database.unit_of_work import MISSING, current_unit_of_work
+from app.database.request_cost import current_request_cost
+from app.core.single_flight import SingleFlight
+from app.database.versioning import UPDATED_AT, now_timestamp, stamped, changed_after
+from app.database.aggregates import (
+    RELATIONS_COLLECTION, DISEASE_COUNTS_COLLECTION, SCANS_COLLECTION, PATIENTS_COLLECTION, PATIENT_STATUS_COLLECTION,
+    disease_count_deltas, read_disease_counts, write_disease_counts,
+    patient_status_summary, read_patient_status, write_patient_status
+)
+from app.core.metrics import Counter, Histogram
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+# Documents pulled from a Firestore stream per worker-thread hop
+STREAM_CHUNK_SIZE = 100
+# Radiologist leases on unverified scans, one document per scan ID
+SCAN_LEASES_COLLECTION = "xray_scan_leases"
+# Limits of the Admin SDK's batch auth calls and of a Firestore batched write
+AUTH_IMPORT_BATCH_SIZE = 1000
+AUTH_LOOKUP_BATCH_SIZE = 100
+WRITE_BATCH_SIZE = 500
+# PBKDF2-SHA256 rounds for passwords imported in bulk (Firebase accepts up to 120000)
+PASSWORD_HASH_ROUNDS = int(os.getenv("XSPAND_PASSWORD_HASH_ROUNDS", "100000"))
+# Threads hashing those passwords, kept off the threadpool Firestore reads run on
+PASSWORD_HASH_WORKERS = int(os.getenv("XSPAND_PASSWORD_HASH_WORKERS", "2"))
+# Progress of bulk imports, one document per import ID
+IMPORTS_COLLECTION = "bulk_imports"
+
+# operation: get, get_all, all, page, find, stream (reads), set, update, delete, transaction, batch (writes)
+OPERATION_SECONDS = Histogram(
+    "xspand_firestore_operation_seconds", "Firestore round-trip latency by collection and operation",
+    ["collection", "operation"]
+)
+DOCUMENTS_READ = Counter("xspand_firestore_documents_read_total", "Documents returned by Firestore reads", ["collection"])
+OPERATION_ERRORS = Counter("xspand_firestore_operation_errors_total", "Failed Firestore operations", ["collection", "operation"])
+
+class _CountingTransaction:
+    """
+    Forwards to a transaction, counting the documents the callback writes.
+    """
+    def __init__(self, transaction):
+        self._transaction = transaction
+        self.writes = 0
+
+    def create(self, *args, **kwargs):
+        self.writes += 1
+        return self._transaction.create(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self.writes += 1
+        return self._transaction.set(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self.writes += 1
+        return self._transaction.update(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.writes += 1
+        return self._transaction.delete(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
 
 class FirebaseDB:
-    def __init__(self):
-        self.db = firestore.client()
+    """
+    Async facade over the Firestore client. Blocking client calls run in the
+    worker thread pool so independent reads can be awaited concurrently.
+    """
+    # Number of open Firestore clients (and therefore gRPC channels) in this process
+    _open_channels = 0
+    _channels_lock = threading.Lock()
+
+    def __init__(self, client=None, auth_client=None):
+        # Firestore and firebase_admin.auth unless a local stand-in is given
+        self.db = client if client is not None else firestore.client()
+        self.auth = auth_client if auth_client is not None else auth
+        self.closed = False
+        # Optional ReferenceCache serving small reference collections from memory
+        self.reference_cache = None
+        # Concurrent identical reads share one round trip
+        self.single_flight = SingleFlight("firestore")
+        # Bumped by every write to a collection; part of the flight key, so
+        # reads issued after a write never join a flight that began before it
+        self._write_generations = {}
+        # Called with the collection name after every write from this process
+        self.write_listeners = []
+        # Bulk registration hashes passwords here, so it can't stall the CRUD routes
+        self.hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+        with FirebaseDB._channels_lock:
+            FirebaseDB._open_channels += 1
+
+    @classmethod
+    def open_channel_count(cls) -> int:
+        return cls._open_channels
+
+    def close(self):
+        """
+        Close the underlying gRPC channel. Safe to call more than once.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.hash_executor.shutdown(wait=False, cancel_futures=True)
+        if isinstance(self.db, LocalClient):
+            self.db.close()
+        else:
+            api = getattr(self.db, "_firestore_api_internal", None)
+            if api is not None:
+                api.transport.close()
+        with FirebaseDB._channels_lock:
+            FirebaseDB._open_channels -= 1
 
     async def create_user_auth(self, email: str, password: str) -> str:
         try:
-            user_record = auth.create_user(
+            user_record = await run_in_threadpool(
+                self.auth.create_user,
                 email=email,
                 password=password
             )
@@ -17,62 +134,896 @@ class FirebaseDB:
 
     async def delete_user_auth(self, user_id: str):
         try:
-            auth.delete_user(user_id)
+            await run_in_threadpool(self.auth.delete_user, user_id)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def find_auth_emails(self, emails: list) -> set:
+        """
+        The given emails (lowercased) that already have a Firebase Auth
+        account, looked up AUTH_LOOKUP_BATCH_SIZE per call, concurrently.
+        """
+        identifiers = []
+        for email in emails:
+            try:
+                identifiers.append(auth.EmailIdentifier(email))
+            except ValueError:
+                # Malformed, so it can't be registered either; import_auth_users reports it
+                pass
+        chunks = [
+            identifiers[start:start + AUTH_LOOKUP_BATCH_SIZE]
+            for start in range(0, len(identifiers), AUTH_LOOKUP_BATCH_SIZE)
+        ]
+        try:
+            results = await asyncio.gather(*(run_in_threadpool(self.auth.get_users, chunk) for chunk in chunks))
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
+        return {user.email.lower() for result in results for user in result.users if user.email}
+
+    async def import_auth_users(self, accounts: list) -> list:
+        """
+        Create Firebase Auth accounts with auth.import_users,
+        AUTH_IMPORT_BATCH_SIZE per call. accounts are dicts with uid, email,
+        display_name and an optional password, which is hashed here
+        (PBKDF2-SHA256, random salt per user) as import_users requires.
+        Emails are not checked for uniqueness. Returns (index, reason) for
+        each account that was not created.
+        """
+        hash_alg = auth.UserImportHash.pbkdf2_sha256(rounds=PASSWORD_HASH_ROUNDS)
+        failures = []
+        for start in range(0, len(accounts), AUTH_IMPORT_BATCH_SIZE):
+            chunk = accounts[start:start + AUTH_IMPORT_BATCH_SIZE]
+            # Hashing is CPU-bound but releases the GIL, so the chunk is hashed on the hash threads in parallel
+            loop = asyncio.get_running_loop()
+            records = await asyncio.gather(
+                *(loop.run_in_executor(self.hash_executor, self._import_record, account) for account in chunk),
+                return_exceptions=True
+            )
+            indices, valid = [], []
+            for offset, record in enumerate(records):
+                if isinstance(record, Exception):
+                    failures.append((start + offset, str(record)))
+                else:
+                    indices.append(start + offset)
+                    valid.append(record)
+            if not valid:
+                continue
+            try:
+                result = await run_in_threadpool(self.auth.import_users, valid, hash_alg=hash_alg)
+            except Exception as e:
+                failures.extend((index, str(e)) for index in indices)
+                continue
+            failures.extend((indices[error.index], error.reason) for error in result.errors)
+        return failures
+
+    @staticmethod
+    def _import_record(account: dict):
+        password_hash = password_salt = None
+        if account.get("password"):
+            password_salt = os.urandom(16)
+            password_hash = hashlib.pbkdf2_hmac("sha256", account["password"].encode(), password_salt, PASSWORD_HASH_ROUNDS)
+        return auth.ImportUserRecord(
+            uid=account["uid"], email=account.get("email"), display_name=account.get("display_name"),
+            password_hash=password_hash, password_salt=password_salt
+        )
+
+    async def delete_auth_users(self, uids: list):
+        try:
+            for start in range(0, len(uids), AUTH_IMPORT_BATCH_SIZE):
+                await run_in_threadpool(self.auth.delete_users, uids[start:start + AUTH_IMPORT_BATCH_SIZE])
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    def batch(self):
+        return self.db.batch()
+
+    async def create_documents(self, writes: list) -> list:
+        """
+        Write [(collection, doc_id, data)] in batched commits of
+        WRITE_BATCH_SIZE. A failed batch doesn't stop the others; returns
+        (index, reason) for each write that was not saved.
+        """
+        await self.flush_unit_of_work()
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.invalidate()
+            unit.writes += 1
+        failures = []
+        for start in range(0, len(writes), WRITE_BATCH_SIZE):
+            chunk = [(collection, doc_id, stamped(data)) for collection, doc_id, data in writes[start:start + WRITE_BATCH_SIZE]]
+            batch = self.batch()
+            for collection, doc_id, data in chunk:
+                batch.set(self.db.collection(collection).document(doc_id), data)
+            try:
+                await self._timed(chunk[0][0], "batch", run_in_threadpool(batch.commit), written=len(chunk))
+            except Exception as e:
+                failures.extend((start + offset, str(e)) for offset in range(len(chunk)))
+                continue
+            for collection, doc_id, data in chunk:
+                self._cache_write(collection, doc_id, data)
+        return failures
+
+    async def run_transaction(self, callback, touches=()):
+        """
+        Run callback(transaction) in a transaction and return its result.
+        Firestore retries the callback on contention, so it must not have
+        side effects outside the transaction. touches names the collections
+        the callback may write, for the write listeners.
+        """
+        # The transaction must see this request's pending writes, and may change memoised documents
+        await self.flush_unit_of_work()
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.invalidate()
+            unit.writes += 1
+        cost = current_request_cost()
+        if cost is not None:
+            # Only the attempt that committed counts; earlier ones were retried
+            callback = self._counting_writes(callback, cost)
+        try:
+            collection = touches[0] if touches else "-"
+            if isinstance(self.db, LocalClient):
+                result = await self._timed(collection, "transaction", run_in_threadpool(self.db.run_transaction, callback))
+            else:
+                result = await self._timed(
+                    collection, "transaction", run_in_threadpool(firestore.transactional(callback), self.db.transaction())
+                )
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if cost is not None:
+            cost.record_write(callback.writes)
+        for collection in touches:
+            self._notify_write(collection)
+        return result
+
+    @staticmethod
+    def _counting_writes(callback, cost):
+        def counted(transaction):
+            counting = _CountingTransaction(transaction)
+            result = callback(counting)
+            counted.writes = counting.writes
+            return result
+        counted.writes = 0
+        return counted
 
     async def create_document(self, collection: str, doc_id: str, data: dict):
+        data = stamped(data)
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.stage(collection, doc_id, data)
+            return
         try:
-            self.db.collection(collection).document(doc_id).set(data)
+            await self._timed(
+                collection, "set", run_in_threadpool(self.db.collection(collection).document(doc_id).set, data), written=1
+            )
+            self._cache_write(collection, doc_id, data)
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
     async def update_document(self, collection: str, doc_id: str, data: dict):
         try:
+            unit = current_unit_of_work()
+            if unit is not None:
+                current_data = await self._read_through(unit, collection, doc_id)
+                if current_data is None:
+                    raise HTTPException(status_code=404, detail=f"Document not found in {collection}")
+                current_data.update(data)
+                unit.stage(collection, doc_id, stamped(current_data))
+                return
             doc_ref = self.db.collection(collection).document(doc_id)
-            current_data = doc_ref.get().to_dict()
+            current_data = await self._timed(collection, "get", run_in_threadpool(lambda: doc_ref.get().to_dict()))
             if not current_data:
                 raise HTTPException(status_code=404, detail=f"Document not found in {collection}")
             current_data.update(data)
-            doc_ref.set(current_data)
+            current_data = stamped(current_data)
+            await self._timed(collection, "update", run_in_threadpool(doc_ref.set, current_data), written=1)
+            self._cache_write(collection, doc_id, current_data)
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
     async def delete_document(self, collection: str, doc_id: str):
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.stage(collection, doc_id, None)
+            return
+        try:
+            await self._timed(
+                collection, "delete", run_in_threadpool(self.db.collection(collection).document(doc_id).delete), written=1
+            )
+            self._cache_write(collection, doc_id, None)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def get_all_documents(self, collection: str, fields: list = None, changed_since: str = None) -> list:
+        """
+        Every document of a collection, or only those updated after
+        changed_since (a timestamp in the updated_at format).
+        """
+        await self.flush_unit_of_work()
         try:
-            self.db.collection(collection).document(doc_id).delete()
+            self._count_read(collection)
+            if self._cached(collection):
+                return [
+                    self._project(doc, fields) for doc in self.reference_cache.all(collection)
+                    if not changed_since or changed_after(doc, changed_since)
+                ]
+            query = self._changes_query(collection, changed_since)
+            if fields:
+                query = query.select(fields)
+            return await self._read(
+                ("all", collection, tuple(fields or ()), changed_since),
+                lambda: [doc.to_dict() for doc in query.stream()]
+            )
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
-    async def get_all_documents(self, collection: str) -> list:
+    async def stream_documents(self, collection: str, fields: list = None, changed_since: str = None):
+        """
+        Yield documents as the Firestore stream produces them. Chunks are pulled
+        from the stream only when the consumer asks for more, so memory stays
+        bounded by STREAM_CHUNK_SIZE however large the collection is.
+        """
+        await self.flush_unit_of_work()
+        self._count_read(collection)
+        if self._cached(collection):
+            for doc in self.reference_cache.all(collection):
+                if not changed_since or changed_after(doc, changed_since):
+                    yield self._project(doc, fields)
+            return
+        query = self._changes_query(collection, changed_since)
+        if fields:
+            query = query.select(fields)
+        # Time spent waiting on Firestore, not on the consumer
+        waited, count = 0.0, 0
+        started = time.perf_counter()
         try:
-            docs = self.db.collection(collection).stream()
-            return [doc.to_dict() for doc in docs]
+            async for chunk in iterate_in_threadpool(self._chunked(query.stream())):
+                waited += time.perf_counter() - started
+                count += len(chunk)
+                for doc in chunk:
+                    yield doc.to_dict()
+                started = time.perf_counter()
+            waited += time.perf_counter() - started
+        finally:
+            OPERATION_SECONDS.labels(collection, "stream").observe(waited)
+            DOCUMENTS_READ.labels(collection).inc(count)
+            cost = current_request_cost()
+            if cost is not None:
+                cost.record_query(("stream", collection))
+                cost.record_stream(count)
+
+    @staticmethod
+    def _chunked(iterator):
+        chunk = []
+        for item in iterator:
+            chunk.append(item)
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def list_documents(self, collection: str, page: PageRequest = None):
+        """
+        Return (documents, next_cursor) for one page of a collection, ordered by
+        page.order_by with the document ID as tie-breaker. Unpaginated requests
+        return the whole collection and a None cursor. With changed_since only
+        documents updated after it are returned, ordered by updated_at.
+        """
+        if page is None or not page.paginated:
+            documents = await self.get_all_documents(
+                collection, page.fields if page else None, page.changed_since if page else None
+            )
+            return documents, None
+        await self.flush_unit_of_work()
+        try:
+            self._count_read(collection)
+            order_by = page.order_by or (UPDATED_AT if page.changed_since else None)
+            field, direction = parse_order_by(order_by)
+            if page.changed_since and field != UPDATED_AT:
+                # Firestore needs the range-filtered field to be ordered first
+                raise HTTPException(status_code=400, detail="changed_since can only be combined with order_by=updated_at")
+            page_size = page.page_size or DEFAULT_PAGE_SIZE
+            query = self._changes_query(collection, page.changed_since)
+            if field != DOCUMENT_ID:
+                query = query.order_by(field, direction=direction)
+            query = query.order_by(DOCUMENT_ID, direction=direction)
+            if page.cursor:
+                query = query.start_after(decode_cursor(page.cursor, order_by))
+            if page.fields:
+                # The ordering field is needed to build the next cursor
+                selected = list(page.fields)
+                if field != DOCUMENT_ID and field not in selected:
+                    selected.append(field)
+                query = query.select(selected)
+
+            # Fetch one extra document to know whether another page exists
+            docs = await self._read(
+                ("page", collection, order_by, page.cursor, page_size, tuple(page.fields or ()), page.changed_since),
+                lambda: [(doc.id, doc.to_dict()) for doc in query.limit(page_size + 1).stream()]
+            )
+            next_cursor = None
+            if len(docs) > page_size:
+                docs = docs[:page_size]
+                last_id, last = docs[-1]
+                value = None if field == DOCUMENT_ID else self._field_value(last, field)
+                next_cursor = encode_cursor(order_by, value, last_id)
+            return [self._project(data, page.fields) for _, data in docs], next_cursor
+        except HTTPException as e:
+            raise e
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
+    async def iter_document_pages(self, collection: str, changed_since: str = None, page_size: int = MAX_PAGE_SIZE):
+        """
+        Yield a whole collection as pages of [(doc_id, data)], ordered by
+        updated_at when changed_since is given and by document ID otherwise.
+        Each page is its own query resuming after the previous one, so no
+        Firestore stream is held open while the consumer works.
+        """
+        field, _ = parse_order_by(UPDATED_AT if changed_since else None)
+        after = None
+        while True:
+            query = self._changes_query(collection, changed_since)
+            if field != DOCUMENT_ID:
+                query = query.order_by(field)
+            query = query.order_by(DOCUMENT_ID)
+            if after is not None:
+                query = query.start_after(after)
+            try:
+                docs = await self._timed(collection, "page", run_in_threadpool(
+                    lambda query=query: [(doc.id, doc.to_dict()) for doc in query.limit(page_size).stream()]
+                ))
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if docs:
+                yield docs
+            if len(docs) < page_size:
+                return
+            last_id, last = docs[-1]
+            after = [last_id] if field == DOCUMENT_ID else [self._field_value(last, field), last_id]
+
     async def get_document(self, collection: str, doc_id: str) -> dict:
         try:
-            doc = self.db.collection(collection).document(doc_id).get()
-            if not doc.exists:
+            unit = current_unit_of_work()
+            if unit is not None:
+                data = await self._read_through(unit, collection, doc_id)
+                if data is None:
+                    raise HTTPException(status_code=404, detail=f"Document not found in {collection}")
+                return data
+            if self._cached(collection):
+                cached = self.reference_cache.get(collection, doc_id)
+                if cached is not None:
+                    return cached
+            data = await self._fetch_document(collection, doc_id)
+            if data is None:
                 raise HTTPException(status_code=404, detail=f"Document not found in {collection}")
-            return doc.to_dict()
+            return data
         except HTTPException as e:
             raise e
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
 
+    async def find_documents(self, collection: str, field: str, value) -> list:
+        await self.flush_unit_of_work()
+        try:
+            self._count_read(collection)
+            if self._cached(collection):
+                return self.reference_cache.find(collection, field, value)
+            query = self.db.collection(collection).where(field, "==", value)
+            return await self._read(
+                ("find", collection, field, repr(value)),
+                lambda: [doc.to_dict() for doc in query.stream()]
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def set_relation(self, relation_id: str, data: dict) -> dict:
+        """
+        Create or replace a doctor-patient relation, keeping the disease
+        patient counters in step within the same transaction.
+        """
+        return await self._write_relation(relation_id, lambda before: data)
+
+    async def update_relation(self, relation_id: str, data: dict) -> dict:
+        """
+        Merge data into an existing relation and return the updated relation.
+        """
+        def merge(before):
+            if before is None:
+                raise HTTPException(status_code=404, detail=f"Document not found in {RELATIONS_COLLECTION}")
+            after = dict(before)
+            after.update(data)
+            return after
+        return await self._write_relation(relation_id, merge)
+
+    async def delete_relation(self, relation_id: str):
+        await self._write_relation(relation_id, lambda before: None)
+
+    async def _write_relation(self, relation_id: str, change):
+        def write(transaction):
+            reference = self.db.collection(RELATIONS_COLLECTION).document(relation_id)
+            before = reference.get(transaction=transaction).to_dict()
+            after = change(before)
+            if after is not None:
+                after = stamped(after)
+            deltas = disease_count_deltas(before, after)
+            counts = read_disease_counts(self.db, transaction, deltas)
+            if after is not None:
+                transaction.set(reference, after)
+            elif before is not None:
+                transaction.delete(reference)
+            write_disease_counts(self.db, transaction, counts, deltas)
+            return after
+        return await self.run_transaction(write, touches=(RELATIONS_COLLECTION, DISEASE_COUNTS_COLLECTION))
+
+    async def create_patient(self, patient_id: str, data: dict):
+        """
+        Create a patient together with an empty scan status summary, unless
+        scans already recorded for this patient ID have created one.
+        """
+        def write(transaction):
+            status_reference = self.db.collection(PATIENT_STATUS_COLLECTION).document(patient_id)
+            has_status = status_reference.get(transaction=transaction).exists
+            transaction.set(self.db.collection(PATIENTS_COLLECTION).document(patient_id), stamped(data))
+            if not has_status:
+                transaction.set(status_reference, stamped(patient_status_summary(patient_id, 0, 0)))
+        await self.run_transaction(write, touches=(PATIENTS_COLLECTION, PATIENT_STATUS_COLLECTION))
+
+    async def get_documents(self, collection: str, doc_ids) -> dict:
+        """
+        Read several documents in one get_all round trip: {doc_id: data or
+        None}. Reference collections are served from the cache when it has them.
+        """
+        await self.flush_unit_of_work()
+        documents, missing = {}, []
+        for doc_id in dict.fromkeys(doc_ids):
+            cached = self.reference_cache.get(collection, doc_id) if self._cached(collection) else None
+            if cached is not None:
+                documents[doc_id] = cached
+            else:
+                missing.append(doc_id)
+        if not missing:
+            return documents
+        references = [self.db.collection(collection).document(doc_id) for doc_id in missing]
+        try:
+            fetched = await self._timed(collection, "get_all", run_in_threadpool(lambda: {
+                snapshot.id: snapshot.to_dict() if snapshot.exists else None
+                for snapshot in self.db.get_all(references)
+            }))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        documents.update(fetched)
+        return documents
+
+    async def create_patients(self, registrations: list):
+        """
+        Create patients with their relations in one batch (at most 500
+        writes). Each registration is (patient_id, patient, relation_id,
+        relation, create_status); create_status adds the empty scan status
+        summary. Relations must not carry a diagnosis, as the disease
+        counters are not updated here.
+        """
+        await self.flush_unit_of_work()
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.invalidate()
+            unit.writes += 1
+        writes = []
+        for patient_id, patient, relation_id, relation, create_status in registrations:
+            writes.append((PATIENTS_COLLECTION, patient_id, stamped(patient)))
+            if create_status:
+                writes.append((PATIENT_STATUS_COLLECTION, patient_id, stamped(patient_status_summary(patient_id, 0, 0))))
+            writes.append((RELATIONS_COLLECTION, relation_id, stamped(relation)))
+        batch = self.batch()
+        for collection, doc_id, data in writes:
+            batch.set(self.db.collection(collection).document(doc_id), data)
+        try:
+            await self._timed(PATIENTS_COLLECTION, "batch", run_in_threadpool(batch.commit), written=len(writes))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        for collection, doc_id, data in writes:
+            self._cache_write(collection, doc_id, data)
+
+    async def get_import_progress(self, import_id: str):
+        """
+        The saved progress of a bulk import, None if it never started.
+        """
+        try:
+            return await self._fetch_document(IMPORTS_COLLECTION, import_id)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def save_import_progress(self, import_id: str, progress: dict):
+        """
+        Checkpoint a bulk import. Written straight away, not at the end of
+        the request, so an interrupted import can resume from it.
+        """
+        data = stamped(progress)
+        reference = self.db.collection(IMPORTS_COLLECTION).document(import_id)
+        try:
+            await self._timed(IMPORTS_COLLECTION, "set", run_in_threadpool(reference.set, data), written=1)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        self._notify_write(IMPORTS_COLLECTION)
+
+    async def delete_patient(self, patient_id: str):
+        await self.flush_unit_of_work()
+        unit = current_unit_of_work()
+        if unit is not None:
+            unit.remember(PATIENTS_COLLECTION, patient_id, None)
+            unit.remember(PATIENT_STATUS_COLLECTION, patient_id, None)
+            unit.writes += 1
+        batch = self.batch()
+        batch.delete(self.db.collection(PATIENTS_COLLECTION).document(patient_id))
+        batch.delete(self.db.collection(PATIENT_STATUS_COLLECTION).document(patient_id))
+        try:
+            await self._timed(PATIENTS_COLLECTION, "batch", run_in_threadpool(batch.commit), written=2)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        self._notify_write(PATIENTS_COLLECTION)
+        self._notify_write(PATIENT_STATUS_COLLECTION)
+
+    async def create_scan(self, scan_id: str, data: dict) -> dict:
+        """
+        Write an X-ray scan and refresh its patient's status summary in the
+        same transaction.
+        """
+        return await self._write_scan(scan_id, lambda before: data)
+
+    async def update_scan(self, scan_id: str, data: dict) -> dict:
+        """
+        Merge data into a scan. An approval (radiologist_id or ai_approved
+        set) is refused with 409 while another radiologist leases the scan,
+        and releases the lease in the same transaction.
+        """
+        def merge(before):
+            if before is None:
+                raise HTTPException(status_code=404, detail=f"Document not found in {SCANS_COLLECTION}")
+            after = dict(before)
+            after.update(data)
+            return after
+        return await self._write_scan(scan_id, merge, approval=self._is_approval(data), approver=data.get("radiologist_id"))
+
+    async def delete_scan(self, scan_id: str) -> dict:
+        """
+        Delete a scan and return it as it was (None if it didn't exist).
+        """
+        return await self._write_scan(scan_id, lambda before: None, return_previous=True)
+
+    async def _write_scan(self, scan_id: str, change, return_previous: bool = False, approval: bool = False, approver: str = None):
+        def write(transaction):
+            reference = self.db.collection(SCANS_COLLECTION).document(scan_id)
+            lease_reference = self.db.collection(SCAN_LEASES_COLLECTION).document(scan_id)
+            if approval:
+                # The lease is read with the scan, so the check and the approval commit together
+                documents = {
+                    snapshot.reference.path: snapshot.to_dict() if snapshot.exists else None
+                    for snapshot in self.db.get_all([reference, lease_reference], transaction=transaction)
+                }
+                before, lease = documents[reference.path], documents[lease_reference.path]
+                self._check_scan_lease(scan_id, lease, approver)
+            else:
+                before, lease = reference.get(transaction=transaction).to_dict(), None
+            after = change(before)
+            if after is not None:
+                after = stamped(after)
+            summaries = read_patient_status(self.db, transaction, scan_id, before, after)
+            if after is not None:
+                transaction.set(reference, after)
+            elif before is not None:
+                transaction.delete(reference)
+            if lease is not None:
+                transaction.delete(lease_reference)
+            write_patient_status(self.db, transaction, summaries)
+            return before if return_previous else after
+        touches = (SCANS_COLLECTION, PATIENT_STATUS_COLLECTION) + ((SCAN_LEASES_COLLECTION,) if approval else ())
+        return await self.run_transaction(write, touches=touches)
+
+    @staticmethod
+    def _is_approval(data: dict) -> bool:
+        return bool(data.get("radiologist_id") or data.get("ai_approved"))
+
+    @staticmethod
+    def _check_scan_lease(scan_id: str, lease: dict, radiologist_id: str):
+        """
+        409 if a radiologist other than radiologist_id holds an unexpired lease on the scan.
+        """
+        if lease and lease.get("expires_at", "") > now_timestamp() and lease.get("radiologist_id") != radiologist_id:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Scan {scan_id} is leased to radiologist {lease.get('radiologist_id')} until {lease['expires_at']}"
+            )
+
+    async def update_scan_diagnosis(self, scan_id: str, data: dict) -> dict:
+        """
+        Apply a diagnosis (data carries disease_id) to a scan in one
+        transaction: the scan, its doctor-patient relation when treatment is
+        ongoing, the disease counters and the patient status summary. The
+        relation, status, counter and lease documents are read in a single
+        get_all. Approvals are refused and leases released as in update_scan.
+        """
+        disease_id = data["disease_id"]
+        approval = self._is_approval(data)
+
+        def write(transaction):
+            scan_reference = self.db.collection(SCANS_COLLECTION).document(scan_id)
+            scan = scan_reference.get(transaction=transaction).to_dict()
+            if scan is None:
+                raise HTTPException(status_code=404, detail=f"Document not found in {SCANS_COLLECTION}")
+            updated_scan = dict(scan)
+            updated_scan.update(data)
+            updated_scan = stamped(updated_scan)
+
+            relation_reference = self.db.collection(RELATIONS_COLLECTION).document(
+                f"{scan['doctor_id']}_{scan['patient_id']}"
+            )
+            status_reference = self.db.collection(PATIENT_STATUS_COLLECTION).document(scan["patient_id"])
+            counter_reference = self.db.collection(DISEASE_COUNTS_COLLECTION).document(disease_id)
+            lease_reference = self.db.collection(SCAN_LEASES_COLLECTION).document(scan_id)
+            documents = {
+                snapshot.reference.path: snapshot.to_dict() if snapshot.exists else None
+                for snapshot in self.db.get_all(
+                    [relation_reference, status_reference, counter_reference, lease_reference], transaction=transaction
+                )
+            }
+            lease = documents[lease_reference.path] if approval else None
+            if approval:
+                self._check_scan_lease(scan_id, lease, data.get("radiologist_id"))
+
+            relation = documents[relation_reference.path]
+            if relation is None:
+                raise HTTPException(status_code=404, detail=f"Document not found in {RELATIONS_COLLECTION}")
+            updated_relation = relation
+            if relation.get("treatment_status") == TreatmentStatus.ongoing:
+                updated_relation = stamped(relation)
+                updated_relation.update({"diagnosed_disease_id": disease_id, "diagnosed_with_disease": True})
+
+            # Reads must all happen before the first write
+            deltas = disease_count_deltas(relation, updated_relation)
+            counts = read_disease_counts(self.db, transaction, deltas, {disease_id: documents[counter_reference.path]})
+            summaries = read_patient_status(
+                self.db, transaction, scan_id, scan, updated_scan,
+                {scan["patient_id"]: documents[status_reference.path]}
+            )
+
+            transaction.set(scan_reference, updated_scan)
+            if updated_relation is not relation:
+                transaction.set(relation_reference, updated_relation)
+            write_disease_counts(self.db, transaction, counts, deltas)
+            write_patient_status(self.db, transaction, summaries)
+            if lease is not None:
+                transaction.delete(lease_reference)
+            return updated_scan
+        return await self.run_transaction(write, touches=(
+            SCANS_COLLECTION, RELATIONS_COLLECTION, DISEASE_COUNTS_COLLECTION, PATIENT_STATUS_COLLECTION, SCAN_LEASES_COLLECTION
+        ))
+
+    async def acquire_scan_lease(self, scan_ids: list, radiologist_id: str, expires_at: str, now: str) -> dict:
+        """
+        Lease the first available of scan_ids to a radiologist until
+        expires_at, reading every candidate scan and lease in one get_all.
+        Returns {"scan_id", "lease", "scan"} for the granted scan (all None
+        if none was available) plus, for the candidates before it, "held":
+        {scan_id: lease} for those another radiologist's lease still covers
+        and "unavailable": [scan_id] for those gone or already verified.
+        """
+        def write(transaction):
+            scan_references = [self.db.collection(SCANS_COLLECTION).document(scan_id) for scan_id in scan_ids]
+            lease_references = [self.db.collection(SCAN_LEASES_COLLECTION).document(scan_id) for scan_id in scan_ids]
+            documents = {
+                snapshot.reference.path: snapshot.to_dict() if snapshot.exists else None
+                for snapshot in self.db.get_all(scan_references + lease_references, transaction=transaction)
+            }
+            result = {"scan_id": None, "lease": None, "scan": None, "held": {}, "unavailable": []}
+            for scan_id, scan_reference, lease_reference in zip(scan_ids, scan_references, lease_references):
+                scan, lease = documents[scan_reference.path], documents[lease_reference.path]
+                if scan is None or scan.get("radiologist_id"):
+                    result["unavailable"].append(scan_id)
+                elif lease and lease.get("expires_at", "") > now and lease.get("radiologist_id") != radiologist_id:
+                    result["held"][scan_id] = lease
+                else:
+                    lease = stamped({"scan_id": scan_id, "radiologist_id": radiologist_id, "claimed_at": now, "expires_at": expires_at})
+                    transaction.set(lease_reference, lease)
+                    result.update(scan_id=scan_id, lease=lease, scan=scan)
+                    break
+            return result
+        return await self.run_transaction(write, touches=(SCAN_LEASES_COLLECTION,))
+
+    async def renew_scan_lease(self, scan_id: str, radiologist_id: str, expires_at: str, now: str) -> dict:
+        """
+        Extend a running lease held by radiologist_id; 409 if it has expired
+        or belongs to someone else.
+        """
+        def write(transaction):
+            reference = self.db.collection(SCAN_LEASES_COLLECTION).document(scan_id)
+            lease = reference.get(transaction=transaction).to_dict()
+            if not lease or lease.get("radiologist_id") != radiologist_id or lease.get("expires_at", "") <= now:
+                raise HTTPException(status_code=409, detail=f"Radiologist {radiologist_id} holds no active lease on scan {scan_id}")
+            lease = stamped(dict(lease, expires_at=expires_at))
+            transaction.set(reference, lease)
+            return lease
+        return await self.run_transaction(write, touches=(SCAN_LEASES_COLLECTION,))
+
+    async def release_scan_lease(self, scan_id: str, radiologist_id: str = None):
+        """
+        Drop the lease on a scan; with radiologist_id only if they hold it.
+        """
+        def write(transaction):
+            reference = self.db.collection(SCAN_LEASES_COLLECTION).document(scan_id)
+            lease = reference.get(transaction=transaction).to_dict()
+            if lease is None:
+                return
+            if radiologist_id is not None and lease.get("radiologist_id") != radiologist_id:
+                raise HTTPException(status_code=409, detail=f"Scan {scan_id} is leased to another radiologist")
+            transaction.delete(reference)
+        await self.run_transaction(write, touches=(SCAN_LEASES_COLLECTION,))
+
+    async def delete_scan_leases(self, scan_ids: list):
+        """
+        Drop the leases of scans nobody can claim any more (verified or
+        deleted) in batched commits, whoever holds them.
+        """
+        scan_ids = list(scan_ids)
+        for start in range(0, len(scan_ids), WRITE_BATCH_SIZE):
+            chunk = scan_ids[start:start + WRITE_BATCH_SIZE]
+            batch = self.batch()
+            for scan_id in chunk:
+                batch.delete(self.db.collection(SCAN_LEASES_COLLECTION).document(scan_id))
+            await self._timed(SCAN_LEASES_COLLECTION, "batch", run_in_threadpool(batch.commit), written=len(chunk))
+        if scan_ids:
+            self._notify_write(SCAN_LEASES_COLLECTION)
+
     async def get_doctor_patient_relations(self, patient_id: str) -> list:
+        await self.flush_unit_of_work()
         try:
-            # Get all documents from doctor_patient_relations collection
-            docs = self.db.collection("doctor_patient_relations").stream()
-            # Filter for the specific patient_id
+            self._count_read(RELATIONS_COLLECTION)
+            # Only this patient's relations, filtered by Firestore
+            query = self.db.collection(RELATIONS_COLLECTION).where("patient_id", "==", patient_id)
+            docs = await self._read(
+                ("find", RELATIONS_COLLECTION, "patient_id", repr(patient_id)),
+                lambda: [(doc.id, doc.to_dict()) for doc in query.stream()]
+            )
             relations = []
-            for doc in docs:
-                data = doc.to_dict()
-                if data.get("patient_id") == patient_id:
-                    data["relation_id"] = doc.id  # Add the document ID
-                    relations.append(data)
+            for doc_id, data in docs:
+                data["relation_id"] = doc_id  # Add the document ID
+                relations.append(data)
             return relations
         except Exception as e:
             raise HTTPException(status_code=400, detail=str(e))
+
+    async def flush_unit_of_work(self):
+        """
+        Send the active unit of work's pending writes in one batch (Firestore
+        caps a batch at 500 writes, so larger flushes are split).
+        """
+        unit = current_unit_of_work()
+        if unit is None or not unit.has_pending():
+            return
+        pending = list(unit.take_pending().items())
+        try:
+            for start in range(0, len(pending), 500):
+                batch = self.batch()
+                chunk = pending[start:start + 500]
+                for (collection, doc_id), data in chunk:
+                    reference = self.db.collection(collection).document(doc_id)
+                    if data is None:
+                        batch.delete(reference)
+                    else:
+                        batch.set(reference, data)
+                await self._timed(chunk[0][0][0], "batch", run_in_threadpool(batch.commit), written=len(chunk))
+                unit.writes += 1
+        except Exception as e:
+            # Nothing memoised can be trusted once a flush fails part way
+            unit.invalidate()
+            for collection in {collection for collection, _ in dict(pending)}:
+                self._notify_write(collection)
+            raise HTTPException(status_code=400, detail=str(e))
+        for (collection, doc_id), data in pending:
+            self._cache_write(collection, doc_id, data)
+
+    async def _read_through(self, unit, collection: str, doc_id: str):
+        """
+        A copy of the document from the unit's identity map, reading it (and
+        remembering it) on first use. None if the document doesn't exist.
+        """
+        document = unit.lookup(collection, doc_id)
+        if document is None:
+            data = self.reference_cache.get(collection, doc_id) if self._cached(collection) else None
+            if data is None:
+                unit.reads += 1
+                data = await self._fetch_document(collection, doc_id)
+            # A concurrent fetch in the same request may have got there first
+            document = unit.peek(collection, doc_id)
+            if document is None:
+                unit.remember(collection, doc_id, data)
+                document = MISSING if data is None else data
+        return None if document is MISSING else dict(document)
+
+    def _changes_query(self, collection: str, changed_since: str = None):
+        query = self.db.collection(collection)
+        if changed_since:
+            query = query.where(UPDATED_AT, ">", changed_since)
+        return query
+
+    async def _fetch_document(self, collection: str, doc_id: str):
+        reference = self.db.collection(collection).document(doc_id)
+        return await self._read(("get", collection, doc_id), lambda: reference.get().to_dict())
+
+    async def _read(self, key, fn):
+        """
+        Run the blocking read fn in the thread pool, sharing the execution
+        with concurrent reads for the same key. fn must return plain data
+        (not snapshots) so the result can be handed to every caller.
+        """
+        # The query's shape leaves out the values, so repeats with different IDs match
+        shape = key[:3] if key[0] == "find" else key[:2]
+        flight_key = key + (self._write_generations.get(key[1], 0),)
+        return await self.single_flight.do(flight_key, lambda: self._timed(key[1], key[0], run_in_threadpool(fn), shape=shape))
+
+    @staticmethod
+    async def _timed(collection: str, operation: str, awaitable, written: int = 0, shape: tuple = None):
+        """
+        Await one Firestore round trip, recording its latency and, for
+        reads, the number of documents it returned. The request's cost is
+        charged the query and the documents read or written.
+        """
+        cost = current_request_cost()
+        if cost is not None:
+            cost.record_query(shape or (operation, collection))
+        started = time.perf_counter()
+        try:
+            result = await awaitable
+        except Exception:
+            OPERATION_ERRORS.labels(collection, operation).inc()
+            raise
+        finally:
+            OPERATION_SECONDS.labels(collection, operation).observe(time.perf_counter() - started)
+        if operation in ("get", "get_all", "all", "page", "find"):
+            if operation == "get_all":
+                # {doc_id: data or None}; missing documents aren't counted
+                documents = sum(1 for data in result.values() if data is not None)
+            else:
+                documents = len(result) if isinstance(result, list) else int(result is not None)
+            DOCUMENTS_READ.labels(collection).inc(documents)
+            if cost is not None:
+                cost.record_read(documents)
+        if written and cost is not None:
+            cost.record_write(written)
+        return result
+
+    @staticmethod
+    def _field_value(data: dict, field_path: str):
+        for part in field_path.split("."):
+            if not isinstance(data, dict):
+                return None
+            data = data.get(part)
+        return data
+
+    def _count_read(self, collection: str):
+        unit = current_unit_of_work()
+        if unit is not None and not self._cached(collection):
+            unit.reads += 1
+
+    @staticmethod
+    def _project(data: dict, fields: list = None) -> dict:
+        if not fields:
+            return data
+        # Nested paths ("a.b") come back from select() under their top-level key
+        top_level = {field.split(".")[0] for field in fields}
+        return {key: value for key, value in data.items() if key in top_level}
+
+    def _cached(self, collection: str) -> bool:
+        return self.reference_cache is not None and self.reference_cache.is_cached(collection)
+
+    def _cache_write(self, collection: str, doc_id: str, data):
+        if self.reference_cache is not None:
+            self.reference_cache.apply(collection, doc_id, data)
+        self._notify_write(collection)
+
+    def _notify_write(self, collection: str):
+        self._write_generations[collection] = self._write_generations.get(collection, 0) + 1
+        for listener in self.write_listeners:
+            listener(collection)
@@ -0,0 +1,723 @@
+"""
+Firestore-compatible storage that runs entirely in-process.
+
+LocalClient implements the subset of the google.cloud.firestore Client API
+that FirebaseDB and the services use (documents, where/order_by/limit/
+start_after/select queries, batches, transactions, get_all and collection
+on_snapshot listeners) on top of a MemoryStore or a SqliteStore. It lets
+the API run, be tested and be benchmarked without credentials or network.
+"""
+import copy
+import enum
+import functools
+import json
+import logging
+import secrets
+import sqlite3
+import string
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from google.api_core.exceptions import AlreadyExists, NotFound
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_ID = "__name__"
+_AUTO_ID_ALPHABET = string.ascii_letters + string.digits
+_AUTH_COLLECTION = "__auth_users__"
+
+def _auto_id() -> str:
+    return "".join(secrets.choice(_AUTO_ID_ALPHABET) for _ in range(20))
+
+def _auth_email(email):
+    # Firebase Auth stores and matches emails lowercased
+    return email.lower() if email else email
+
+def _get_field(data: dict, field_path: str):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(field_path)
+        value = value[part]
+    return value
+
+def _set_field(data: dict, field_path: str, value):
+    parts = field_path.split(".")
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    data[parts[-1]] = value
+
+def _project(data: dict, field_paths) -> dict:
+    projected = {}
+    for field_path in field_paths:
+        try:
+            _set_field(projected, field_path, copy.deepcopy(_get_field(data, field_path)))
+        except KeyError:
+            pass
+    return projected
+
+def _type_rank(value) -> int:
+    # Firestore orders values of different types by type first
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, list):
+        return 7
+    if isinstance(value, dict):
+        return 8
+    return 6
+
+def _compare(a, b) -> int:
+    rank_a, rank_b = _type_rank(a), _type_rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    try:
+        return (a > b) - (a < b)
+    except TypeError:
+        a, b = str(a), str(b)
+        return (a > b) - (a < b)
+
+def _matches(value, op: str, expected) -> bool:
+    if op == "==":
+        return value == expected
+    if op == "!=":
+        return value != expected
+    if op in ("<", "<=", ">", ">="):
+        if _type_rank(value) != _type_rank(expected):
+            return False
+        result = _compare(value, expected)
+        return {"<": result < 0, "<=": result <= 0, ">": result > 0, ">=": result >= 0}[op]
+    if op == "in":
+        return value in expected
+    if op == "not-in":
+        return value not in expected
+    if op == "array_contains":
+        return isinstance(value, list) and expected in value
+    if op == "array_contains_any":
+        return isinstance(value, list) and any(item in value for item in expected)
+    raise ValueError(f"Unsupported query operator: {op}")
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class MemoryStore:
+    """
+    Documents held in dictionaries. Stored dicts are never mutated in place,
+    so readers can share them until they call to_dict().
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._collections = {}
+
+    def get(self, collection: str, doc_id: str):
+        with self.lock:
+            return self._collections.get(collection, {}).get(doc_id)
+
+    def scan(self, collection: str, equals=()):
+        with self.lock:
+            return list(self._collections.get(collection, {}).items())
+
+    def apply(self, writes) -> list:
+        """
+        Apply [(collection, doc_id, data or None)] atomically; returns the
+        previous data of each document.
+        """
+        previous = []
+        with self.lock:
+            for collection, doc_id, data in writes:
+                docs = self._collections.setdefault(collection, {})
+                previous.append(docs.get(doc_id))
+                if data is None:
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = data
+        return previous
+
+    def close(self):
+        pass
+
+
+class SqliteStore:
+    """
+    Documents stored as JSON rows in a single SQLite table. Equality filters
+    on scalar fields are pushed down with json_extract.
+    """
+    def __init__(self, path: str):
+        self.lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "collection TEXT NOT NULL, doc_id TEXT NOT NULL, data TEXT NOT NULL, "
+            "PRIMARY KEY (collection, doc_id))"
+        )
+
+    @staticmethod
+    def _json_path(field_path: str) -> str:
+        return "$" + "".join('."' + part.replace('"', '\\"') + '"' for part in field_path.split("."))
+
+    def get(self, collection: str, doc_id: str):
+        with self.lock:
+            row = self._conn.execute(
+                "SELECT data FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def scan(self, collection: str, equals=()):
+        sql = "SELECT doc_id, data FROM documents WHERE collection = ?"
+        params = [collection]
+        for field_path, value in equals:
+            # bool and None don't round-trip through json_extract; those are filtered in Python
+            if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+                sql += " AND json_extract(data, ?) = ?"
+                params.extend([self._json_path(field_path), value])
+        with self.lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [(doc_id, json.loads(data)) for doc_id, data in rows]
+
+    def apply(self, writes) -> list:
+        previous = []
+        with self.lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for collection, doc_id, data in writes:
+                    row = self._conn.execute(
+                        "SELECT data FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+                    ).fetchone()
+                    previous.append(json.loads(row[0]) if row else None)
+                    if data is None:
+                        self._conn.execute(
+                            "DELETE FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+                        )
+                    else:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO documents (collection, doc_id, data) VALUES (?, ?, ?)",
+                            (collection, doc_id, json.dumps(data, default=_json_default))
+                        )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return previous
+
+    def close(self):
+        with self.lock:
+            self._conn.close()
+
+
+class ChangeType(enum.Enum):
+    ADDED = 1
+    REMOVED = 2
+    MODIFIED = 3
+
+DocumentChange = namedtuple("DocumentChange", ["type", "document", "old_index", "new_index"])
+UserRecord = namedtuple("UserRecord", ["uid", "email"])
+# Shaped like firebase_admin.auth's batch results
+BatchError = namedtuple("BatchError", ["index", "reason"])
+BatchResult = namedtuple("BatchResult", ["success_count", "failure_count", "errors"])
+GetUsersResult = namedtuple("GetUsersResult", ["users", "not_found"])
+
+
+class LocalDocumentSnapshot:
+    def __init__(self, reference, data, read_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.read_time = read_time
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self.exists else None
+
+    def get(self, field_path: str):
+        if field_path == DOCUMENT_ID:
+            return self.id
+        return _get_field(self._data or {}, field_path)
+
+
+class LocalDocumentReference:
+    def __init__(self, client, collection: str, doc_id: str):
+        self._client = client
+        self.collection_id = collection
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self.collection_id}/{self.id}"
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._get(self, field_paths)
+
+    def set(self, document_data: dict, merge: bool = False):
+        return self._client._commit([("set", self, document_data, merge)])
+
+    def create(self, document_data: dict):
+        return self._client._commit([("create", self, document_data, False)])
+
+    def update(self, field_updates: dict):
+        return self._client._commit([("update", self, field_updates, False)])
+
+    def delete(self):
+        return self._client._commit([("delete", self, None, False)])
+
+    def __eq__(self, other):
+        return isinstance(other, LocalDocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class LocalQuery:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, client, collection: str, filters=(), orders=(), limit=None, cursor=None, fields=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "cursor": self._cursor,
+            "fields": self._fields
+        }
+        state.update(changes)
+        return LocalQuery(self._client, self._collection, **state)
+
+    def where(self, field_path: str = None, op_string: str = None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def stream(self, transaction=None):
+        # Lazy like Firestore's stream(): nothing runs until the first next()
+        yield from self._client._run_query(self)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+    def on_snapshot(self, callback):
+        # Documents entering or leaving the filters are reported as ADDED / REMOVED
+        return self._client._watch(self._collection, callback, self)
+
+    def _matches_filters(self, data) -> bool:
+        if data is None:
+            return False
+        try:
+            return all(_matches(_get_field(data, field), op, value) for field, op, value in self._filters)
+        except KeyError:
+            return False
+
+    def _effective_orders(self):
+        orders = list(self._orders)
+        if not orders:
+            # Firestore orders by the first inequality field when none is given
+            for field_path, op, _ in self._filters:
+                if op in ("<", "<=", ">", ">=", "!=", "not-in"):
+                    orders.append((field_path, self.ASCENDING))
+                    break
+        if DOCUMENT_ID not in [field for field, _ in orders]:
+            orders.append((DOCUMENT_ID, orders[-1][1] if orders else self.ASCENDING))
+        return orders
+
+    def _cursor_values(self, orders):
+        cursor = self._cursor
+        if isinstance(cursor, LocalDocumentSnapshot):
+            return [cursor.get(field) for field, _ in orders]
+        if isinstance(cursor, dict):
+            return [cursor.get(field) for field, _ in orders if field in cursor]
+        values = list(cursor)
+        return [value.id if isinstance(value, LocalDocumentReference) else value for value in values]
+
+
+class LocalCollectionReference(LocalQuery):
+    def __init__(self, client, collection: str):
+        super().__init__(client, collection)
+        self.id = collection
+
+    def document(self, document_id: str = None):
+        return LocalDocumentReference(self._client, self._collection, document_id or _auto_id())
+
+    def add(self, document_data: dict, document_id: str = None):
+        reference = self.document(document_id)
+        reference.create(document_data)
+        return time.time(), reference
+
+    def list_documents(self):
+        return [self.document(doc_id) for doc_id, _ in self._client._store.scan(self._collection)]
+
+
+class LocalWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, document_data: dict, merge: bool = False):
+        self._ops.append(("set", reference, document_data, merge))
+        return self
+
+    def create(self, reference, document_data: dict):
+        self._ops.append(("create", reference, document_data, False))
+        return self
+
+    def update(self, reference, field_updates: dict):
+        self._ops.append(("update", reference, field_updates, False))
+        return self
+
+    def delete(self, reference):
+        self._ops.append(("delete", reference, None, False))
+        return self
+
+    def __len__(self):
+        return len(self._ops)
+
+    def commit(self):
+        ops, self._ops = self._ops, []
+        return self._client._commit(ops)
+
+
+class LocalTransaction(LocalWriteBatch):
+    """
+    Writes are buffered and applied atomically when the callback returns.
+    LocalClient.run_transaction holds the store lock for the whole callback,
+    so reads see a consistent snapshot.
+    """
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, LocalDocumentReference):
+            return ref_or_query.get()
+        return ref_or_query.stream()
+
+    def get_all(self, references):
+        return self._client.get_all(references)
+
+
+class LocalWatch:
+    def __init__(self, client, collection: str, callback, query=None):
+        self._client = client
+        self.collection = collection
+        self.callback = callback
+        self.query = query
+        self.is_active = True
+
+    def matches(self, data) -> bool:
+        if self.query is None:
+            return data is not None
+        return self.query._matches_filters(data)
+
+    def unsubscribe(self):
+        self.is_active = False
+        self._client._unwatch(self)
+
+
+class LocalClient:
+    def __init__(self, store, latency_ms: float = 0.0):
+        self._store = store
+        self.latency = latency_ms / 1000.0
+        self.round_trips = 0
+        self._watches = {}
+        self._watch_lock = threading.Lock()
+
+    def collection(self, collection_id: str):
+        return LocalCollectionReference(self, collection_id)
+
+    def document(self, document_path: str):
+        collection, doc_id = document_path.split("/", 1)
+        return LocalDocumentReference(self, collection, doc_id)
+
+    def batch(self):
+        return LocalWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return LocalTransaction(self)
+
+    def run_transaction(self, callback):
+        """
+        Run callback(transaction) and commit its writes atomically; the
+        return value of the callback is passed through.
+        """
+        with self._store.lock:
+            transaction = self.transaction()
+            result = callback(transaction)
+            transaction.commit()
+            return result
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        self._round_trip()
+        for reference in references:
+            data = self._store.get(reference.collection_id, reference.id)
+            if data is not None and field_paths:
+                data = _project(data, field_paths)
+            yield LocalDocumentSnapshot(reference, data, time.time())
+
+    def close(self):
+        self._store.close()
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, reference, field_paths=None):
+        self._round_trip()
+        data = self._store.get(reference.collection_id, reference.id)
+        if data is not None and field_paths:
+            data = _project(data, field_paths)
+        return LocalDocumentSnapshot(reference, data, time.time())
+
+    def _run_query(self, query):
+        self._round_trip()
+        equals = [(field, value) for field, op, value in query._filters if op == "=="]
+        rows = []
+        for doc_id, data in self._store.scan(query._collection, equals):
+            try:
+                if all(_matches(_get_field(data, field), op, value) for field, op, value in query._filters):
+                    rows.append((doc_id, data))
+            except KeyError:
+                continue
+
+        orders = query._effective_orders()
+
+        def sort_value(row, field):
+            return row[0] if field == DOCUMENT_ID else _get_field(row[1], field)
+
+        def has_order_fields(row):
+            try:
+                for field, _ in orders:
+                    sort_value(row, field)
+                return True
+            except KeyError:
+                return False
+
+        def compare_rows(a, b):
+            for field, direction in orders:
+                result = _compare(sort_value(a, field), sort_value(b, field))
+                if result:
+                    return -result if direction == LocalQuery.DESCENDING else result
+            return 0
+
+        rows = sorted(filter(has_order_fields, rows), key=functools.cmp_to_key(compare_rows))
+
+        if query._cursor is not None:
+            values = query._cursor_values(orders)
+
+            def after_cursor(row):
+                for (field, direction), value in zip(orders, values):
+                    result = _compare(sort_value(row, field), value)
+                    if result:
+                        return (-result if direction == LocalQuery.DESCENDING else result) > 0
+                return False
+
+            rows = [row for row in rows if after_cursor(row)]
+        if query._limit is not None:
+            rows = rows[:query._limit]
+
+        read_time = time.time()
+        collection = self.collection(query._collection)
+        return [
+            LocalDocumentSnapshot(
+                collection.document(doc_id),
+                _project(data, query._fields) if query._fields else data,
+                read_time
+            )
+            for doc_id, data in rows
+        ]
+
+    def _commit(self, ops):
+        self._round_trip()
+        with self._store.lock:
+            pending = {}
+            writes = []
+            for kind, reference, data, merge in ops:
+                key = (reference.collection_id, reference.id)
+                current = pending[key] if key in pending else self._store.get(*key)
+                if kind == "delete":
+                    new_data = None
+                elif kind == "create":
+                    if current is not None:
+                        raise AlreadyExists(f"Document already exists: {reference.path}")
+                    new_data = copy.deepcopy(data)
+                elif kind == "update":
+                    if current is None:
+                        raise NotFound(f"No document to update: {reference.path}")
+                    new_data = copy.deepcopy(current)
+                    for field_path, value in data.items():
+                        _set_field(new_data, field_path, copy.deepcopy(value))
+                elif merge and current is not None:
+                    new_data = copy.deepcopy(current)
+                    new_data.update(copy.deepcopy(data))
+                else:
+                    new_data = copy.deepcopy(data)
+                pending[key] = new_data
+                writes.append((reference.collection_id, reference.id, new_data))
+            previous = self._store.apply(writes)
+        self._notify(writes, previous)
+        return [time.time() for _ in writes]
+
+    def _watch(self, collection: str, callback, query=None):
+        watch = LocalWatch(self, collection, callback, query)
+        with self._store.lock:
+            docs = self._snapshots(watch)
+            with self._watch_lock:
+                self._watches.setdefault(collection, []).append(watch)
+        changes = [DocumentChange(ChangeType.ADDED, doc, -1, index) for index, doc in enumerate(docs)]
+        callback(docs, changes, time.time())
+        return watch
+
+    def _unwatch(self, watch):
+        with self._watch_lock:
+            watches = self._watches.get(watch.collection, [])
+            if watch in watches:
+                watches.remove(watch)
+
+    def _snapshots(self, watch):
+        reference = self.collection(watch.collection)
+        return [
+            LocalDocumentSnapshot(reference.document(doc_id), data)
+            for doc_id, data in self._store.scan(watch.collection) if watch.matches(data)
+        ]
+
+    def _notify(self, writes, previous):
+        with self._watch_lock:
+            if not self._watches:
+                return
+            watches = {collection: list(items) for collection, items in self._watches.items() if items}
+        read_time = time.time()
+        for collection, collection_watches in watches.items():
+            collection_writes = [
+                (doc_id, data, old)
+                for (written, doc_id, data), old in zip(writes, previous) if written == collection
+            ]
+            if not collection_writes:
+                continue
+            for watch in collection_watches:
+                changes = []
+                for doc_id, data, old in collection_writes:
+                    reference = self.collection(collection).document(doc_id)
+                    was_in, is_in = watch.matches(old), watch.matches(data)
+                    if was_in and not is_in:
+                        changes.append(DocumentChange(ChangeType.REMOVED, LocalDocumentSnapshot(reference, old), 0, -1))
+                    elif is_in:
+                        kind = ChangeType.MODIFIED if was_in else ChangeType.ADDED
+                        changes.append(DocumentChange(kind, LocalDocumentSnapshot(reference, data), -1, 0))
+                if not changes:
+                    continue
+                try:
+                    watch.callback(self._snapshots(watch), changes, read_time)
+                except Exception as e:
+                    logger.error("Local snapshot listener for %s failed: %s", collection, e)
+
+
+class LocalAuth:
+    """
+    Stand-in for firebase_admin.auth; accounts live in the same store as
+    the documents so they persist with the SQLite backend.
+    """
+    def __init__(self, client: LocalClient):
+        self._client = client
+
+    def create_user(self, email: str = None, password: str = None, uid: str = None, **kwargs):
+        store = self._client._store
+        email = _auth_email(email)
+        with store.lock:
+            if email and any(_auth_email(user.get("email")) == email for _, user in store.scan(_AUTH_COLLECTION)):
+                raise ValueError(f"The user with the provided email already exists ({email})")
+            uid = uid or _auto_id()
+            if store.get(_AUTH_COLLECTION, uid) is not None:
+                raise ValueError(f"The user with the provided uid already exists ({uid})")
+            store.apply([(_AUTH_COLLECTION, uid, {"uid": uid, "email": email})])
+        return UserRecord(uid, email)
+
+    def get_user(self, uid: str):
+        user = self._client._store.get(_AUTH_COLLECTION, uid)
+        if user is None:
+            raise ValueError(f"No user record found for the provided user ID: {uid}")
+        return UserRecord(user["uid"], user.get("email"))
+
+    def delete_user(self, uid: str):
+        store = self._client._store
+        with store.lock:
+            if store.get(_AUTH_COLLECTION, uid) is None:
+                raise ValueError(f"No user record found for the provided user ID: {uid}")
+            store.apply([(_AUTH_COLLECTION, uid, None)])
+
+    def import_users(self, users, hash_alg=None):
+        """
+        Like auth.import_users: at most 1000 ImportUserRecords, existing
+        uids are overwritten and emails are not checked for uniqueness.
+        """
+        if len(users) > 1000:
+            raise ValueError("Users list must not have more than 1000 elements.")
+        if hash_alg is None and any(user.password_hash for user in users):
+            raise ValueError("A UserImportHash is required to import users with passwords.")
+        writes = []
+        for user in users:
+            data = {"uid": user.uid, "email": _auth_email(user.email), "display_name": user.display_name}
+            if user.password_hash:
+                # Kept only so the account looks imported; nothing checks it locally
+                data["password_hash"] = user.password_hash.hex()
+                data["password_salt"] = (user.password_salt or b"").hex()
+            writes.append((_AUTH_COLLECTION, user.uid, data))
+        self._client._store.apply(writes)
+        return BatchResult(len(users), 0, [])
+
+    def get_users(self, identifiers):
+        """
+        Like auth.get_users for uid and email identifiers, at most 100.
+        Emails match case-insensitively.
+        """
+        if len(identifiers) > 100:
+            raise ValueError("`identifiers` parameter must have <= 100 entries.")
+        accounts = [user for _, user in self._client._store.scan(_AUTH_COLLECTION)]
+        users, not_found = [], []
+        for identifier in identifiers:
+            uid, email = getattr(identifier, "uid", None), _auth_email(getattr(identifier, "email", None))
+            matches = [
+                user for user in accounts
+                if (uid is not None and user["uid"] == uid) or (email is not None and _auth_email(user.get("email")) == email)
+            ]
+            if matches:
+                users.extend(UserRecord(user["uid"], user.get("email")) for user in matches)
+            else:
+                not_found.append(identifier)
+        return GetUsersResult(users, not_found)
+
+    def delete_users(self, uids):
+        """
+        Like auth.delete_users: at most 1000, missing users count as deleted.
+        """
+        if len(uids) > 1000:
+            raise ValueError("`uids` parameter must have <= 1000 entries.")
+        self._client._store.apply([(_AUTH_COLLECTION, uid, None) for uid in uids])
+        return BatchResult(len(uids), 0, [])
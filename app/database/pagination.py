@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException
+
+DOCUMENT_ID = "__name__"
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def parse_order_by(order_by: str = None):
+    """
+    "field" sorts ascending, "-field" descending; no value sorts by document ID.
+    """
+    if not order_by:
+        return DOCUMENT_ID, "ASCENDING"
+    if order_by.startswith("-"):
+        return order_by[1:], "DESCENDING"
+    return order_by, "ASCENDING"
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$dt" in value:
+        return datetime.fromisoformat(value["$dt"])
+    return value
+
+def encode_cursor(order_by: str, value, doc_id: str) -> str:
+    payload = {"o": order_by or "", "v": _encode_value(value), "id": doc_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, order_by: str = None) -> list:
+    """
+    Turn an opaque cursor back into start_after() values for the given ordering.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value, doc_id = _decode_value(payload["v"]), payload["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+    if payload.get("o") != (order_by or ""):
+        raise HTTPException(status_code=400, detail="Pagination cursor does not match order_by")
+    field, _ = parse_order_by(order_by)
+    if field == DOCUMENT_ID:
+        return [doc_id]
+    return [value, doc_id]
@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Small, rarely changing collections that are served from memory
+REFERENCE_COLLECTIONS = ("diseases", "doctors", "radiologists")
+POLL_INTERVAL_SECONDS = float(os.getenv("XSPAND_REFERENCE_CACHE_POLL_SECONDS", "30"))
+
+class ReferenceCache:
+    """
+    In-process copy of the reference collections. Warmed at startup and kept
+    current by Firestore on_snapshot listeners; if a listener cannot be
+    attached (or dies) that collection falls back to periodic reloads.
+    """
+    def __init__(self, client, collections=REFERENCE_COLLECTIONS, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.client = client
+        self.collections = tuple(collections)
+        self.poll_interval = poll_interval
+        self._docs = {collection: {} for collection in self.collections}
+        self._versions = {collection: 0 for collection in self.collections}
+        self._synced_at = {collection: None for collection in self.collections}
+        self._watches = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self):
+        self.warm()
+        for collection in self.collections:
+            try:
+                self._watches[collection] = self.client.collection(collection).on_snapshot(self._snapshot_handler(collection))
+            except Exception as e:
+                logger.warning("Listener for %s unavailable, polling instead: %s", collection, e)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._maintain, name="reference-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for watch in self._watches.values():
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.warning("Error closing reference cache listener: %s", e)
+        self._watches.clear()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def warm(self):
+        for collection in self.collections:
+            self.reload(collection)
+
+    def reload(self, collection: str):
+        docs = {doc.id: doc.to_dict() for doc in self.client.collection(collection).stream()}
+        with self._lock:
+            self._docs[collection] = docs
+            self._versions[collection] += 1
+            self._synced_at[collection] = time.time()
+
+    def _snapshot_handler(self, collection: str):
+        def on_snapshot(docs, changes, read_time):
+            with self._lock:
+                cached = self._docs[collection]
+                for change in changes:
+                    if change.type.name == "REMOVED":
+                        cached.pop(change.document.id, None)
+                    else:
+                        cached[change.document.id] = change.document.to_dict()
+                self._versions[collection] += 1
+                self._synced_at[collection] = time.time()
+        return on_snapshot
+
+    def _maintain(self):
+        # Reload collections without a live listener; drop listeners that have died
+        while not self._stop.wait(self.poll_interval):
+            for collection in self.collections:
+                watch = self._watches.get(collection)
+                if watch is not None and getattr(watch, "is_active", True):
+                    continue
+                if watch is not None:
+                    logger.warning("Listener for %s stopped, polling instead", collection)
+                    self._watches.pop(collection, None)
+                try:
+                    self.reload(collection)
+                except Exception as e:
+                    logger.warning("Error reloading %s into reference cache: %s", collection, e)
+
+    def is_cached(self, collection: str) -> bool:
+        return collection in self._docs and self._synced_at[collection] is not None
+
+    def version(self, collection: str) -> int:
+        return self._versions.get(collection, 0)
+
+    def get(self, collection: str, doc_id: str):
+        doc = self._docs[collection].get(doc_id)
+        if doc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(doc)
+
+    def all(self, collection: str) -> list:
+        self.hits += 1
+        return [dict(doc) for doc in list(self._docs[collection].values())]
+
+    def find(self, collection: str, field: str, value) -> list:
+        self.hits += 1
+        return [dict(doc) for doc in list(self._docs[collection].values()) if doc.get(field) == value]
+
+    def apply(self, collection: str, doc_id: str, data):
+        """
+        Write-through from this process; data=None removes the document.
+        """
+        if collection not in self._docs:
+            return
+        with self._lock:
+            if data is None:
+                self._docs[collection].pop(doc_id, None)
+            else:
+                self._docs[collection][doc_id] = dict(data)
+            self._versions[collection] += 1
+
+    def get_stats(self) -> dict:
+        now = time.time()
+        collections = {}
+        for collection in self.collections:
+            synced_at = self._synced_at[collection]
+            listening = collection in self._watches
+            since_sync = round(now - synced_at, 3) if synced_at else None
+            collections[collection] = {
+                "size": len(self._docs[collection]),
+                "version": self._versions[collection],
+                "mode": "listening" if listening else "polling",
+                # A live listener pushes every change, so only polled data goes stale
+                "staleness_seconds": 0.0 if listening and synced_at else since_sync,
+                "last_sync_seconds_ago": since_sync
+            }
+        return {"hits": self.hits, "misses": self.misses, "collections": collections}
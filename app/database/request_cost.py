@@ -0,0 +1,93 @@
+"""
+Per-request Firestore cost accounting.
+
+While a RequestCost is active (see RequestCostMiddleware), FirebaseDB
+records every query it sends and the documents read, written and streamed.
+Reads served from the reference cache or the unit of work's identity map
+cost nothing and are not counted; a read shared with a concurrent request
+is charged to the request that issued it.
+
+Each query also records its shape (operation, collection and filtered field,
+without the values). The same shape issued many times in one request is the
+signature of an N+1 loop that should be a single query or a get_all.
+"""
+import os
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Thresholds above which a request is logged as expensive
+MAX_DOCUMENTS_READ = int(os.getenv("XSPAND_COST_MAX_DOCUMENTS_READ", "1000"))
+MAX_DOCUMENTS_WRITTEN = int(os.getenv("XSPAND_COST_MAX_DOCUMENTS_WRITTEN", "200"))
+MAX_QUERIES = int(os.getenv("XSPAND_COST_MAX_QUERIES", "50"))
+# Times one query shape may repeat in a request before it's reported as N+1
+MAX_REPEATED_QUERIES = int(os.getenv("XSPAND_COST_MAX_REPEATED_QUERIES", "5"))
+
+_current = ContextVar("xspand_request_cost", default=None)
+
+class RequestCost:
+    def __init__(self):
+        self.queries = 0
+        self.documents_read = 0
+        self.documents_written = 0
+        self.documents_streamed = 0
+        self.shapes = Counter()
+
+    def record_query(self, shape: tuple):
+        self.queries += 1
+        self.shapes[shape] += 1
+
+    def record_read(self, documents: int):
+        self.documents_read += documents
+
+    def record_stream(self, documents: int):
+        self.documents_read += documents
+        self.documents_streamed += documents
+
+    def record_write(self, documents: int = 1):
+        self.documents_written += documents
+
+    def repeated_queries(self, limit: int = MAX_REPEATED_QUERIES) -> list:
+        """
+        (shape, count) of the query shapes issued more than limit times.
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > limit]
+
+    def problems(self) -> list:
+        """
+        Human-readable reasons this request is too expensive; empty if it isn't.
+        """
+        problems = []
+        if self.documents_read > MAX_DOCUMENTS_READ:
+            problems.append(f"read {self.documents_read} documents (limit {MAX_DOCUMENTS_READ})")
+        if self.documents_written > MAX_DOCUMENTS_WRITTEN:
+            problems.append(f"wrote {self.documents_written} documents (limit {MAX_DOCUMENTS_WRITTEN})")
+        if self.queries > MAX_QUERIES:
+            problems.append(f"sent {self.queries} queries (limit {MAX_QUERIES})")
+        for shape, count in self.repeated_queries():
+            problems.append(f"repeated query {format_shape(shape)} {count} times (possible N+1)")
+        return problems
+
+    def get_stats(self) -> dict:
+        return {
+            "queries": self.queries,
+            "documents_read": self.documents_read,
+            "documents_written": self.documents_written,
+            "documents_streamed": self.documents_streamed
+        }
+
+def format_shape(shape: tuple) -> str:
+    operation, collection, *fields = shape
+    return f"{operation} {collection}" + "".join(f".{field}" for field in fields)
+
+def current_request_cost():
+    return _current.get()
+
+@contextmanager
+def request_cost():
+    cost = RequestCost()
+    token = _current.set(cost)
+    try:
+        yield cost
+    finally:
+        _current.reset(token)
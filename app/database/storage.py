@@ -0,0 +1,30 @@
+from app.config.firebase_config import init_firebase
+from app.database.firebase import FirebaseDB
+from app.database.local_backend import LocalClient, LocalAuth, MemoryStore, SqliteStore
+import os
+
+# firestore (default), memory or sqlite
+STORAGE_BACKEND = os.getenv("XSPAND_STORAGE_BACKEND", "firestore").lower()
+SQLITE_PATH = os.getenv("XSPAND_SQLITE_PATH", "xspand.sqlite3")
+# Artificial delay per local round trip, to approximate network latency in load tests
+LOCAL_LATENCY_MS = float(os.getenv("XSPAND_LOCAL_LATENCY_MS", "0"))
+
+def create_local_database(backend: str = "memory", sqlite_path: str = SQLITE_PATH, latency_ms: float = LOCAL_LATENCY_MS) -> FirebaseDB:
+    if backend == "memory":
+        store = MemoryStore()
+    elif backend == "sqlite":
+        store = SqliteStore(sqlite_path)
+    else:
+        raise ValueError(f"Unknown local storage backend: {backend}")
+    client = LocalClient(store, latency_ms=latency_ms)
+    return FirebaseDB(client, LocalAuth(client))
+
+def create_database(backend: str = STORAGE_BACKEND) -> FirebaseDB:
+    """
+    Build the FirebaseDB for the configured backend. Only the Firestore
+    backend needs (and decodes) FIREBASE_CONFIG_CRED.
+    """
+    if backend == "firestore":
+        init_firebase()
+        return FirebaseDB()
+    return create_local_database(backend)
@@ -0,0 +1,81 @@
+"""
+Request-scoped unit of work for FirebaseDB.
+
+While a unit is active (see UnitOfWorkMiddleware), FirebaseDB memoises
+document reads by (collection, id), applies create/update/delete to the
+memoised copy and queues the write instead of sending it. Pending writes go
+out in one batch when the unit is flushed: at the end of the request, or
+earlier when a query or transaction has to see them. Outside a request
+(scripts, background threads) no unit is active and FirebaseDB reads and
+writes straight through.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Marks a document the unit knows to be absent (read as missing, or deleted)
+MISSING = object()
+
+_current = ContextVar("xspand_unit_of_work", default=None)
+
+class UnitOfWork:
+    def __init__(self):
+        self._documents = {}
+        self._pending = {}
+        self.closed = False
+        # Backend operations actually issued, and reads served from the map
+        self.reads = 0
+        self.writes = 0
+        self.hits = 0
+
+    def lookup(self, collection: str, doc_id: str):
+        """
+        The memoised document, MISSING if known absent, or None if unknown.
+        """
+        document = self._documents.get((collection, doc_id))
+        if document is not None:
+            self.hits += 1
+        return document
+
+    def peek(self, collection: str, doc_id: str):
+        return self._documents.get((collection, doc_id))
+
+    def remember(self, collection: str, doc_id: str, data):
+        self._documents[(collection, doc_id)] = MISSING if data is None else data
+
+    def stage(self, collection: str, doc_id: str, data):
+        """
+        Queue a write; data=None deletes. A later write to the same document
+        replaces the earlier one, so repeated updates cost one write.
+        """
+        self.remember(collection, doc_id, data)
+        self._pending[(collection, doc_id)] = data
+
+    def take_pending(self) -> dict:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def invalidate(self):
+        """
+        Forget memoised documents, e.g. after a transaction wrote behind our back.
+        """
+        self._documents.clear()
+
+    def get_stats(self) -> dict:
+        return {"reads": self.reads, "writes": self.writes, "hits": self.hits}
+
+def current_unit_of_work():
+    unit = _current.get()
+    return unit if unit is not None and not unit.closed else None
+
+@contextmanager
+def unit_of_work():
+    unit = UnitOfWork()
+    token = _current.set(unit)
+    try:
+        yield unit
+    finally:
+        unit.closed = True
+        _current.reset(token)
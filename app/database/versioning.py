@@ -0,0 +1,41 @@
+"""
+Change tracking for incremental sync.
+
+Every document written through FirebaseDB carries updated_at: a UTC ISO
+timestamp with fixed-width microseconds, so string order is time order and
+`where("updated_at", ">", since)` works the same in Firestore and the local
+backends.
+"""
+from datetime import datetime, timezone
+from fastapi import HTTPException
+
+UPDATED_AT = "updated_at"
+
+def format_timestamp(moment: datetime) -> str:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+def now_timestamp() -> str:
+    return format_timestamp(datetime.now(timezone.utc))
+
+def stamped(data: dict) -> dict:
+    """
+    A copy of data with updated_at set to now.
+    """
+    data = dict(data)
+    data[UPDATED_AT] = now_timestamp()
+    return data
+
+def parse_changed_since(value: str) -> str:
+    """
+    Normalise a client timestamp (ISO 8601, "Z" allowed, naive means UTC) to
+    the stored updated_at format. Raises 400 if it can't be parsed.
+    """
+    try:
+        return format_timestamp(datetime.fromisoformat(value.strip().replace("Z", "+00:00")))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid changed_since timestamp: {value}")
+
+def changed_after(document: dict, since: str) -> bool:
+    return (document.get(UPDATED_AT) or "") > since
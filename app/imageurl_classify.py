@@ -3,7 +3,15 @@ import tensorflow as tf
 from tensorflow.keras.preprocessing.image import load_img, img_to_array
 import os
 import requests
+import time
 from io import BytesIO
+from app.core.metrics import Histogram, SIZE_BUCKETS
+
+DOWNLOAD_SECONDS = Histogram("xspand_classifier_download_seconds", "Time to download an image to classify")
+DOWNLOAD_BYTES = Histogram("xspand_classifier_download_bytes", "Size of downloaded images", buckets=SIZE_BUCKETS)
+PREPROCESS_SECONDS = Histogram("xspand_classifier_preprocess_seconds", "Time to decode, resize and normalise an image")
+BATCH_SIZE = Histogram("xspand_classifier_batch_size", "Images per model forward pass", buckets=(1, 2, 4, 8, 16, 32, 64))
+FORWARD_SECONDS = Histogram("xspand_classifier_forward_seconds", "Model forward-pass latency")
 
 class ImageClassifier:
     def __init__(self):
@@ -40,25 +48,31 @@ class ImageClassifier:
     def _preprocess_image(self, img_array):
         return img_array.astype('float32') / 255.0
         
-    def _load_image_from_url(self, image_url):
+    def _download_image(self, image_url):
+        started = time.perf_counter()
         response = requests.get(image_url)
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started)
         if response.status_code != 200:
             raise ValueError(f"Failed to download image from {image_url}")
-        
-        return load_img(BytesIO(response.content), target_size=(128, 128), color_mode='grayscale')
+        DOWNLOAD_BYTES.observe(len(response.content))
+        return BytesIO(response.content)
         
     def classify(self, image_source, is_url=True):
         try:
             if is_url:
-                img = self._load_image_from_url(image_source)
-            else:
-                img = load_img(image_source, target_size=(128, 128), color_mode='grayscale')
-            
+                image_source = self._download_image(image_source)
+
+            started = time.perf_counter()
+            img = load_img(image_source, target_size=(128, 128), color_mode='grayscale')
             x = img_to_array(img)
             x = np.expand_dims(x, axis=0)
             x = self._preprocess_image(x)
+            PREPROCESS_SECONDS.observe(time.perf_counter() - started)
 
+            started = time.perf_counter()
             predictions = self.model.predict(x, verbose=0)[0]
+            FORWARD_SECONDS.observe(time.perf_counter() - started)
+            BATCH_SIZE.observe(x.shape[0])
             
             labels = [self.class_labels[i] for i in range(self.num_classes) if predictions[i] >= self.confidence_threshold]
             # get a list of confidence values crossing the threshold for each label
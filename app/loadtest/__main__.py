@@ -0,0 +1,54 @@
+"""
+End-to-end load test of the whole API, fully offline.
+
+    python -m app.loadtest [--mix clinic_day] [--patients 500] [--concurrency 16]
+                           [--requests 2000 | --duration 30] [--latency-ms 2]
+                           [--classifier-latency-ms 50] [--seed 0] [--json report.json]
+
+Runs the app in-process on the in-memory storage backend with the stub
+classifier, seeds a synthetic clinic and prints throughput and latency
+percentiles per route. --latency-ms adds a simulated network delay to every
+storage round trip. Mixes: read_heavy, clinic_day, radiology, ingest and
+all_routes (every operation, to cover all routers). The event stream is not
+driven: it never completes a response.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API against synthetic clinic data")
+    parser.add_argument("--mix", default="clinic_day", help="Traffic mix (see app/loadtest/scenarios.py)")
+    parser.add_argument("--patients", type=int, default=500, help="Seeded patients; staff and scans scale with it")
+    parser.add_argument("--concurrency", type=int, default=16, help="Simulated clients")
+    parser.add_argument("--requests", type=int, default=2000, help="Total requests to send")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds instead")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated latency per storage round trip")
+    parser.add_argument("--classifier-latency-ms", type=float, default=50.0, help="Simulated inference time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    # Configuration is read at import time, so set it before the app is imported
+    os.environ["XSPAND_STORAGE_BACKEND"] = "memory"
+    os.environ["XSPAND_CLASSIFIER"] = "stub"
+    os.environ["XSPAND_LOCAL_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["XSPAND_STUB_CLASSIFIER_LATENCY_MS"] = str(args.classifier_latency_ms)
+    from app.main import app
+    from app.loadtest.runner import run_load
+    from app.loadtest.scenarios import MIXES
+
+    if args.mix not in MIXES:
+        parser.error(f"unknown mix {args.mix}; choose from {', '.join(MIXES)}")
+    requests = args.requests if args.duration is None else float("inf")
+    report = asyncio.run(run_load(
+        app, args.mix, args.patients, args.concurrency, requests, args.duration, args.seed
+    ))
+    print(report.format_table())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report.to_dict(), f, indent=2)
+
+if __name__ == "__main__":
+    main()
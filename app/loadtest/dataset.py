@@ -0,0 +1,155 @@
+"""
+Synthetic clinic data for load tests.
+
+generate_dataset builds a reproducible dataset (same seed, same data) of
+doctors, radiologists, patients, doctor_patient_relations, xray_scans and
+diseases, each document validated against its model in app.models.schemas.
+seed_database writes it to a storage client and rebuilds the aggregates.
+"""
+import random
+from datetime import datetime, timedelta
+from app.classifier import CLASS_LABELS, StubClassifier
+from app.database.aggregates import rebuild_disease_counts, rebuild_patient_status
+from app.database.versioning import stamped
+from app.models.enums import Gender, SeverityLevel, TreatmentStatus, UserRole
+from app.models.schemas import Disease, Doctor, DoctorPatientRelation, Patient, Radiologist, XRayScan
+
+# Staff and workload per patient, roughly a mid-sized outpatient clinic
+PATIENTS_PER_DOCTOR = 25
+PATIENTS_PER_RADIOLOGIST = 100
+MAX_SCANS_PER_PATIENT = 4
+VERIFIED_SCAN_RATIO = 0.6
+# Share of patients also seen earlier by another doctor
+PREVIOUS_DOCTOR_RATIO = 0.3
+# Scan timestamps spread over the year before this date
+BASE_DATE = datetime(2024, 6, 30)
+
+FIRST_NAMES = ["Amina", "Ben", "Chloe", "Dev", "Elena", "Farid", "Grace", "Hiro", "Isla", "Jonas", "Kemi", "Luca", "Maya", "Noor", "Omar", "Priya"]
+LAST_NAMES = ["Adeyemi", "Brooks", "Chen", "Dubois", "Eriksen", "Fernandes", "Gupta", "Haddad", "Ivanova", "Jensen", "Khan", "Lopez", "Moreau", "Novak"]
+SPECIALIZATIONS = ["Pulmonology", "Internal Medicine", "Cardiology", "Oncology", "General Practice"]
+SEVERITY = {
+    "Atelectasis": SeverityLevel.moderate, "Cardiomegaly": SeverityLevel.severe, "Consolidation": SeverityLevel.moderate,
+    "Edema": SeverityLevel.severe, "Effusion": SeverityLevel.moderate, "Emphysema": SeverityLevel.severe,
+    "Fibrosis": SeverityLevel.severe, "Infiltration": SeverityLevel.mild, "Mass": SeverityLevel.critical,
+    "Nodule": SeverityLevel.moderate, "Pleural_Thickening": SeverityLevel.mild, "Pneumonia": SeverityLevel.severe,
+    "Pneumothorax": SeverityLevel.critical
+}
+
+def disease_id(label: str) -> str:
+    return f"disease_{label.lower()}"
+
+def image_url(scan_id: str) -> str:
+    return f"https://images.example.org/xray/{scan_id}.png"
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+def generate_dataset(patients: int = 1000, seed: int = 0) -> dict:
+    """
+    {collection: {document_id: data}} for a clinic with the given number of
+    patients; staff and scans scale with it.
+    """
+    rng = random.Random(seed)
+    classifier = StubClassifier(latency_ms=0)
+    data = {name: {} for name in ("diseases", "doctors", "radiologists", "patients", "doctor_patient_relations", "xray_scans")}
+
+    for label in CLASS_LABELS:
+        disease = Disease(
+            disease_id=disease_id(label),
+            disease_name=label,
+            description=f"{label.replace('_', ' ')} seen on chest X-ray",
+            severity_level=SEVERITY[label],
+            common_symptoms=rng.sample(["cough", "dyspnoea", "chest pain", "fever", "fatigue", "wheezing"], 3),
+            treatment_methods=rng.sample(["observation", "medication", "drainage", "oxygen therapy", "surgery"], 2),
+            aliases=[label.replace("_", " ")] if "_" in label else []
+        )
+        data["diseases"][disease.disease_id] = disease.dict()
+
+    doctor_ids = [f"doctor_{i:05d}" for i in range(max(1, patients // PATIENTS_PER_DOCTOR))]
+    for doctor_id in doctor_ids:
+        doctor = Doctor(
+            user_id=doctor_id, doctor_id=doctor_id, email=f"{doctor_id}@clinic.example.org",
+            role=UserRole.doctor, full_name=f"Dr. {_name(rng)}", specialization=rng.choice(SPECIALIZATIONS)
+        )
+        data["doctors"][doctor_id] = doctor.dict()
+
+    radiologist_ids = [f"radiologist_{i:05d}" for i in range(max(1, patients // PATIENTS_PER_RADIOLOGIST))]
+    for radiologist_id in radiologist_ids:
+        radiologist = Radiologist(
+            user_id=radiologist_id, radiologist_id=radiologist_id, email=f"{radiologist_id}@clinic.example.org",
+            role=UserRole.radiologist, full_name=f"Dr. {_name(rng)}", specialization="Radiology"
+        )
+        data["radiologists"][radiologist_id] = radiologist.dict()
+
+    for i in range(patients):
+        patient_id = f"patient_{i:06d}"
+        patient = Patient(
+            patient_id=patient_id, full_name=_name(rng), is_resident=rng.random() < 0.85,
+            email_address=f"{patient_id}@mail.example.org", contact_number=f"+1555{rng.randrange(10 ** 7):07d}",
+            age=rng.randint(1, 95), height_cm=round(rng.uniform(100, 200), 1), weight_kg=round(rng.uniform(15, 130), 1),
+            gender=rng.choice(list(Gender))
+        )
+        data["patients"][patient_id] = patient.dict()
+
+        doctor_id = rng.choice(doctor_ids)
+        scan_start = BASE_DATE - timedelta(days=rng.randint(1, 365))
+        diagnosed = None
+        for n in range(rng.randint(0, MAX_SCANS_PER_PATIENT)):
+            scan_id = f"scan_{i:06d}_{n}"
+            result = classifier.classify(image_url(scan_id))
+            labels = result["labels"].split(", ")
+            verified = rng.random() < VERIFIED_SCAN_RATIO
+            scan = XRayScan(
+                image_url=image_url(scan_id), scan_id=scan_id, patient_id=patient_id, doctor_id=doctor_id,
+                radiologist_id=rng.choice(radiologist_ids) if verified else None,
+                disease_id=disease_id(labels[0]) if verified else None,
+                disease_ids=[disease_id(label) for label in labels] if verified else None,
+                ai_classification=result["labels"], disease_name=labels[0] if verified else None,
+                scan_timestamp=(scan_start + timedelta(days=7 * n, minutes=rng.randrange(600))).isoformat(),
+                ai_approved=verified
+            ).dict()
+            scan["ai_confidence"] = result["confidence_scores"]
+            data["xray_scans"][scan_id] = scan
+            if verified:
+                diagnosed = scan["disease_id"]
+
+        relation = DoctorPatientRelation(
+            doctor_id=doctor_id, patient_id=patient_id, treatment_status=TreatmentStatus.ongoing,
+            treatment_start_date=scan_start.isoformat(), treatment_end_date=None,
+            diagnosed_with_disease=diagnosed is not None, diagnosed_disease_id=diagnosed
+        )
+        data["doctor_patient_relations"][f"{doctor_id}_{patient_id}"] = relation.dict()
+
+        if len(doctor_ids) > 1 and rng.random() < PREVIOUS_DOCTOR_RATIO:
+            previous = rng.choice([d for d in doctor_ids if d != doctor_id])
+            ended = scan_start - timedelta(days=rng.randint(1, 30))
+            relation = DoctorPatientRelation(
+                doctor_id=previous, patient_id=patient_id, treatment_status=TreatmentStatus.completed,
+                treatment_start_date=(ended - timedelta(days=rng.randint(30, 365))).isoformat(),
+                treatment_end_date=ended.isoformat(), diagnosed_with_disease=False, diagnosed_disease_id=None
+            )
+            data["doctor_patient_relations"][f"{previous}_{patient_id}"] = relation.dict()
+
+    return data
+
+def seed_database(client, data: dict, batch_size: int = 500) -> int:
+    """
+    Write the dataset to a Firestore-compatible client in batches, then
+    rebuild the materialized aggregates. Returns the documents written.
+    """
+    written = 0
+    batch, pending = client.batch(), 0
+    for collection, documents in data.items():
+        for document_id, document in documents.items():
+            batch.set(client.collection(collection).document(document_id), stamped(document))
+            pending += 1
+            if pending == batch_size:
+                batch.commit()
+                written += pending
+                batch, pending = client.batch(), 0
+    if pending:
+        batch.commit()
+        written += pending
+    rebuild_disease_counts(client)
+    rebuild_patient_status(client)
+    return written
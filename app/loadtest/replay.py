@@ -0,0 +1,238 @@
+"""
+Replay captured traffic (see app.core.capture) and compare latencies.
+
+    python -m app.loadtest.replay captures/traffic.jsonl.1 captures/traffic.jsonl
+        [--target http://staging:8000] [--speed 1] [--concurrency 16]
+        [--json report.json] [--baseline previous.json] [--max-regression 20]
+
+Requests are re-issued in capture order. --speed 1 keeps the original
+pacing, 10 replays ten times faster and 0 sends them back to back from
+--concurrency clients. Without --target the app runs in-process on the
+in-memory backend, seeded with the synthetic dataset for --patients and
+--seed: traffic captured from a load test run with the same options finds
+the same IDs.
+
+The report compares the captured and replayed latency distributions per
+route. --json writes it with sorted keys so reports from two builds diff
+cleanly; --baseline compares the replay against an earlier report and,
+with --max-regression, exits 1 if a route's p50 or p99 grew by more than
+that percentage.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from app.loadtest.stats import RouteStats
+
+# Routes with fewer replayed requests are too noisy to fail a comparison
+MIN_REQUESTS_TO_COMPARE = 20
+
+def read_capture(paths: list) -> list:
+    """
+    Captured requests from one or more capture files, oldest first.
+    """
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+def route_key(entry: dict) -> str:
+    return f"{entry['method']} {entry['route']}"
+
+def _change_pct(before: float, after: float):
+    return round((after - before) / before * 100, 1) if before else None
+
+async def _send(client, entry: dict):
+    headers = {"accept": entry["accept"]} if entry.get("accept") else None
+    kwargs = {"json": entry["body"]} if entry.get("body") is not None else {}
+    return await client.request(entry["method"], entry["path"], params=entry["query"], headers=headers, **kwargs)
+
+async def replay(client, entries: list, speed: float = 1.0, concurrency: int = 16) -> tuple:
+    """
+    Re-issue the entries through client. Returns ({route: RouteStats}, elapsed seconds).
+    """
+    routes = {}
+
+    async def issue(entry):
+        started = time.perf_counter()
+        try:
+            status = (await _send(client, entry)).status_code
+        except Exception:
+            status = 599
+        routes.setdefault(route_key(entry), RouteStats()).record(time.perf_counter() - started, status)
+
+    started = time.perf_counter()
+    if speed > 0:
+        # Open loop: each request leaves at its captured offset, however slow the others are
+        tasks, origin = [], entries[0]["t"] if entries else 0
+        for entry in entries:
+            delay = (entry["t"] - origin) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(issue(entry)))
+        await asyncio.gather(*tasks)
+    else:
+        pending = iter(entries)
+
+        async def worker():
+            for entry in pending:
+                await issue(entry)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return routes, time.perf_counter() - started
+
+def build_report(entries: list, routes: dict, elapsed: float, speed: float, target: str, skipped: int) -> dict:
+    captured = {}
+    for entry in entries:
+        captured.setdefault(route_key(entry), RouteStats()).record(entry["duration_ms"] / 1000, entry["status"])
+    span = entries[-1]["t"] - entries[0]["t"] if entries else 0.0
+    report_routes = {}
+    for key in sorted(routes):
+        before = captured[key].summary(span)
+        after = routes[key].summary(elapsed)
+        report_routes[key] = {
+            "captured": before,
+            "replayed": after,
+            "p50_change_pct": _change_pct(before["p50_ms"], after["p50_ms"]),
+            "p99_change_pct": _change_pct(before["p99_ms"], after["p99_ms"])
+        }
+    total = RouteStats()
+    for stats in routes.values():
+        total.latencies.extend(stats.latencies)
+        total.client_errors += stats.client_errors
+        total.server_errors += stats.server_errors
+    return {
+        "target": target,
+        "speed": speed,
+        "skipped": skipped,
+        "elapsed_seconds": round(elapsed, 3),
+        "total": total.summary(elapsed),
+        "routes": report_routes
+    }
+
+def compare_reports(baseline: dict, current: dict) -> dict:
+    """
+    {route: {"p50": (before, after, change_pct), "p99": ...}} for the routes
+    replayed in both reports.
+    """
+    comparison = {}
+    for key, row in current["routes"].items():
+        previous = baseline["routes"].get(key)
+        if previous is None:
+            continue
+        before, after = previous["replayed"], row["replayed"]
+        comparison[key] = {
+            "requests": after["requests"],
+            "p50": (before["p50_ms"], after["p50_ms"], _change_pct(before["p50_ms"], after["p50_ms"])),
+            "p99": (before["p99_ms"], after["p99_ms"], _change_pct(before["p99_ms"], after["p99_ms"]))
+        }
+    return comparison
+
+def regressions(comparison: dict, max_regression_pct: float) -> list:
+    return [
+        f"{key}: {metric} {before} -> {after} ms ({change:+}%)"
+        for key, row in comparison.items() if row["requests"] >= MIN_REQUESTS_TO_COMPARE
+        for metric in ("p50", "p99")
+        for before, after, change in [row[metric]]
+        if change is not None and change > max_regression_pct
+    ]
+
+def _pct(change) -> str:
+    return "n/a" if change is None else f"{change:+.1f}%"
+
+def format_report(report: dict) -> str:
+    header = f"{'route':<60} {'reqs':>6} {'4xx':>5} {'5xx':>5} {'p50 was':>9} {'p50 now':>9} {'change':>8} {'p99 was':>9} {'p99 now':>9} {'change':>8}"
+    lines = [
+        f"replayed against {report['target']} at speed {report['speed'] or 'max'}, "
+        f"{report['total']['requests']} requests in {report['elapsed_seconds']}s ({report['skipped']} skipped)",
+        header, "-" * len(header)
+    ]
+    for key, row in report["routes"].items():
+        before, after = row["captured"], row["replayed"]
+        lines.append(
+            f"{key:<60} {after['requests']:>6} {after['4xx']:>5} {after['5xx']:>5} "
+            f"{before['p50_ms']:>9} {after['p50_ms']:>9} {_pct(row['p50_change_pct']):>8} "
+            f"{before['p99_ms']:>9} {after['p99_ms']:>9} {_pct(row['p99_change_pct']):>8}"
+        )
+    return "\n".join(lines)
+
+def format_comparison(comparison: dict) -> str:
+    header = f"{'route':<60} {'p50 base':>9} {'p50 now':>9} {'change':>8} {'p99 base':>9} {'p99 now':>9} {'change':>8}"
+    lines = ["compared with baseline", header, "-" * len(header)]
+    for key, row in sorted(comparison.items()):
+        (p50_before, p50_after, p50_change), (p99_before, p99_after, p99_change) = row["p50"], row["p99"]
+        lines.append(
+            f"{key:<60} {p50_before:>9} {p50_after:>9} {_pct(p50_change):>8} "
+            f"{p99_before:>9} {p99_after:>9} {_pct(p99_change):>8}"
+        )
+    return "\n".join(lines)
+
+async def _run(args, entries: list) -> tuple:
+    if args.target:
+        import httpx
+        async with httpx.AsyncClient(base_url=args.target, timeout=None) as client:
+            routes, elapsed = await replay(client, entries, args.speed, args.concurrency)
+        return routes, elapsed, args.target
+
+    # Configuration is read at import time, so set it before the app is imported
+    os.environ["XSPAND_STORAGE_BACKEND"] = "memory"
+    os.environ["XSPAND_CLASSIFIER"] = "stub"
+    os.environ["XSPAND_LOCAL_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["XSPAND_STUB_CLASSIFIER_LATENCY_MS"] = str(args.classifier_latency_ms)
+    from app.main import app
+    from app.loadtest.dataset import generate_dataset
+    from app.loadtest.runner import seeded_client
+
+    async with seeded_client(app, generate_dataset(args.patients, args.seed)) as (client, _):
+        routes, elapsed = await replay(client, entries, args.speed, args.concurrency)
+    return routes, elapsed, "in-process app"
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare latencies")
+    parser.add_argument("files", nargs="+", help="Capture files (rotated ones too, in any order)")
+    parser.add_argument("--target", help="Base URL of the build to replay against; in-process if omitted")
+    parser.add_argument("--speed", type=float, default=1.0, help="Pacing multiplier; 0 sends as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients when --speed is 0")
+    parser.add_argument("--patients", type=int, default=500, help="In-process: synthetic patients to seed")
+    parser.add_argument("--seed", type=int, default=0, help="In-process: dataset seed")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="In-process: simulated storage round trip")
+    parser.add_argument("--classifier-latency-ms", type=float, default=50.0, help="In-process: simulated inference time")
+    parser.add_argument("--json", help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare the replay with")
+    parser.add_argument("--max-regression", type=float, help="With --baseline: exit 1 above this p50/p99 increase (%%)")
+    args = parser.parse_args()
+
+    entries = read_capture(args.files)
+    # Bodies too large or not JSON weren't captured and can't be replayed faithfully
+    replayable = [entry for entry in entries if not entry.get("body_truncated")]
+    if not replayable:
+        parser.error("no replayable requests in the capture")
+
+    routes, elapsed, target = asyncio.run(_run(args, replayable))
+    report = build_report(replayable, routes, elapsed, args.speed, target, len(entries) - len(replayable))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare_reports(json.load(f), report)
+        print()
+        print(format_comparison(comparison))
+        if args.max_regression is not None:
+            failed = regressions(comparison, args.max_regression)
+            if failed:
+                print("\nRegressions over {}%:\n  {}".format(args.max_regression, "\n  ".join(failed)))
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
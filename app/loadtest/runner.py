@@ -0,0 +1,100 @@
+"""
+In-process load driver: runs the ASGI app (lifespan included) behind an
+httpx client, seeds it, then keeps `concurrency` simulated clients busy
+with the chosen traffic mix and reports throughput and latency per route.
+"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+import httpx
+from app.loadtest.dataset import generate_dataset, seed_database
+from app.loadtest.scenarios import MIXES, OPERATIONS, ClinicState
+from app.loadtest.stats import RouteStats
+
+class LoadReport:
+    def __init__(self, mix: str, concurrency: int, documents: int, elapsed: float, routes: dict):
+        self.mix = mix
+        self.concurrency = concurrency
+        self.documents = documents
+        self.elapsed = elapsed
+        self.routes = routes
+
+    def to_dict(self) -> dict:
+        total = RouteStats()
+        for stats in self.routes.values():
+            total.latencies.extend(stats.latencies)
+            total.client_errors += stats.client_errors
+            total.server_errors += stats.server_errors
+        return {
+            "mix": self.mix,
+            "concurrency": self.concurrency,
+            "seeded_documents": self.documents,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "total": total.summary(self.elapsed),
+            "routes": {name: stats.summary(self.elapsed) for name, stats in sorted(self.routes.items())}
+        }
+
+    def format_table(self) -> str:
+        report = self.to_dict()
+        header = f"{'route':<60} {'reqs':>7} {'rps':>8} {'4xx':>5} {'5xx':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+        lines = [
+            f"mix {self.mix}, concurrency {self.concurrency}, {self.documents} seeded documents, {report['elapsed_seconds']}s",
+            header, "-" * len(header)
+        ]
+        for name, row in list(report["routes"].items()) + [("TOTAL", report["total"])]:
+            lines.append(
+                f"{name:<60} {row['requests']:>7} {row['rps']:>8} {row['4xx']:>5} {row['5xx']:>5} "
+                f"{row['p50_ms']:>8} {row['p90_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8}"
+            )
+        return "\n".join(lines)
+
+@asynccontextmanager
+async def seeded_client(app, data: dict):
+    """
+    Start the app, seed its storage with data and yield an in-process
+    client along with the number of documents written.
+    """
+    async with app.router.lifespan_context(app):
+        documents = seed_database(app.state.context.db.db, data)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            yield client, documents
+
+async def run_load(app, mix: str = "clinic_day", patients: int = 500, concurrency: int = 16,
+                   requests: int = 2000, duration: float = None, seed: int = 0) -> LoadReport:
+    """
+    Seed the app's storage and drive it until `requests` have been sent or
+    `duration` seconds have passed, whichever comes first.
+    """
+    weights = MIXES[mix]
+    names = list(weights)
+    data = generate_dataset(patients, seed)
+    routes = {name: RouteStats() for name in names}
+
+    async with seeded_client(app, data) as (client, documents):
+        state = ClinicState(data)
+        remaining = [requests]
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def simulated_client(index: int):
+            rng = random.Random(seed * 1000 + index)
+            while remaining[0] > 0 and (deadline is None or time.perf_counter() < deadline):
+                name = rng.choices(names, weights=[weights[n] for n in names])[0]
+                call = OPERATIONS[name](state, rng)
+                if call is None:
+                    # Nothing to act on yet (e.g. no claimed scans to approve)
+                    await asyncio.sleep(0)
+                    continue
+                remaining[0] -= 1
+                started = time.perf_counter()
+                response = await client.request(call.method, call.url, params=call.params, json=call.json)
+                routes[name].record(time.perf_counter() - started, response.status_code)
+                if call.on_response is not None:
+                    call.on_response(response)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(simulated_client(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return LoadReport(mix, concurrency, documents, elapsed, {name: stats for name, stats in routes.items() if stats.latencies})
@@ -0,0 +1,198 @@
+"""
+Scripted traffic for load tests.
+
+Each operation picks its parameters from the seeded (and growing) pool of
+IDs and returns a Call; its name is the route template, so results are
+reported per route. A mix maps operation names to relative weights.
+"""
+import random
+from datetime import datetime
+from app.loadtest.dataset import CLASS_LABELS, image_url
+
+class Call:
+    def __init__(self, method: str, url: str, params: dict = None, json: dict = None, on_response=None):
+        self.method = method
+        self.url = url
+        self.params = params
+        self.json = json
+        # Called with the response to record IDs for later operations
+        self.on_response = on_response
+
+class ClinicState:
+    """
+    IDs known to exist, seeded from the dataset and extended as the load
+    test creates patients and scans.
+    """
+    def __init__(self, data: dict):
+        self.patient_ids = list(data["patients"])
+        self.doctor_ids = list(data["doctors"])
+        self.radiologist_ids = list(data["radiologists"])
+        self.scan_ids = list(data["xray_scans"])
+        self.disease_ids = list(data["diseases"])
+        self.ongoing = [
+            (relation["doctor_id"], relation["patient_id"])
+            for relation in data["doctor_patient_relations"].values()
+            if relation["treatment_status"] == "Ongoing"
+        ]
+        # Scans created by the load test, safe to delete
+        self.created_scan_ids = []
+        # (scan_id, radiologist_id, ai_classification) leased through the worklist, awaiting approval
+        self.claimed = []
+        self._sequence = 0
+
+    def next_id(self, prefix: str) -> str:
+        self._sequence += 1
+        return f"{prefix}_load_{self._sequence:07d}"
+
+def _new_scan(state: ClinicState, rng: random.Random) -> dict:
+    doctor_id, patient_id = rng.choice(state.ongoing)
+    return {
+        "image_url": image_url(state.next_id("image")),
+        "patient_id": patient_id,
+        "doctor_id": doctor_id,
+        "scan_timestamp": datetime.now().isoformat()
+    }
+
+def _created_scan(state: ClinicState):
+    def record(response):
+        if response.status_code == 200:
+            scan_id = response.json().get("scan_id")
+            if scan_id:
+                state.scan_ids.append(scan_id)
+                state.created_scan_ids.append(scan_id)
+    return record
+
+def _claimed(state: ClinicState, radiologist_id: str):
+    def record(response):
+        if response.status_code == 200:
+            claim = response.json()
+            state.claimed.append((claim["lease"]["scan_id"], radiologist_id, claim["scan_details"].get("ai_classification")))
+    return record
+
+def _registered(state: ClinicState, doctor_id: str, patient_id: str, new_patient: bool):
+    def record(response):
+        if response.status_code == 200 and "relation_id" in response.json():
+            if new_patient:
+                state.patient_ids.append(patient_id)
+            state.ongoing.append((doctor_id, patient_id))
+    return record
+
+def _approve(state: ClinicState, rng: random.Random):
+    if not state.claimed:
+        return None
+    scan_id, radiologist_id, ai_classification = state.claimed.pop(rng.randrange(len(state.claimed)))
+    if ai_classification and rng.random() < 0.8:
+        # Approving the AI result sends it back as the diagnosis
+        return Call("PUT", f"/api/v1/xrays/{scan_id}", json={
+            "radiologist_id": radiologist_id, "ai_approved": True, "ai_classification": ai_classification,
+            "radiologist_report": f"Agree with AI findings: {ai_classification}"
+        })
+    label = rng.choice(CLASS_LABELS)
+    return Call("PUT", f"/api/v1/xrays/{scan_id}", json={
+        "radiologist_id": radiologist_id, "ai_approved": False,
+        "disease_name": label, "radiologist_report": f"Findings consistent with {label}"
+    })
+
+def _delete_scan(state: ClinicState, rng: random.Random):
+    if not state.created_scan_ids:
+        return None
+    scan_id = state.created_scan_ids.pop(rng.randrange(len(state.created_scan_ids)))
+    state.scan_ids.remove(scan_id)
+    return Call("DELETE", f"/api/v1/xrays/delete/{scan_id}")
+
+def _register_complete(state: ClinicState, rng: random.Random):
+    patient_id, doctor_id = state.next_id("patient"), rng.choice(state.doctor_ids)
+    return Call("POST", "/api/v1/patients/register/complete", json={
+        "patient_id": patient_id, "doctor_id": doctor_id, "full_name": "Load Test Patient", "is_resident": True,
+        "email_address": f"{patient_id}@mail.example.org", "contact_number": "+15550000000",
+        "age": rng.randint(1, 95), "height_cm": 170.0, "weight_kg": 70.0, "gender": rng.choice(["Male", "Female"])
+    }, on_response=_registered(state, doctor_id, patient_id, True))
+
+def _register_simple(state: ClinicState, rng: random.Random):
+    patient_id, doctor_id = rng.choice(state.patient_ids), rng.choice(state.doctor_ids)
+    return Call("POST", "/api/v1/patients/register", json={
+        "patient_id": patient_id, "doctor_id": doctor_id, "is_resident": True
+    }, on_response=_registered(state, doctor_id, patient_id, False))
+
+def _claim(state: ClinicState, rng: random.Random):
+    radiologist_id = rng.choice(state.radiologist_ids)
+    return Call("POST", "/api/v1/xrays/worklist/claim", params={"radiologist_id": radiologist_id},
+                on_response=_claimed(state, radiologist_id))
+
+OPERATIONS = {
+    # patients
+    "GET /api/v1/patients/status": lambda s, r: Call("GET", "/api/v1/patients/status"),
+    "GET /api/v1/patients/": lambda s, r: Call("GET", "/api/v1/patients/", params={"page_size": 50}),
+    "GET /api/v1/patients/{patient_id}": lambda s, r: Call("GET", f"/api/v1/patients/{r.choice(s.patient_ids)}"),
+    "GET /api/v1/patients/{patient_id}/complete": lambda s, r: Call("GET", f"/api/v1/patients/{r.choice(s.patient_ids)}/complete"),
+    "GET /api/v1/patients/{patient_id}/scans": lambda s, r: Call("GET", f"/api/v1/patients/{r.choice(s.patient_ids)}/scans"),
+    "GET /api/v1/patients/doctor/{doctor_id}": lambda s, r: Call("GET", f"/api/v1/patients/doctor/{r.choice(s.doctor_ids)}"),
+    "GET /api/v1/patients/doctor/current_patients/{doctor_id}":
+        lambda s, r: Call("GET", f"/api/v1/patients/doctor/current_patients/{r.choice(s.doctor_ids)}"),
+    "POST /api/v1/patients/register/complete": _register_complete,
+    "POST /api/v1/patients/register": _register_simple,
+    "PUT /api/v1/patients/{patient_id}":
+        lambda s, r: Call("PUT", f"/api/v1/patients/{r.choice(s.patient_ids)}", json={"contact_number": f"+1555{r.randrange(10 ** 7):07d}"}),
+    "POST /api/v1/patients/xray": lambda s, r: Call("POST", "/api/v1/patients/xray", json=dict(_new_scan(s, r), scan_id=s.next_id("scan"))),
+    # diseases
+    "GET /api/v1/diseases": lambda s, r: Call("GET", "/api/v1/diseases"),
+    "GET /api/v1/diseases/{disease_id}": lambda s, r: Call("GET", f"/api/v1/diseases/{r.choice(s.disease_ids)}"),
+    "GET /api/v1/diseases/counts/all_patients": lambda s, r: Call("GET", "/api/v1/diseases/counts/all_patients"),
+    "GET /api/v1/diseases/counts/current_patients": lambda s, r: Call("GET", "/api/v1/diseases/counts/current_patients"),
+    # users
+    "GET /api/v1/doctors": lambda s, r: Call("GET", "/api/v1/doctors"),
+    "GET /api/v1/doctors/{doctor_id}": lambda s, r: Call("GET", f"/api/v1/doctors/{r.choice(s.doctor_ids)}"),
+    "PUT /api/v1/update/doctor/{doctor_id}":
+        lambda s, r: Call("PUT", f"/api/v1/update/doctor/{r.choice(s.doctor_ids)}", json={"specialization": "Pulmonology"}),
+    "GET /api/v1/radiologists": lambda s, r: Call("GET", "/api/v1/radiologists"),
+    "GET /api/v1/radiologists/{radiologist_id}": lambda s, r: Call("GET", f"/api/v1/radiologists/{r.choice(s.radiologist_ids)}"),
+    # X-ray scans
+    "GET /api/v1/xrays/": lambda s, r: Call("GET", "/api/v1/xrays/", params={"page_size": 50}),
+    "GET /api/v1/xrays/unverified": lambda s, r: Call("GET", "/api/v1/xrays/unverified"),
+    "GET /api/v1/xrays/by_patient/{patient_id}": lambda s, r: Call("GET", f"/api/v1/xrays/by_patient/{r.choice(s.patient_ids)}"),
+    "POST /api/v1/xrays/": lambda s, r: Call("POST", "/api/v1/xrays/", json=_new_scan(s, r), on_response=_created_scan(s)),
+    "POST /api/v1/xrays/classify": lambda s, r: Call("POST", "/api/v1/xrays/classify", json=_new_scan(s, r), on_response=_created_scan(s)),
+    "GET /api/v1/xrays/classify/{scan_id}": lambda s, r: Call("GET", f"/api/v1/xrays/classify/{r.choice(s.scan_ids)}"),
+    "GET /api/v1/xrays/classify_url/": lambda s, r: Call("GET", "/api/v1/xrays/classify_url/", params={"image_url": image_url(r.choice(s.scan_ids))}),
+    "GET /api/v1/xrays/worklist": lambda s, r: Call("GET", "/api/v1/xrays/worklist"),
+    "POST /api/v1/xrays/worklist/claim": _claim,
+    "PUT /api/v1/xrays/{scan_id}": _approve,
+    "DELETE /api/v1/xrays/delete/{scan_id}": _delete_scan,
+    # system
+    "GET /api/v1/system/stats": lambda s, r: Call("GET", "/api/v1/system/stats"),
+    "GET /metrics": lambda s, r: Call("GET", "/metrics"),
+}
+
+MIXES = {
+    # Dashboards and record lookups
+    "read_heavy": {
+        "GET /api/v1/patients/status": 10, "GET /api/v1/patients/{patient_id}": 15,
+        "GET /api/v1/patients/{patient_id}/complete": 10, "GET /api/v1/patients/{patient_id}/scans": 10,
+        "GET /api/v1/patients/doctor/current_patients/{doctor_id}": 8, "GET /api/v1/xrays/by_patient/{patient_id}": 8,
+        "GET /api/v1/diseases": 5, "GET /api/v1/diseases/counts/current_patients": 5,
+        "GET /api/v1/xrays/unverified": 5, "GET /api/v1/patients/": 4, "GET /api/v1/doctors/{doctor_id}": 4,
+        "PUT /api/v1/patients/{patient_id}": 1,
+    },
+    # A working day: lookups, registrations, new scans and radiology review
+    "clinic_day": {
+        "GET /api/v1/patients/{patient_id}": 12, "GET /api/v1/patients/{patient_id}/complete": 8,
+        "GET /api/v1/patients/doctor/current_patients/{doctor_id}": 8, "GET /api/v1/patients/status": 5,
+        "GET /api/v1/xrays/by_patient/{patient_id}": 6, "GET /api/v1/diseases/counts/current_patients": 3,
+        "POST /api/v1/patients/register/complete": 3, "POST /api/v1/patients/register": 2,
+        "PUT /api/v1/patients/{patient_id}": 2, "POST /api/v1/xrays/classify": 4, "POST /api/v1/xrays/": 2,
+        "GET /api/v1/xrays/worklist": 3, "POST /api/v1/xrays/worklist/claim": 4, "PUT /api/v1/xrays/{scan_id}": 4,
+    },
+    # Radiologists working through the queue
+    "radiology": {
+        "GET /api/v1/xrays/worklist": 10, "POST /api/v1/xrays/worklist/claim": 20, "PUT /api/v1/xrays/{scan_id}": 20,
+        "GET /api/v1/xrays/unverified": 5, "GET /api/v1/xrays/classify/{scan_id}": 5,
+        "GET /api/v1/patients/{patient_id}/scans": 5, "POST /api/v1/xrays/classify": 10,
+    },
+    # Scan upload and classification bursts
+    "ingest": {
+        "POST /api/v1/xrays/classify": 40, "POST /api/v1/xrays/": 20, "POST /api/v1/patients/xray": 10,
+        "GET /api/v1/xrays/classify_url/": 10, "DELETE /api/v1/xrays/delete/{scan_id}": 5,
+    },
+    # Every operation equally, to cover all routers
+    "all_routes": {name: 1 for name in OPERATIONS},
+}
@@ -0,0 +1,35 @@
+"""
+Latency and error statistics per route, shared by the load test and replay
+reports. Percentiles are nearest-rank over every recorded request.
+"""
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.client_errors = 0
+        self.server_errors = 0
+
+    def record(self, seconds: float, status: int):
+        self.latencies.append(seconds * 1000)
+        if status >= 500:
+            self.server_errors += 1
+        elif status >= 400:
+            self.client_errors += 1
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "requests": len(latencies),
+            "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "4xx": self.client_errors,
+            "5xx": self.server_errors,
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p90_ms": round(percentile(latencies, 0.90), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "max_ms": round(latencies[-1], 2) if latencies else 0.0
+        }
@@ -1,19 +1,54 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routes import user_routes, disease_routes, patient_routes, xray_routes
-from app.config.firebase_config import init_firebase
+from app.routes import user_routes, disease_routes, patient_routes, xray_routes, system_routes, event_routes, metrics_routes
+from app.core.context import AppContext
+from app.core.middleware import (
+    UnitOfWorkMiddleware, SingleFlightMiddleware, ResponseCacheMiddleware, ETagMiddleware, RequestCostMiddleware,
+    MetricsMiddleware, ProfilerMiddleware, CaptureMiddleware, PROFILING_ENABLED, CAPTURE_ENABLED
+)
 
-# Initialize Firebase
-init_firebase()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build one shared context (storage backend, caches, services) per worker process
+    app.state.context = AppContext()
+    app.state.context.start()
+    try:
+        yield
+    finally:
+        app.state.context.close()
 
 # Create FastAPI app
 app = FastAPI(
     title="Xspand Medical System API",
     description="API for managing doctors, radiologists, patients, and diseases",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Opt-in request profiling, innermost so the profile holds only this request's work
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilerMiddleware)
+# One unit of work (identity map + batched writes) per request
+app.add_middleware(UnitOfWorkMiddleware)
+# Identical concurrent GETs share one execution (inside the response cache, outside the unit of work, so followers skip the Firestore work)
+app.add_middleware(SingleFlightMiddleware)
+# Aggregate endpoints served from memory, refreshed in the background when stale
+app.add_middleware(ResponseCacheMiddleware)
+# Strong ETags and If-None-Match on every buffered GET response, cached ones included
+app.add_middleware(ETagMiddleware)
+# Firestore cost per request, N+1 warnings (outside the unit of work so its flush is counted)
+app.add_middleware(RequestCostMiddleware)
+# Request latency and in-flight metrics, outermost so cached and coalesced responses count too
+app.add_middleware(MetricsMiddleware)
+# Opt-in traffic capture for replay, outermost so it times what clients see
+if CAPTURE_ENABLED:
+    app.add_middleware(CaptureMiddleware)
+
 # Include routers
 app.include_router(user_routes.router, prefix="/api/v1", tags=["users"])
 app.include_router(disease_routes.router, prefix="/api/v1", tags=["diseases"])
 app.include_router(patient_routes.router, prefix="/api/v1/patients", tags=["patients"])
 app.include_router(xray_routes.router, prefix="/api/v1/xrays", tags=["X-Ray Scans"])
+app.include_router(system_routes.router, prefix="/api/v1/system", tags=["system"])
+app.include_router(event_routes.router, prefix="/api/v1", tags=["events"])
+app.include_router(metrics_routes.router, tags=["system"])
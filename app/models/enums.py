@@ -18,3 +18,8 @@ class SeverityLevel(int, Enum):
     moderate = 2
     severe = 3
     critical = 4
+
+class Verify_status(str, Enum):
+    empty = "Empty"
+    unverified = "Unverified"
+    verified = "Verified"
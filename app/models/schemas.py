@@ -17,6 +17,17 @@ class Radiologist(User):
     full_name: str
     specialization: str
 
+class StaffRegistration(BaseModel):
+    email: str
+    # Optional: accounts without one sign in after a password reset
+    password: Optional[str] = None
+    role: UserRole
+    full_name: str
+    specialization: str
+
+class BulkStaffRegistration(BaseModel):
+    users: List[StaffRegistration]
+
 class Patient(BaseModel):
     patient_id: str
     full_name: str
@@ -56,6 +67,7 @@ class Disease(BaseModel):
     severity_level: SeverityLevel
     common_symptoms: List[str]
     treatment_methods: List[str]
+    aliases: List[str] = []
 
 class Admin(User):
     admin_id: str
@@ -67,6 +79,7 @@ class XRayScan(BaseModel):
     doctor_id: str
     radiologist_id: Optional[str] = None
     disease_id: Optional[str] = None
+    disease_ids: Optional[List[str]] = None
     ai_classification: Optional[str] = None
     no_findings_detected: Optional[bool] = None
     radiologist_report: Optional[str] = None
@@ -82,3 +95,14 @@ class DoctorPatientRelation(BaseModel):
     treatment_end_date: Optional[str]
     diagnosed_with_disease: bool
     diagnosed_disease_id: Optional[str]
+
+class PageRequest(BaseModel):
+    page_size: Optional[int] = None
+    cursor: Optional[str] = None
+    order_by: Optional[str] = None
+    fields: Optional[List[str]] = None
+    changed_since: Optional[str] = None
+
+    @property
+    def paginated(self) -> bool:
+        return self.page_size is not None or self.cursor is not None
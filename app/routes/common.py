@@ -0,0 +1,55 @@
+from fastapi import Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional, AsyncIterator
+import json
+import logging
+from app.models.schemas import PageRequest
+from app.database.pagination import MAX_PAGE_SIZE
+from app.database.versioning import parse_changed_since
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def page_request(
+    page_size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order_by: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return"),
+    changed_since: Optional[str] = Query(None, description="Only documents updated after this ISO timestamp")
+) -> PageRequest:
+    """
+    Shared list parameters. Without page_size or cursor the whole collection
+    is returned; otherwise one page plus a next_cursor for the following one.
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    since = parse_changed_since(changed_since) if changed_since else None
+    return PageRequest(page_size=page_size, cursor=cursor, order_by=order_by, fields=field_list, changed_since=since)
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def ndjson_response(documents: AsyncIterator[dict]) -> StreamingResponse:
+    """
+    Stream documents one JSON object per line. Each line is sent before the
+    next document is pulled, so a slow client slows the Firestore read down
+    instead of making the worker buffer the collection.
+
+    The 200 status goes out with the first line, so a read failing midway
+    ends the stream with a final {"error": "..."} line; a stream without one
+    is complete.
+    """
+    async def body():
+        try:
+            async for document in documents:
+                yield json.dumps(document, default=str) + "\n"
+        except Exception as e:
+            message = getattr(e, "detail", None) or str(e) or type(e).__name__
+            logger.error("NDJSON stream aborted: %s", message)
+            yield json.dumps({"error": message}) + "\n"
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
@@ -1,12 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from app.services.disease_service import DiseaseService
-from app.models.schemas import Disease
-from app.database.firebase import FirebaseDB
+from app.models.schemas import Disease, PageRequest
+from app.routes.common import page_request, set_next_cursor, wants_ndjson, ndjson_response
 
 router = APIRouter()
 
-def get_disease_service():
-    return DiseaseService(FirebaseDB())
+def get_disease_service(request: Request):
+    return request.app.state.context.disease_service
 
 @router.post("/diseases")
 async def add_disease(disease: Disease, service: DiseaseService = Depends(get_disease_service)):
@@ -21,8 +21,17 @@ async def delete_disease(disease_id: str, service: DiseaseService = Depends(get_
     return await service.delete_disease(disease_id)
 
 @router.get("/diseases")
-async def get_all_diseases(service: DiseaseService = Depends(get_disease_service)):
-    return await service.get_all_diseases()
+async def get_all_diseases(
+    request: Request,
+    response: Response,
+    page: PageRequest = Depends(page_request),
+    service: DiseaseService = Depends(get_disease_service)
+):
+    if wants_ndjson(request):
+        return ndjson_response(service.stream_diseases(page.fields, page.changed_since))
+    result = await service.get_all_diseases(page)
+    set_next_cursor(response, result["next_cursor"])
+    return result
 
 @router.get("/diseases/{disease_id}")
 async def get_disease(disease_id: str, service: DiseaseService = Depends(get_disease_service)):
@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import asyncio
+import json
+from app.core.events import EventBus, UNVERIFIED_TOPIC
+
+router = APIRouter()
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# Comment lines sent while idle so proxies don't close the connection
+HEARTBEAT_SECONDS = 15
+# Client reconnect delay sent in the stream's retry field
+RETRY_MILLISECONDS = 3000
+
+def get_event_bus(request: Request):
+    return request.app.state.context.events
+
+def _validate_topic(topic: str) -> str:
+    kind, _, key = topic.partition(":")
+    if topic == UNVERIFIED_TOPIC or (kind in ("patient", "doctor") and key):
+        return topic
+    raise HTTPException(status_code=400, detail=f"Unknown topic {topic}; use patient:<id>, doctor:<id> or {UNVERIFIED_TOPIC}")
+
+def _format(event) -> str:
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data, default=str)}\n\n"
+
+@router.get("/events")
+async def stream_events(
+    topic: List[str] = Query([], description="patient:<id>, doctor:<id> or unverified; repeat for several, omit for all"),
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    bus: EventBus = Depends(get_event_bus)
+):
+    """
+    Server-Sent Events feed of scan and patient changes. Reconnect with the
+    Last-Event-ID header (browsers do this automatically) to receive the
+    events missed meanwhile; a "resync" event means they are no longer
+    available and the client should reload its data.
+    """
+    topics = [_validate_topic(t) for t in topic]
+    subscription, replay = bus.subscribe(topics, last_event_id_header or last_event_id)
+
+    async def body():
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            if replay is None:
+                yield "event: resync\ndata: {}\n\n"
+            else:
+                for event in replay:
+                    yield _format(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if subscription.overflowed:
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _format(event)
+                if subscription.overflowed and subscription.queue.empty():
+                    # Fell behind: end the stream, the client resumes from the history
+                    return
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        body(),
+        media_type=SSE_MEDIA_TYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from app.core.metrics import REGISTRY, CONTENT_TYPE
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus metrics for this worker process
+    """
+    return Response(content=REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import Optional
 from app.services.patient_service import PatientService
-from app.models.schemas import Patient, SimplePatientRegistration, CompletePatientRegistration, XRayScan
+from app.models.schemas import Patient, SimplePatientRegistration, CompletePatientRegistration, XRayScan, PageRequest
 from app.models.enums import TreatmentStatus
-from app.database.firebase import FirebaseDB
+from app.routes.common import page_request, set_next_cursor, wants_ndjson, ndjson_response
+from app.services.bulk_import import IMPORT_FORMATS, detect_format, parse_rows
 
 router = APIRouter()
 
-def get_patient_service():
-    return PatientService(FirebaseDB())
+def get_patient_service(request: Request):
+    return request.app.state.context.patient_service
 
 @router.post("/register")
 async def add_new_patient(registration: SimplePatientRegistration, service: PatientService = Depends(get_patient_service)):
@@ -24,9 +26,33 @@ async def register_complete_patient(
     """
     return await patient_service.register_complete_patient(registration)
 
+@router.post("/import")
+async def import_patients(
+    request: Request,
+    format: Optional[str] = Query(None, description="csv or ndjson; taken from Content-Type if omitted"),
+    import_id: Optional[str] = Query(None, description="Resume this import from its last checkpoint"),
+    service: PatientService = Depends(get_patient_service)
+):
+    """
+    Register many patients from a CSV (header row first) or NDJSON body with
+    the fields of /register/complete. The body is parsed as it is uploaded.
+    Returns counts and the rows that were skipped or failed; re-send the same
+    file with the returned import_id to resume an interrupted import.
+    """
+    format = format or detect_format(content_type=request.headers.get("content-type"))
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Send text/csv or application/x-ndjson, or pass format=csv|ndjson")
+    return await service.import_patients(parse_rows(request.stream(), format), import_id)
+
 @router.get("/status")
-async def get_all_patients_status(service: PatientService = Depends(get_patient_service)):
-    return await service.get_all_patients_status()
+async def get_all_patients_status(
+    response: Response,
+    page: PageRequest = Depends(page_request),
+    service: PatientService = Depends(get_patient_service)
+):
+    result = await service.get_all_patients_status(page)
+    set_next_cursor(response, result["next_cursor"])
+    return result
 
 @router.put("/{patient_id}")
 async def update_patient(patient_id: str, patient: dict, service: PatientService = Depends(get_patient_service)):
@@ -54,8 +80,17 @@ async def get_patient_complete_details(
     return await service.get_patient_complete_details(patient_id)
 
 @router.get("/")
-async def get_all_patients(service: PatientService = Depends(get_patient_service)):
-    return await service.get_all_patients()
+async def get_all_patients(
+    request: Request,
+    response: Response,
+    page: PageRequest = Depends(page_request),
+    service: PatientService = Depends(get_patient_service)
+):
+    if wants_ndjson(request):
+        return ndjson_response(service.stream_patients(page.fields, page.changed_since))
+    result = await service.get_all_patients(page)
+    set_next_cursor(response, result["next_cursor"])
+    return result
 
 
 
@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Request
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_system_stats(request: Request):
+    """
+    Per-process runtime statistics for this worker
+    """
+    return request.app.state.context.get_stats()
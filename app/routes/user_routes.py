@@ -1,12 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from app.services.user_service import UserService
-from app.models.schemas import Doctor, Radiologist, Patient
-from app.database.firebase import FirebaseDB
+from app.models.schemas import Doctor, Radiologist, Patient, PageRequest, BulkStaffRegistration
+from app.routes.common import page_request, set_next_cursor, wants_ndjson, ndjson_response
 
 router = APIRouter()
 
-def get_user_service():
-    return UserService(FirebaseDB())
+def get_user_service(request: Request):
+    return request.app.state.context.user_service
 
 # Doctor routes
 @router.post("/register/doctor")
@@ -22,13 +22,31 @@ async def delete_doctor(doctor_id: str, service: UserService = Depends(get_user_
     return await service.delete_doctor(doctor_id)
 
 @router.get("/doctors")
-async def get_all_doctors(service: UserService = Depends(get_user_service)):
-    return await service.get_all_doctors()
+async def get_all_doctors(
+    request: Request,
+    response: Response,
+    page: PageRequest = Depends(page_request),
+    service: UserService = Depends(get_user_service)
+):
+    if wants_ndjson(request):
+        return ndjson_response(service.stream_doctors(page.fields, page.changed_since))
+    result = await service.get_all_doctors(page)
+    set_next_cursor(response, result["next_cursor"])
+    return result
 
 @router.get("/doctors/{doctor_id}")
 async def get_doctor(doctor_id: str, service: UserService = Depends(get_user_service)):
     return await service.get_doctor(doctor_id)
 
+# Bulk onboarding of doctors and radiologists
+@router.post("/register/staff")
+async def register_staff(registration: BulkStaffRegistration, service: UserService = Depends(get_user_service)):
+    """
+    Register many doctors and radiologists in one call. Each user gets a
+    status (created, skipped or failed) in the results, in request order.
+    """
+    return await service.register_staff(registration)
+
 # Radiologist routes
 @router.post("/register/radiologist")
 async def register_radiologist(radiologist: Radiologist, service: UserService = Depends(get_user_service)):
@@ -43,8 +61,17 @@ async def delete_radiologist(radiologist_id: str, service: UserService = Depends
     return await service.delete_radiologist(radiologist_id)
 
 @router.get("/radiologists")
-async def get_all_radiologists(service: UserService = Depends(get_user_service)):
-    return await service.get_all_radiologists()
+async def get_all_radiologists(
+    request: Request,
+    response: Response,
+    page: PageRequest = Depends(page_request),
+    service: UserService = Depends(get_user_service)
+):
+    if wants_ndjson(request):
+        return ndjson_response(service.stream_radiologists(page.fields, page.changed_since))
+    result = await service.get_all_radiologists(page)
+    set_next_cursor(response, result["next_cursor"])
+    return result
 
 @router.get("/radiologists/{radiologist_id}")
 async def get_radiologist(radiologist_id: str, service: UserService = Depends(get_user_service)):
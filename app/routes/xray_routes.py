@@ -1,16 +1,19 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 from app.services.xray_service import XRayService
-from app.models.schemas import XRayScan
-from app.database.firebase import FirebaseDB
+from app.services.worklist_service import WorklistService, LEASE_SECONDS, MAX_LEASE_SECONDS
+from app.models.schemas import XRayScan, PageRequest
+from app.routes.common import page_request, set_next_cursor, wants_ndjson, ndjson_response
 from typing import List, Dict
 
 router = APIRouter(
     tags=["X-Ray Scans"]
 )
 
-def get_xray_service():
-    db = FirebaseDB()
-    return XRayService(db)
+def get_xray_service(request: Request):
+    return request.app.state.context.xray_service
+
+def get_worklist_service(request: Request):
+    return request.app.state.context.worklist_service
 
 @router.post("/")
 async def add_xray_scan(
@@ -45,12 +48,21 @@ async def update_xray_scan(
 
 @router.get("/")
 async def get_all_xrays(
+    request: Request,
+    response: Response,
+    page: PageRequest = Depends(page_request),
     service: XRayService = Depends(get_xray_service)
-) -> List[dict]:
+):
     """
-    Get all X-ray scans
+    Get all X-ray scans. With page_size/cursor a single page is returned with
+    the cursor for the next page in next_cursor, as on the other list endpoints.
+    Send Accept: application/x-ndjson to stream the whole collection instead.
     """
-    return await service.get_all_xrays()
+    if wants_ndjson(request):
+        return ndjson_response(service.stream_xrays(page.fields, page.changed_since))
+    result = await service.get_all_xrays(page)
+    set_next_cursor(response, result["next_cursor"])
+    return result
 
 @router.get("/unverified")
 async def get_unverified_xrays(
@@ -61,6 +73,52 @@ async def get_unverified_xrays(
     """
     return await service.get_unverified_xrays()
 
+@router.get("/worklist")
+async def get_worklist(
+    limit: int = Query(20, ge=1, le=500),
+    service: WorklistService = Depends(get_worklist_service)
+) -> List[dict]:
+    """
+    The next unclaimed unverified scans in priority order (AI confidence,
+    disease severity, age), without claiming them
+    """
+    return await service.peek(limit)
+
+@router.post("/worklist/claim")
+async def claim_worklist_scan(
+    radiologist_id: str,
+    lease_seconds: float = Query(LEASE_SECONDS, gt=0, le=MAX_LEASE_SECONDS),
+    service: WorklistService = Depends(get_worklist_service)
+):
+    """
+    Lease the highest-priority unclaimed scan to a radiologist. The lease
+    expires after lease_seconds unless renewed.
+    """
+    return await service.claim_next(radiologist_id, lease_seconds)
+
+@router.post("/worklist/{scan_id}/renew")
+async def renew_worklist_lease(
+    scan_id: str,
+    radiologist_id: str,
+    lease_seconds: float = Query(LEASE_SECONDS, gt=0, le=MAX_LEASE_SECONDS),
+    service: WorklistService = Depends(get_worklist_service)
+):
+    """
+    Extend a running lease
+    """
+    return await service.renew(scan_id, radiologist_id, lease_seconds)
+
+@router.post("/worklist/{scan_id}/release")
+async def release_worklist_lease(
+    scan_id: str,
+    radiologist_id: str,
+    service: WorklistService = Depends(get_worklist_service)
+):
+    """
+    Give a claimed scan back to the worklist
+    """
+    return await service.release(scan_id, radiologist_id)
+
 @router.get("/classify/{scan_id}")
 async def classify_xray(
     scan_id: str,
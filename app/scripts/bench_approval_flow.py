@@ -0,0 +1,90 @@
+"""
+Compare the old sequential AI approval flow with the single-transaction one.
+
+    python -m app.scripts.bench_approval_flow [--runs 50] [--latency-ms 5]
+
+Runs against the in-memory backend with a simulated per-round-trip latency
+and reports round trips and latency (mean/p50/p95) for each flow.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from app.database.storage import create_local_database
+from app.models.enums import TreatmentStatus
+
+DISEASE = {"disease_id": "D1", "disease_name": "Pneumonia"}
+
+def seed(client, runs: int):
+    client.collection("diseases").document(DISEASE["disease_id"]).set(DISEASE)
+    for i in range(runs):
+        patient_id, doctor_id = f"P{i}", f"DR{i}"
+        client.collection("xray_scans").document(f"S{i}").set({
+            "scan_id": f"S{i}", "patient_id": patient_id, "doctor_id": doctor_id,
+            "image_url": "", "scan_timestamp": "2024-01-01T00:00:00", "radiologist_id": None
+        })
+        client.collection("doctor_patient_relations").document(f"{doctor_id}_{patient_id}").set({
+            "doctor_id": doctor_id, "patient_id": patient_id,
+            "treatment_status": TreatmentStatus.ongoing.value, "diagnosed_with_disease": False
+        })
+        client.collection("patient_scan_status").document(patient_id).set({
+            "patient_id": patient_id, "status": "unverified", "scan_count": 1,
+            "verified_count": 0, "latest_scan_timestamp": "2024-01-01T00:00:00"
+        })
+
+def legacy_flow(client, scan_id: str, update_data: dict) -> dict:
+    # The pre-transaction sequence: every step is its own round trip
+    disease = next(client.collection("diseases").where("disease_name", "==", DISEASE["disease_name"]).stream()).to_dict()
+    update_data["disease_id"] = disease["disease_id"]
+    scan = client.collection("xray_scans").document(scan_id).get().to_dict()
+    relation_ref = client.collection("doctor_patient_relations").document(f"{scan['doctor_id']}_{scan['patient_id']}")
+    relation = relation_ref.get().to_dict()
+    if relation.get("treatment_status") == TreatmentStatus.ongoing:
+        relation_ref.get()
+        relation_ref.update({"diagnosed_disease_id": update_data["disease_id"], "diagnosed_with_disease": True})
+    scan_ref = client.collection("xray_scans").document(scan_id)
+    scan_ref.get()
+    scan_ref.update(update_data)
+    return scan_ref.get().to_dict()
+
+async def transactional_flow(db, scan_id: str, update_data: dict) -> dict:
+    disease = (await db.find_documents("diseases", "disease_name", DISEASE["disease_name"]))[0]
+    update_data["disease_id"] = disease["disease_id"]
+    return await db.update_scan_diagnosis(scan_id, update_data)
+
+def report(name: str, timings: list, round_trips: int):
+    timings = sorted(timings)
+    runs = len(timings)
+    print(
+        f"{name:<14} round trips/op {round_trips / runs:5.1f}  "
+        f"mean {statistics.mean(timings):7.2f} ms  "
+        f"p50 {timings[runs // 2]:7.2f} ms  "
+        f"p95 {timings[min(runs - 1, int(runs * 0.95))]:7.2f} ms"
+    )
+
+async def run(runs: int, latency_ms: float):
+    for name in ("legacy", "transactional"):
+        db = create_local_database("memory", latency_ms=latency_ms)
+        seed(db.db, runs)
+        db.db.round_trips = 0
+        timings = []
+        for i in range(runs):
+            update_data = {"ai_approved": True, "radiologist_id": "R1", "disease_name": DISEASE["disease_name"]}
+            started = time.perf_counter()
+            if name == "legacy":
+                legacy_flow(db.db, f"S{i}", update_data)
+            else:
+                await transactional_flow(db, f"S{i}", update_data)
+            timings.append((time.perf_counter() - started) * 1000)
+        report(name, timings, db.db.round_trips)
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AI approval flow")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Simulated latency per round trip")
+    args = parser.parse_args()
+    asyncio.run(run(args.runs, args.latency_ms))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Export collections as columnar files for offline analytics.
+
+    python -m app.scripts.export_collections [exports] [--collections xray_scans ...]
+        [--format parquet|arrow] [--full] [--verify]
+
+Writes one Parquet (or Arrow IPC) file per collection and run under the
+output directory, with manifest.json listing every file's rows and
+SHA-256. After the first run only documents changed since the previous one
+are exported; --full forces a complete snapshot. --verify re-checks the
+files against the manifest instead of exporting, and exits 1 on a
+mismatch. Needs pyarrow. Uses the storage backend selected by
+XSPAND_STORAGE_BACKEND.
+"""
+import argparse
+import asyncio
+import sys
+from app.database.columnar_export import EXPORT_FORMATS, EXPORT_MODELS, export_collections, require_pyarrow, verify_manifest
+from app.database.storage import create_database
+
+def main():
+    parser = argparse.ArgumentParser(description="Export collections as Parquet or Arrow files")
+    parser.add_argument("directory", nargs="?", default="exports", help="Output directory, holding manifest.json")
+    parser.add_argument("--collections", nargs="+", choices=list(EXPORT_MODELS), help="Defaults to all of them")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="parquet")
+    parser.add_argument("--full", action="store_true", help="Export everything, not just changes since the last run")
+    parser.add_argument("--verify", action="store_true", help="Check the files against the manifest and exit")
+    args = parser.parse_args()
+
+    if args.verify:
+        problems = verify_manifest(args.directory)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(1)
+        print("All files match the manifest")
+        return
+
+    try:
+        require_pyarrow()
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    db = create_database()
+    try:
+        run = asyncio.run(export_collections(db, args.directory, args.collections, args.format, args.full))
+    finally:
+        db.close()
+
+    for entry in run["files"]:
+        since = f" changed since {entry['changed_since']}" if entry["changed_since"] else ""
+        print(f"{entry['collection']}: {entry['rows']} rows{since} -> {entry['path'] or 'no file'}")
+        for column, count in sorted(entry["invalid_values"].items()):
+            print(f"  {count} values of {column} didn't fit the column and were written as null")
+
+if __name__ == "__main__":
+    main()
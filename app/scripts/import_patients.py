@@ -0,0 +1,54 @@
+"""
+Register patients in bulk from a CSV or NDJSON file.
+
+    python -m app.scripts.import_patients patients.csv [--format csv|ndjson]
+        [--import-id hospital-a] [--report report.json]
+
+Rows carry the fields of POST /patients/register/complete. The file is
+streamed, checked against existing patients and relations with batched
+reads and written in batched commits. Progress is checkpointed under the
+import ID (the file name by default): running the same command again after
+an interruption resumes where it stopped. Uses the storage backend selected
+by XSPAND_STORAGE_BACKEND.
+"""
+import argparse
+import asyncio
+import json
+import os
+from app.database.storage import create_database
+from app.services.bulk_import import IMPORT_FORMATS, detect_format, file_chunks, parse_rows
+from app.services.patient_service import PatientService
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import patients and their doctor relations")
+    parser.add_argument("file", help="CSV (with a header row) or NDJSON file")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Taken from the file extension if omitted")
+    parser.add_argument("--import-id", help="Checkpoint name; defaults to the file name")
+    parser.add_argument("--report", help="Write the full per-row report as JSON to this file")
+    args = parser.parse_args()
+
+    format = args.format or detect_format(filename=args.file)
+    if format is None:
+        parser.error("can't tell the format from the file name, pass --format")
+    import_id = args.import_id or os.path.basename(args.file)
+
+    db = create_database()
+    try:
+        service = PatientService(db)
+        report = asyncio.run(service.import_patients(parse_rows(file_chunks(args.file), format), import_id))
+    finally:
+        db.close()
+
+    if report["resumed_from"]:
+        print(f"Resumed import {import_id} after row {report['resumed_from']}")
+    print(f"{report['imported']} imported, {report['skipped']} skipped, {report['failed']} failed ({report['rows_done']} rows)")
+    for error in report["errors"][:20]:
+        print(f"  row {error['row']} ({error['id']}): {error['error']}")
+    if len(report["errors"]) > 20:
+        print(f"  ... {len(report['errors']) - 20} more errors")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
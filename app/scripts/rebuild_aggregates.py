@@ -0,0 +1,30 @@
+"""
+Recompute materialized aggregates from the source collections.
+
+    python -m app.scripts.rebuild_aggregates [--only disease-counts|patient-status]
+
+Run once after deploying a new aggregate, or whenever one is suspected to
+have drifted. Uses the storage backend selected by XSPAND_STORAGE_BACKEND.
+"""
+import argparse
+from app.database.aggregates import rebuild_disease_counts, rebuild_patient_status
+from app.database.storage import create_database
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild materialized aggregates")
+    parser.add_argument("--only", choices=["disease-counts", "patient-status"], help="Rebuild a single aggregate")
+    args = parser.parse_args()
+
+    db = create_database()
+    try:
+        if args.only in (None, "disease-counts"):
+            written = rebuild_disease_counts(db.db)
+            print(f"Disease patient counts rebuilt for {written} diseases")
+        if args.only in (None, "patient-status"):
+            written = rebuild_patient_status(db.db)
+            print(f"Scan status rebuilt for {written} patients")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Streaming bulk imports.
+
+Rows are parsed from CSV (header line first) or NDJSON as the bytes
+arrive, validated and grouped into chunks. Up to IMPORT_CONCURRENCY chunks
+are processed at once, each with batched reads and one batched commit; the
+parser waits while they are busy, so memory stays bounded whatever the
+file size. Rows are numbered from 1 (CSV header and blank lines not
+counted).
+
+Progress is checkpointed after every chunk. rows_done only advances over
+the chunks finished in order, so a resumed import restarts right after
+the last row known to be handled, and the counts saved with it cover
+exactly those rows.
+"""
+import asyncio
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "ndjson")
+# Rows per chunk; one chunk is one set of get_all reads and one batched commit
+IMPORT_CHUNK_ROWS = int(os.getenv("XSPAND_IMPORT_CHUNK_ROWS", "150"))
+# Chunks processed at the same time
+IMPORT_CONCURRENCY = int(os.getenv("XSPAND_IMPORT_CONCURRENCY", "4"))
+FILE_READ_BYTES = 64 * 1024
+
+def detect_format(filename: str = None, content_type: str = None):
+    """
+    csv or ndjson from a file extension or Content-Type; None if neither says.
+    """
+    if filename:
+        extension = os.path.splitext(filename)[1].lower()
+        if extension == ".csv":
+            return "csv"
+        if extension in (".ndjson", ".jsonl"):
+            return "ndjson"
+    if content_type:
+        media_type = content_type.split(";")[0].strip().lower()
+        if media_type == "text/csv":
+            return "csv"
+        if media_type in ("application/x-ndjson", "application/jsonl"):
+            return "ndjson"
+    return None
+
+async def iter_lines(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.removesuffix("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.removesuffix("\r")
+
+async def _parse_ndjson(chunks):
+    row_number = 0
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            yield row_number, ValueError(f"Invalid JSON: {e}")
+            continue
+        yield row_number, row
+
+async def _parse_csv(chunks):
+    header, record, row_number = None, [], 0
+    async for line in iter_lines(chunks):
+        record.append(line)
+        # A quoted field may span lines; quotes are balanced once the record is complete
+        text = "\n".join(record)
+        if text.count('"') % 2:
+            continue
+        record = []
+        if not text.strip():
+            continue
+        values = next(csv.reader(io.StringIO(text)))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        # Empty cells are left out so the model's own defaults and required checks apply
+        yield row_number, {name: value for name, value in zip(header, values) if value != ""}
+    if record:
+        yield row_number + 1, ValueError("Unterminated quoted field")
+
+def parse_rows(chunks, format: str):
+    """
+    (row_number, row dict or the ValueError that made it unreadable) for
+    each row of an async iterable of bytes.
+    """
+    if format == "csv":
+        return _parse_csv(chunks)
+    if format == "ndjson":
+        return _parse_ndjson(chunks)
+    raise ValueError(f"Unknown import format: {format}")
+
+async def file_chunks(path: str, size: int = FILE_READ_BYTES):
+    """
+    The bytes of a local file, read in the thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    with open(path, "rb") as f:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, size)
+            if not chunk:
+                return
+            yield chunk
+
+def validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+
+class ImportChunk:
+    """
+    Consecutive rows processed together, and what happened to each.
+    """
+    def __init__(self, first_row: int):
+        self.first_row = first_row
+        self.last_row = first_row
+        # (row_number, validated item) for the chunk handler
+        self.rows = []
+        self.imported_rows = []
+        self.skipped = []
+        self.errors = []
+        self.done = False
+
+    @property
+    def imported(self) -> int:
+        return len(self.imported_rows)
+
+    def succeed(self, row_number: int):
+        self.imported_rows.append(row_number)
+
+    def skip(self, row_number: int, item_id: str, reason: str):
+        self.skipped.append({"row": row_number, "id": item_id, "reason": reason})
+
+    def fail(self, row_number: int, item_id: str, error: str):
+        self.errors.append({"row": row_number, "id": item_id, "error": error})
+
+class ImportProgress:
+    def __init__(self, import_id: str, kind: str, saved: dict = None):
+        saved = saved or {}
+        self.import_id = import_id
+        self.kind = kind
+        self.status = "running"
+        self.rows_done = saved.get("rows_done", 0)
+        self.resumed_from = self.rows_done
+        self.imported = saved.get("imported", 0)
+        self.skipped = saved.get("skipped", 0)
+        self.failed = saved.get("failed", 0)
+        self.started_at = saved.get("started_at") or datetime.now().isoformat()
+        # Per-row outcomes of this run
+        self.skipped_rows = []
+        self.errors = []
+        self._chunks = deque()
+
+    def start(self, chunk: ImportChunk):
+        self._chunks.append(chunk)
+
+    def finish(self, chunk: ImportChunk):
+        chunk.done = True
+        while self._chunks and self._chunks[0].done:
+            finished = self._chunks.popleft()
+            self.rows_done = finished.last_row
+            self.imported += finished.imported
+            self.skipped += len(finished.skipped)
+            self.failed += len(finished.errors)
+            self.skipped_rows.extend(finished.skipped)
+            self.errors.extend(finished.errors)
+
+    def to_document(self) -> dict:
+        return {
+            "import_id": self.import_id,
+            "kind": self.kind,
+            "status": self.status,
+            "rows_done": self.rows_done,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "started_at": self.started_at
+        }
+
+    def report(self) -> dict:
+        return dict(
+            self.to_document(),
+            resumed_from=self.resumed_from,
+            skipped_rows=sorted(self.skipped_rows, key=lambda row: row["row"]),
+            errors=sorted(self.errors, key=lambda row: row["row"])
+        )
+
+async def run_import(rows, progress: ImportProgress, validate, handle_chunk, save_progress, id_field: str,
+                     chunk_rows: int = IMPORT_CHUNK_ROWS, concurrency: int = IMPORT_CONCURRENCY) -> dict:
+    """
+    Drive an import: validate(row) returns the item or raises ValueError
+    (pydantic's ValidationError included); handle_chunk(chunk) processes
+    chunk.rows and records each outcome on the chunk; save_progress(document)
+    persists the checkpoint. Rows up to progress.rows_done are skipped, and
+    id_field names the row field shown in the per-row report. Returns the
+    report.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+    start_row = progress.rows_done
+    last_row = start_row
+
+    async def process(chunk: ImportChunk):
+        try:
+            if chunk.rows:
+                await handle_chunk(chunk)
+        except Exception as e:
+            # Rows without an outcome yet failed with the chunk
+            handled = set(chunk.imported_rows) | {row["row"] for row in chunk.skipped + chunk.errors}
+            for row_number, item in chunk.rows:
+                if row_number not in handled:
+                    chunk.fail(row_number, None, getattr(e, "detail", None) or str(e))
+        finally:
+            progress.finish(chunk)
+            semaphore.release()
+        await save_progress(progress.to_document())
+
+    async def dispatch(chunk: ImportChunk):
+        await semaphore.acquire()
+        progress.start(chunk)
+        task = asyncio.ensure_future(process(chunk))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    chunk = None
+    try:
+        async for row_number, row in rows:
+            if row_number <= start_row:
+                continue
+            last_row = row_number
+            if chunk is None:
+                chunk = ImportChunk(row_number)
+            chunk.last_row = row_number
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                chunk.rows.append((row_number, validate(row)))
+            except ValidationError as e:
+                chunk.fail(row_number, row.get(id_field), validation_message(e))
+            except ValueError as e:
+                chunk.fail(row_number, row.get(id_field) if isinstance(row, dict) else None, str(e))
+            if chunk.last_row - chunk.first_row + 1 >= chunk_rows:
+                await dispatch(chunk)
+                chunk = None
+        if chunk is not None:
+            await dispatch(chunk)
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        progress.status = "interrupted"
+        try:
+            await save_progress(progress.to_document())
+        except Exception as e:
+            logger.warning("Could not checkpoint interrupted import %s: %s", progress.import_id, e)
+        raise
+
+    progress.status = "completed"
+    progress.rows_done = max(progress.rows_done, last_row)
+    await save_progress(progress.to_document())
+    return progress.report()
@@ -0,0 +1,124 @@
+import logging
+import os
+import re
+import time
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# How long an index built without a live reference cache is trusted
+INDEX_TTL_SECONDS = float(os.getenv("XSPAND_DISEASE_INDEX_TTL_SECONDS", "60"))
+
+def normalize_label(label: str) -> str:
+    """
+    "Pleural_Thickening", "pleural-thickening " and "Pleural Thickening" all
+    normalise to "pleural thickening".
+    """
+    return re.sub(r"[\s_\-]+", " ", str(label)).strip().lower()
+
+def split_labels(labels) -> list:
+    """
+    Classifier output ("Effusion, Infiltration") or a list of labels.
+    """
+    if isinstance(labels, str):
+        labels = labels.split(",")
+    return [label.strip() for label in labels or [] if label and label.strip()]
+
+class DiseaseLabelIndex:
+    """
+    Maps classifier labels to disease documents. Keys are the normalised
+    disease_name and every entry of a disease's optional aliases list, so
+    each label resolves with one dict lookup.
+
+    The index is rebuilt lazily: when the reference cache's diseases version
+    moves on, or after INDEX_TTL_SECONDS if diseases aren't cached.
+    """
+    def __init__(self, db, class_labels=(), ttl: float = INDEX_TTL_SECONDS):
+        self.db = db
+        self.class_labels = list(class_labels)
+        self._class_keys = {normalize_label(label) for label in self.class_labels}
+        self._warned = set()
+        self.ttl = ttl
+        self._by_label = {}
+        self._version = None
+        self._built_at = 0.0
+        self.rebuilds = 0
+
+    async def resolve(self, labels) -> list:
+        """
+        Resolve one or more labels to their disease documents, in label order
+        and without duplicates. Raises 422 if there are no labels and 404
+        naming every unknown label. Unknown labels the classifier can predict
+        are also logged, once per index build, since no approval of them can
+        succeed until a disease or alias covers them.
+        """
+        labels = split_labels(labels)
+        if not labels:
+            raise HTTPException(status_code=422, detail="No disease label given")
+        await self._refresh()
+        diseases, unknown, seen = [], [], set()
+        for label in labels:
+            disease = self._by_label.get(normalize_label(label))
+            if disease is None:
+                unknown.append(label)
+            elif disease["disease_id"] not in seen:
+                seen.add(disease["disease_id"])
+                diseases.append(disease)
+        if unknown:
+            self._warn_unmapped(unknown)
+            raise HTTPException(
+                status_code=404,
+                detail=f"Disease with name {', '.join(unknown)} not found"
+            )
+        return diseases
+
+    async def resolve_ids(self, labels) -> list:
+        return [disease["disease_id"] for disease in await self.resolve(labels)]
+
+    def _warn_unmapped(self, labels: list):
+        unmapped = [
+            label for label in labels
+            if normalize_label(label) in self._class_keys and normalize_label(label) not in self._warned
+        ]
+        if unmapped:
+            self._warned.update(normalize_label(label) for label in unmapped)
+            logger.warning("Classifier labels %s match no disease name or alias", ", ".join(unmapped))
+
+    def unmapped_class_labels(self) -> list:
+        """
+        Classifier labels no disease name or alias covers yet.
+        """
+        return [label for label in self.class_labels if normalize_label(label) not in self._by_label]
+
+    async def _refresh(self):
+        cache = self.db.reference_cache
+        if cache is not None and cache.is_cached("diseases"):
+            if self._version == cache.version("diseases"):
+                return
+            version = cache.version("diseases")
+        elif self._version is None and time.time() - self._built_at < self.ttl:
+            return
+        else:
+            version = None
+
+        by_label = {}
+        for disease in await self.db.get_all_documents("diseases"):
+            if not disease.get("disease_id"):
+                continue
+            for name in [disease.get("disease_name")] + list(disease.get("aliases") or []):
+                if name:
+                    by_label.setdefault(normalize_label(name), disease)
+        # Swap in the finished index so concurrent resolves never see a partial one
+        self._by_label = by_label
+        self._warned = set()
+        self._version = version
+        self._built_at = time.time()
+        self.rebuilds += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "labels": len(self._by_label),
+            "rebuilds": self.rebuilds,
+            "version": self._version,
+            "unmapped_class_labels": self.unmapped_class_labels()
+        }
@@ -1,5 +1,6 @@
 from app.database.firebase import FirebaseDB
-from app.models.schemas import Disease
+from app.models.schemas import Disease, PageRequest
+from app.database.aggregates import DISEASE_COUNTS_COLLECTION
 import uuid
 
 class DiseaseService:
@@ -21,9 +22,12 @@ class DiseaseService:
         await self.db.delete_document("diseases", disease_id)
         return {"message": "Disease deleted successfully"}
 
-    async def get_all_diseases(self):
-        diseases = await self.db.get_all_documents("diseases")
-        return {"message": "Diseases retrieved successfully", "diseases": diseases}
+    async def get_all_diseases(self, page: PageRequest = None):
+        diseases, next_cursor = await self.db.list_documents("diseases", page)
+        return {"message": "Diseases retrieved successfully", "diseases": diseases, "next_cursor": next_cursor}
+
+    def stream_diseases(self, fields: list = None, changed_since: str = None):
+        return self.db.stream_documents("diseases", fields, changed_since)
 
     async def get_disease(self, disease_id: str):
         disease = await self.db.get_document("diseases", disease_id)
@@ -31,54 +35,31 @@ class DiseaseService:
     
     #for each disease find the no. of patients diagnosed with it
     async def get_all_disease_patient_counts(self):
-        try:
-            diseases = await self.db.get_all_documents("diseases")
-        except Exception as e:
-            return {"message": "Failed to retrieve diseases", "error": str(e), "function": "get_disease_patient_counts"}
-
-        try:
-            relations = await self.db.get_all_documents("doctor_patient_relations")
-        except Exception as e:
-            return {"message": "Failed to retrieve doctor-patient relations", "error": str(e), "function": "get_disease_patient_counts"}
-
-        disease_patient_counts = []
-        try:
-            for disease in diseases:
-                disease_id = disease.get("disease_id")
-                patient_count = sum(1 for r in relations if r.get("diagnosed_disease_id") == disease_id)
-                disease_patient_counts.append({
-                    "disease_id": disease_id,
-                    "disease_name": disease.get("disease_name"),
-                    "patient_count": patient_count
-                })
-        except Exception as e:
-            return {"message": "Failed to calculate disease patient counts", "error": str(e), "function": "get_disease_patient_counts"}
-
-        return {"message": "Disease patient counts retrieved successfully", "disease_patient_counts": disease_patient_counts, "function": "get_disease_patient_counts"}
-
+        return await self._disease_patient_counts("total_patients")
 
     async def get_disease_patient_counts(self):
+        return await self._disease_patient_counts("ongoing_patients")
+
+    async def _disease_patient_counts(self, count_field: str):
+        # Counters are maintained transactionally by FirebaseDB relation writes
         try:
             diseases = await self.db.get_all_documents("diseases")
         except Exception as e:
             return {"message": "Failed to retrieve diseases", "error": str(e), "function": "get_disease_patient_counts"}
 
         try:
-            relations = await self.db.get_all_documents("doctor_patient_relations")
+            counters = await self.db.get_all_documents(DISEASE_COUNTS_COLLECTION)
         except Exception as e:
-            return {"message": "Failed to retrieve doctor-patient relations", "error": str(e), "function": "get_disease_patient_counts"}
+            return {"message": "Failed to retrieve disease patient counters", "error": str(e), "function": "get_disease_patient_counts"}
 
-        disease_patient_counts = []
-        try:
-            for disease in diseases:
-                disease_id = disease.get("disease_id")
-                patient_count = sum(1 for r in relations if r.get("diagnosed_disease_id") == disease_id and r.get("treatment_status") == "Ongoing")
-                disease_patient_counts.append({
-                    "disease_id": disease_id,
-                    "disease_name": disease.get("disease_name"),
-                    "patient_count": patient_count
-                })
-        except Exception as e:
-            return {"message": "Failed to calculate disease patient counts", "error": str(e), "function": "get_disease_patient_counts"}
+        counts_by_disease = {counter.get("disease_id"): counter.get(count_field, 0) for counter in counters}
+        disease_patient_counts = [
+            {
+                "disease_id": disease.get("disease_id"),
+                "disease_name": disease.get("disease_name"),
+                "patient_count": counts_by_disease.get(disease.get("disease_id"), 0)
+            }
+            for disease in diseases
+        ]
 
         return {"message": "Disease patient counts retrieved successfully", "disease_patient_counts": disease_patient_counts, "function": "get_disease_patient_counts"}
@@ -0,0 +1,75 @@
+import asyncio
+import os
+from fastapi import HTTPException
+
+# Upper bound for a single fetch inside a composite read
+FETCH_TIMEOUT_SECONDS = float(os.getenv("XSPAND_FETCH_TIMEOUT_SECONDS", "10"))
+
+class ConcurrentLoader:
+    """
+    Runs named fetches concurrently. Each fetch is an async callable taking
+    the dict of results loaded so far and starts as soon as the fetches it
+    depends on have finished, so a composite read costs roughly its longest
+    dependency chain instead of the sum of every round trip.
+
+    A failing required fetch cancels the rest and its error is raised. An
+    optional fetch that fails (or times out) is recorded in errors, and
+    fetches depending on it are skipped.
+    """
+    def __init__(self, timeout: float = FETCH_TIMEOUT_SECONDS, max_concurrency: int = None):
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._fetches = {}
+        self.results = {}
+        self.errors = {}
+
+    def add(self, name: str, fetch, depends_on=(), required: bool = True, timeout: float = None):
+        if name in self._fetches:
+            raise ValueError(f"Fetch {name} already added")
+        self._fetches[name] = (fetch, tuple(depends_on), required, timeout or self.timeout)
+        return self
+
+    async def run(self) -> dict:
+        for name, (_, depends_on, _, _) in self._fetches.items():
+            for dependency in depends_on:
+                if dependency not in self._fetches:
+                    raise ValueError(f"Fetch {name} depends on unknown fetch {dependency}")
+
+        tasks = {}
+
+        async def run_one(name):
+            fetch, depends_on, required, timeout = self._fetches[name]
+            for dependency in depends_on:
+                await tasks[dependency]
+            if any(dependency in self.errors for dependency in depends_on):
+                self.errors[name] = HTTPException(status_code=424, detail=f"Skipped {name}: a dependency failed")
+                return
+            try:
+                if self._semaphore is None:
+                    value = await asyncio.wait_for(fetch(self.results), timeout)
+                else:
+                    async with self._semaphore:
+                        value = await asyncio.wait_for(fetch(self.results), timeout)
+            except asyncio.TimeoutError:
+                error = HTTPException(status_code=504, detail=f"Timed out loading {name}")
+                if required:
+                    raise error
+                self.errors[name] = error
+                return
+            except Exception as e:
+                if required:
+                    raise
+                self.errors[name] = e
+                return
+            self.results[name] = value
+
+        for name in self._fetches:
+            tasks[name] = asyncio.ensure_future(run_one(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return self.results
@@ -1,16 +1,27 @@
 from app.database.firebase import FirebaseDB
 from app.models.schemas import (
     Patient, PatientRegistration, DoctorPatientRelation, 
-    XRayScan, SimplePatientRegistration, CompletePatientRegistration
+    XRayScan, SimplePatientRegistration, CompletePatientRegistration, PageRequest
 )
 from app.models.enums import TreatmentStatus, Verify_status
+from app.database.aggregates import PATIENT_STATUS_COLLECTION, relation_disease_counts
+from app.database.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.loader import ConcurrentLoader
+from app.services.bulk_import import IMPORT_CHUNK_ROWS, ImportProgress, run_import
+from app.core.events import EventBus, doctor_topic, patient_topic, scan_topics
 from fastapi import HTTPException
 from datetime import datetime
 from typing import Optional
+import asyncio
+import uuid
+
+# A bulk import writes three documents per patient (patient, status summary, relation) in a batch of at most 500
+IMPORT_MAX_CHUNK_ROWS = 500 // 3
 
 class PatientService:
-    def __init__(self, db: FirebaseDB):
+    def __init__(self, db: FirebaseDB, events: EventBus = None):
         self.db = db
+        self.events = events
 
     async def add_new_patient(self, registration: SimplePatientRegistration):
         try:
@@ -30,7 +41,7 @@ class PatientService:
                     "patient_id": registration.patient_id,
                     "is_resident": registration.is_resident
                 }
-                await self.db.create_document("patients", registration.patient_id, patient_data)
+                await self.db.create_patient(registration.patient_id, patient_data)
 
             # Check if there's an existing ongoing relationship
             relation_id = f"{registration.doctor_id}_{registration.patient_id}"
@@ -59,7 +70,8 @@ class PatientService:
                 diagnosed_disease_id=None
             )
             
-            await self.db.create_document("doctor_patient_relations", relation_id, relation.dict())
+            await self.db.set_relation(relation_id, relation.dict())
+            self._publish_registration(registration.patient_id, registration.doctor_id, relation_id)
 
             if patient_exists:
                 return {
@@ -123,7 +135,7 @@ class PatientService:
                 "weight_kg": registration.weight_kg,
                 "gender": registration.gender
             }
-            await self.db.create_document("patients", registration.patient_id, patient_data)
+            await self.db.create_patient(registration.patient_id, patient_data)
 
             # Create doctor-patient relationship
             relation = DoctorPatientRelation(
@@ -136,7 +148,8 @@ class PatientService:
                 diagnosed_disease_id=None
             )
             
-            await self.db.create_document("doctor_patient_relations", relation_id, relation.dict())
+            await self.db.set_relation(relation_id, relation.dict())
+            self._publish_registration(registration.patient_id, registration.doctor_id, relation_id)
 
             return {
                 "message": "Patient registered successfully with doctor relationship",
@@ -153,6 +166,110 @@ class PatientService:
                 detail=f"Error registering patient with details: {str(e)}"
             )
 
+    def _publish_registration(self, patient_id: str, doctor_id: str, relation_id: str):
+        if self.events is not None:
+            self.events.publish(
+                "patient.registered",
+                [patient_topic(patient_id), doctor_topic(doctor_id)],
+                {"patient_id": patient_id, "doctor_id": doctor_id, "relation_id": relation_id}
+            )
+
+    async def import_patients(self, rows, import_id: str = None) -> dict:
+        """
+        Register patients in bulk, with the same rules as
+        register_complete_patient: existing patients and ongoing relations
+        are skipped, and rows naming an unknown doctor fail. rows yields
+        (row_number, row) as parsed by app.services.bulk_import. Passing the
+        import_id of an interrupted import resumes after its last checkpoint.
+        Returns the per-row report.
+        """
+        import_id = import_id or str(uuid.uuid4())
+        saved = await self.db.get_import_progress(import_id)
+        progress = ImportProgress(import_id, "patients", saved if saved and saved.get("status") != "completed" else None)
+        seen = set()
+
+        def validate(row: dict) -> CompletePatientRegistration:
+            registration = CompletePatientRegistration(**row)
+            if registration.patient_id in seen:
+                raise ValueError("Duplicate patient_id in this import")
+            seen.add(registration.patient_id)
+            return registration
+
+        async def save_progress(document: dict):
+            await self.db.save_import_progress(import_id, document)
+
+        return await run_import(
+            rows, progress, validate, self._import_chunk, save_progress,
+            id_field="patient_id", chunk_rows=min(IMPORT_CHUNK_ROWS, IMPORT_MAX_CHUNK_ROWS)
+        )
+
+    async def _import_chunk(self, chunk):
+        registrations = chunk.rows
+        patient_ids = [registration.patient_id for _, registration in registrations]
+        relation_ids = {
+            registration.patient_id: f"{registration.doctor_id}_{registration.patient_id}"
+            for _, registration in registrations
+        }
+        # Four get_all round trips for the whole chunk instead of two reads per row
+        patients, statuses, relations, doctors = await asyncio.gather(
+            self.db.get_documents("patients", patient_ids),
+            self.db.get_documents(PATIENT_STATUS_COLLECTION, patient_ids),
+            self.db.get_documents("doctor_patient_relations", relation_ids.values()),
+            self.db.get_documents("doctors", {registration.doctor_id for _, registration in registrations})
+        )
+
+        batch, single = [], []
+        for row_number, registration in registrations:
+            relation_id = relation_ids[registration.patient_id]
+            existing_relation = relations.get(relation_id)
+            if patients.get(registration.patient_id) is not None:
+                chunk.skip(row_number, registration.patient_id, "Patient ID already exists")
+            elif existing_relation and existing_relation.get("treatment_status") == TreatmentStatus.ongoing:
+                chunk.skip(row_number, registration.patient_id, "An ongoing doctor-patient relationship already exists")
+            elif doctors.get(registration.doctor_id) is None:
+                chunk.fail(row_number, registration.patient_id, f"Doctor {registration.doctor_id} not found")
+            else:
+                relation = DoctorPatientRelation(
+                    doctor_id=registration.doctor_id,
+                    patient_id=registration.patient_id,
+                    treatment_status=TreatmentStatus.ongoing,
+                    treatment_start_date=datetime.now().isoformat(),
+                    treatment_end_date=None,
+                    diagnosed_with_disease=False,
+                    diagnosed_disease_id=None
+                ).dict()
+                patient = registration.dict(exclude={"doctor_id"})
+                registered = (row_number, registration, patient, relation_id, relation)
+                # Replacing a diagnosed relation moves the disease counters, which needs the transactional path
+                if relation_disease_counts(existing_relation):
+                    single.append(registered)
+                else:
+                    batch.append(registered + (statuses.get(registration.patient_id) is None,))
+
+        if batch:
+            try:
+                await self.db.create_patients([
+                    (registration.patient_id, patient, relation_id, relation, create_status)
+                    for _, registration, patient, relation_id, relation, create_status in batch
+                ])
+            except HTTPException as e:
+                for row_number, registration, *_ in batch:
+                    chunk.fail(row_number, registration.patient_id, f"Error saving patients: {e.detail}")
+            else:
+                for row_number, registration, patient, relation_id, relation, _ in batch:
+                    chunk.succeed(row_number)
+                    self._publish_registration(registration.patient_id, registration.doctor_id, relation_id)
+
+        for row_number, registration, patient, relation_id, relation in single:
+            try:
+                await self.db.create_patient(registration.patient_id, patient)
+                await self.db.set_relation(relation_id, relation)
+            except HTTPException as e:
+                chunk.fail(row_number, registration.patient_id, f"Error saving patient: {e.detail}")
+                continue
+            chunk.succeed(row_number)
+            self._publish_registration(registration.patient_id, registration.doctor_id, relation_id)
+
     async def update_patient(self, patient_id: str, patient: dict):
         
         try:
@@ -180,90 +297,74 @@ class PatientService:
             )
 
     async def delete_patient(self, patient_id: str):
-        # Get all relations for this patient
-        relations = await self.db.get_all_documents("doctor_patient_relations")
-        for relation in relations:
-            if relation.get("patient_id") == patient_id:
-                relation_id = f"{relation['doctor_id']}_{patient_id}"
-                await self.db.delete_document("doctor_patient_relations", relation_id)
+        # Only this patient's relations, not the whole collection
+        for relation in await self.db.get_doctor_patient_relations(patient_id):
+            await self.db.delete_relation(relation["relation_id"])
         
-        # Delete patient
-        await self.db.delete_document("patients", patient_id)
+        # Delete patient and its scan status summary
+        await self.db.delete_patient(patient_id)
+        if self.events is not None:
+            self.events.publish("patient.deleted", [patient_topic(patient_id)], {"patient_id": patient_id})
         return {"message": "Patient and related records deleted successfully"}
 
     async def get_patient(self, patient_id: str):
         patient = await self.db.get_document("patients", patient_id)
         return {"message": "Patient retrieved successfully", "patient": patient}
 
-    async def get_all_patients(self):
-        patients = await self.db.get_all_documents("patients")
-        return {"message": "Patients retrieved successfully", "patients": patients}
-
-    async def get_all_patients_status(self):
+    async def get_all_patients(self, page: PageRequest = None):
+        patients, next_cursor = await self.db.list_documents("patients", page)
+        return {"message": "Patients retrieved successfully", "patients": patients, "next_cursor": next_cursor}
+
+    def stream_patients(self, fields: list = None, changed_since: str = None):
+        return self.db.stream_documents("patients", fields, changed_since)
+
+    async def get_all_patients_status(self, page: PageRequest = None):
+        """
+        One page of patient status summaries, DEFAULT_PAGE_SIZE unless
+        page_size asks for more (up to MAX_PAGE_SIZE); follow next_cursor for
+        the rest. Unlike the other lists this one is always paged, as it
+        grows with every registered patient.
+        """
+        page = page or PageRequest()
+        page_size = min(page.page_size or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        page = PageRequest(**dict(page.dict(), page_size=page_size))
         try:
-            # Retrieve all patients
-            patients = await self.db.get_all_documents("patients")
-            
-            # Initialize the list to store patient statuses
-            patient_status_list = []
-
-            # Iterate over each patient
-            for patient in patients:
-                patient_id = patient.get("patient_id")
-                status = "Empty"  # Default status
-
-                # Retrieve all X-ray scans for the patient
-                scans = await self.db.get_all_documents("xray_scans")
-                patient_scans = [scan for scan in scans if scan.get("patient_id") == patient_id]
-
-                if patient_scans:
-                    # Check the radiologist_id in the scans
-                    if any(scan.get("radiologist_id") for scan in patient_scans):
-                        status = "Verified"
-                    else:
-                        status = "Unverified"
-
-                # Append the patient status to the list
-                patient_status_list.append({
-                    "patient_id": patient_id,
-                    "status": status
-                })
-
-            return {"message": "Patients retrieved successfully", "patients": patient_status_list}
+            # Summaries are maintained on every scan write by FirebaseDB
+            summaries, next_cursor = await self.db.list_documents(PATIENT_STATUS_COLLECTION, page)
+            return {"message": "Patients retrieved successfully", "patients": summaries, "next_cursor": next_cursor}
 
         except Exception as e:
+            if isinstance(e, HTTPException):
+                raise e
             raise HTTPException(
                 status_code=400,
                 detail=f"Error retrieving patient statuses: {str(e)}"
             )
 
     async def get_current_doctor_patients(self, doctor_id: str):
-        relations = await self.db.get_all_documents("doctor_patient_relations")
-        doctor_relations = [r for r in relations if r.get("doctor_id") == doctor_id and r.get("treatment_status") == TreatmentStatus.ongoing]
-        
-        patients = []
-        for relation in doctor_relations:
-            patient = await self.db.get_document("patients", relation["patient_id"])
-            if patient:
-                patients.append({
-                    "patient": patient,
-                    "treatment_status": relation["treatment_status"],
-                    "treatment_start_date": relation["treatment_start_date"],
-                    "treatment_end_date": relation["treatment_end_date"]
-                })
+        relations = await self.db.find_documents("doctor_patient_relations", "doctor_id", doctor_id)
+        doctor_relations = [r for r in relations if r.get("treatment_status") == TreatmentStatus.ongoing]
         
         return {
             "message": "Doctor's patients retrieved successfully",
-            "patients": patients
+            "patients": await self._load_relation_patients(doctor_relations)
         }
     
     async def get_doctor_patients(self, doctor_id: str):
-        relations = await self.db.get_all_documents("doctor_patient_relations")
-        doctor_relations = [r for r in relations if r.get("doctor_id") == doctor_id]
+        relations = await self.db.find_documents("doctor_patient_relations", "doctor_id", doctor_id)
         
+        return {
+            "message": "Doctor's patients retrieved successfully",
+            "patients": await self._load_relation_patients(relations)
+        }
+
+    async def _load_relation_patients(self, relations: list) -> list:
+        # Every patient in one get_all round trip; patients that no longer exist are left out
+        patients_by_id = await self.db.get_documents("patients", [relation["patient_id"] for relation in relations])
+
         patients = []
-        for relation in doctor_relations:
-            patient = await self.db.get_document("patients", relation["patient_id"])
+        for relation in relations:
+            patient = patients_by_id.get(relation["patient_id"])
             if patient:
                 patients.append({
                     "patient": patient,
@@ -271,16 +372,14 @@ class PatientService:
                     "treatment_start_date": relation["treatment_start_date"],
                     "treatment_end_date": relation["treatment_end_date"]
                 })
-        
-        return {
-            "message": "Doctor's patients retrieved successfully",
-            "patients": patients
-        }
+        return patients
     
 
 
     async def add_xray_scan(self, scan: XRayScan):
-        await self.db.create_document("xray_scans", scan.scan_id, scan.dict())
+        created = await self.db.create_scan(scan.scan_id, scan.dict())
+        if self.events is not None:
+            self.events.publish("scan.created", scan_topics(created, not created.get("radiologist_id")), created)
         return {"message": "X-ray scan added successfully", "scan_id": scan.scan_id}
 
     async def get_patient_scans(self, patient_id: str):
@@ -321,10 +420,7 @@ class PatientService:
                     "diagnosed_disease_id": disease_id
                 })
             
-            await self.db.update_document("doctor_patient_relations", relation_id, update_data)
-            
-            # Get updated treatment for response
-            updated_treatment = await self.db.get_document("doctor_patient_relations", relation_id)
+            updated_treatment = await self.db.update_relation(relation_id, update_data)
             return {
                 "message": "Treatment status updated successfully",
                 "treatment_details": updated_treatment
@@ -379,10 +475,7 @@ class PatientService:
 
             # Update the treatment
             relation_id = f"{relation_to_update['doctor_id']}_{relation_to_update['patient_id']}"
-            await self.db.update_document("doctor_patient_relations", relation_id, treatment_data)
-
-            # Get and return the updated record
-            updated_relation = await self.db.get_document("doctor_patient_relations", relation_id)
+            updated_relation = await self.db.update_relation(relation_id, treatment_data)
             return {
                 "message": "Treatment updated successfully",
                 "relation_id": relation_id,
@@ -399,24 +492,22 @@ class PatientService:
 
     async def get_patient_complete_details(self, patient_id: str):
         try:
-            # Get patient details
-            patient_details = await self.db.get_document("patients", patient_id)
+            # Patient and relations load together; doctor and disease follow once the ongoing treatment is known
+            loader = ConcurrentLoader()
+            loader.add("patient", lambda results: self.db.get_document("patients", patient_id))
+            loader.add("ongoing_treatment", lambda results: self._get_ongoing_treatment(patient_id))
+            loader.add("doctor", self._load_treatment_doctor, depends_on=["ongoing_treatment"], required=False)
+            loader.add("disease", self._load_treatment_disease, depends_on=["ongoing_treatment"], required=False)
+            results = await loader.run()
+
+            patient_details = results["patient"]
             if not patient_details:
                 raise HTTPException(
                     status_code=404,
                     detail=f"Patient {patient_id} not found"
                 )
 
-            # Get all doctor-patient relations for this patient
-            relations = await self.db.get_doctor_patient_relations(patient_id)
-            
-            # Find the ongoing treatment
-            ongoing_treatment = None
-            for relation in relations:
-                if relation.get("treatment_end_date") is None:
-                    ongoing_treatment = relation
-                    break
-
+            ongoing_treatment = results["ongoing_treatment"]
             if not ongoing_treatment:
                 # Return patient details without treatment info if no ongoing treatment
                 return {
@@ -424,23 +515,14 @@ class PatientService:
                     "message": "No ongoing treatment found"
                 }
 
-            # Get doctor details
-            doctor_id = ongoing_treatment.get("doctor_id")
-            try:
-                doctor_details = await self.db.get_document("doctors", doctor_id)
-            except HTTPException as e:
-                doctor_details = {"message": f"Doctor details not found: {str(e)}"}
-
-            # Get disease details if exists
-            disease_details = None
-            if ongoing_treatment.get("diagnosed_with_disease") and ongoing_treatment.get("diagnosed_disease_id"):
-                try:
-                    disease_details = await self.db.get_document(
-                        "diseases", 
-                        ongoing_treatment.get("diagnosed_disease_id")
-                    )
-                except HTTPException as e:
-                    disease_details = {"message": f"Disease details not found: {str(e)}"}
+            # Doctor and disease lookups may fail without failing the whole request
+            doctor_details = results.get("doctor")
+            if "doctor" in loader.errors:
+                doctor_details = {"message": f"Doctor details not found: {str(loader.errors['doctor'])}"}
+
+            disease_details = results.get("disease")
+            if "disease" in loader.errors:
+                disease_details = {"message": f"Disease details not found: {str(loader.errors['disease'])}"}
 
             # Construct the response
             response = {
@@ -466,3 +548,21 @@ class PatientService:
                 detail=f"Error fetching patient details: {str(e)}"
             )
 
+    async def _get_ongoing_treatment(self, patient_id: str):
+        relations = await self.db.get_doctor_patient_relations(patient_id)
+        for relation in relations:
+            if relation.get("treatment_end_date") is None:
+                return relation
+        return None
+
+    async def _load_treatment_doctor(self, results: dict):
+        ongoing_treatment = results["ongoing_treatment"]
+        if not ongoing_treatment:
+            return None
+        return await self.db.get_document("doctors", ongoing_treatment.get("doctor_id"))
+
+    async def _load_treatment_disease(self, results: dict):
+        ongoing_treatment = results["ongoing_treatment"]
+        if not ongoing_treatment or not (ongoing_treatment.get("diagnosed_with_disease") and ongoing_treatment.get("diagnosed_disease_id")):
+            return None
+        return await self.db.get_document("diseases", ongoing_treatment.get("diagnosed_disease_id"))
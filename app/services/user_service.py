@@ -1,8 +1,17 @@
 from app.database.firebase import FirebaseDB
-from app.models.schemas import User, Doctor, Radiologist
+from app.models.schemas import User, Doctor, Radiologist, PageRequest, BulkStaffRegistration
+from app.models.enums import UserRole
 import uuid
 from fastapi import HTTPException
 
+# Users accepted by one bulk registration call
+MAX_STAFF_PER_REQUEST = 5000
+# Profile collection, model and ID field for each role that can be registered in bulk
+STAFF_PROFILES = {
+    UserRole.doctor: ("doctors", Doctor, "doctor_id"),
+    UserRole.radiologist: ("radiologists", Radiologist, "radiologist_id")
+}
+
 class UserService:
     def __init__(self, db: FirebaseDB):
         self.db = db
@@ -21,6 +30,78 @@ class UserService:
         await self.db.create_document("radiologists", user_id, radiologist_data)
         return {"message": "Radiologist registered successfully", "user_id": user_id}
 
+    async def register_staff(self, registration: BulkStaffRegistration):
+        """
+        Register doctors and radiologists in bulk: auth accounts through the
+        batch user import, profiles in batched writes. Users whose email is
+        already registered are skipped; an account whose profile can't be
+        saved is deleted again. Returns the outcome for every user, in order.
+        """
+        users = registration.users
+        if len(users) > MAX_STAFF_PER_REQUEST:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_STAFF_PER_REQUEST} users per request")
+        results = [{"index": index, "email": user.email, "role": user.role} for index, user in enumerate(users)]
+
+        pending, seen = [], set()
+        for index, user in enumerate(users):
+            email = user.email.strip().lower()
+            if user.role not in STAFF_PROFILES:
+                results[index].update(status="failed", error="Only doctors and radiologists can be registered in bulk")
+            elif email in seen:
+                results[index].update(status="failed", error="Duplicate email in this request")
+            else:
+                seen.add(email)
+                pending.append(index)
+
+        # The batch import doesn't enforce unique emails, so check first
+        existing = await self.db.find_auth_emails([users[index].email.strip().lower() for index in pending])
+        accounts = []
+        for index in pending:
+            if users[index].email.strip().lower() in existing:
+                results[index].update(status="skipped", reason="A user with this email already exists")
+            else:
+                accounts.append((index, {
+                    "uid": uuid.uuid4().hex,
+                    "email": users[index].email.strip(),
+                    "display_name": users[index].full_name,
+                    "password": users[index].password
+                }))
+
+        failures = dict(await self.db.import_auth_users([account for _, account in accounts]))
+        created, writes = [], []
+        for position, (index, account) in enumerate(accounts):
+            if position in failures:
+                results[index].update(status="failed", error=f"Error creating account: {failures[position]}")
+                continue
+            user = users[index]
+            collection, model, id_field = STAFF_PROFILES[user.role]
+            profile = model(
+                user_id=account["uid"], email=account["email"], role=user.role,
+                full_name=user.full_name, specialization=user.specialization, **{id_field: account["uid"]}
+            )
+            created.append((index, account["uid"]))
+            writes.append((collection, account["uid"], profile.dict()))
+
+        write_failures = dict(await self.db.create_documents(writes))
+        orphans = [uid for position, (_, uid) in enumerate(created) if position in write_failures]
+        rollback_error = None
+        if orphans:
+            try:
+                await self.db.delete_auth_users(orphans)
+            except HTTPException as e:
+                rollback_error = e.detail
+        for position, (index, uid) in enumerate(created):
+            if position in write_failures:
+                error = f"Error saving profile: {write_failures[position]}"
+                if rollback_error:
+                    error += f"; account {uid} could not be removed: {rollback_error}"
+                results[index].update(status="failed", error=error)
+            else:
+                results[index].update(status="created", user_id=uid)
+
+        counts = {status: sum(1 for result in results if result["status"] == status) for status in ("created", "skipped", "failed")}
+        return {"message": "Staff registration finished", **counts, "results": results}
+
     async def update_doctor(self, doctor_id: str, doctor: dict):
         doctor_exists = await self.db.get_document("doctors", doctor_id)
         if not doctor_exists:
@@ -62,7 +143,7 @@ class UserService:
             # Delete all doctor-patient relationships
             for relation in doctor_relations:
                 relation_id = f"{doctor_id}_{relation['patient_id']}"
-                await self.db.delete_document("doctor_patient_relations", relation_id)
+                await self.db.delete_relation(relation_id)
             
             # Delete from Firestore
             await self.db.delete_document("doctors", doctor_id)
@@ -91,7 +172,7 @@ class UserService:
                     "radiologist_id": None,
                     "radiologist_report": None
                 }
-                await self.db.update_document("xray_scans", scan["scan_id"], scan_data)
+                await self.db.update_scan(scan["scan_id"], scan_data)
             
             # Delete from Firestore
             await self.db.delete_document("radiologists", radiologist_id)
@@ -108,15 +189,20 @@ class UserService:
                 detail=f"Error deleting radiologist: {str(e)}"
             )
 
-    async def get_all_doctors(self):
-        doctors = await self.db.get_all_documents("doctors")
-        return {"message": "Doctors retrieved successfully", "doctors": doctors}
+    async def get_all_doctors(self, page: PageRequest = None):
+        doctors, next_cursor = await self.db.list_documents("doctors", page)
+        return {"message": "Doctors retrieved successfully", "doctors": doctors, "next_cursor": next_cursor}
+
+    async def get_all_radiologists(self, page: PageRequest = None):
+        radiologists, next_cursor = await self.db.list_documents("radiologists", page)
+        return {"message": "Radiologists retrieved successfully", "radiologists": radiologists, "next_cursor": next_cursor}
+
+    def stream_doctors(self, fields: list = None, changed_since: str = None):
+        return self.db.stream_documents("doctors", fields, changed_since)
 
-    async def get_all_radiologists(self):
-        radiologists = await self.db.get_all_documents("radiologists")
-        return {"message": "Radiologists retrieved successfully", "radiologists": radiologists}
+    def stream_radiologists(self, fields: list = None, changed_since: str = None):
+        return self.db.stream_documents("radiologists", fields, changed_since)
 
-    
     async def get_doctor(self, doctor_id: str):
         doctor = await self.db.get_document("doctors", doctor_id)
         if doctor:
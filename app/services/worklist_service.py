@@ -0,0 +1,301 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from app.database.firebase import FirebaseDB
+from app.database.versioning import format_timestamp
+from app.services.disease_index import normalize_label, split_labels
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = float(os.getenv("XSPAND_WORKLIST_LEASE_SECONDS", "900"))
+MAX_LEASE_SECONDS = 4 * 3600
+# Reload interval when the unverified-scans listener is unavailable
+POLL_INTERVAL_SECONDS = float(os.getenv("XSPAND_WORKLIST_POLL_SECONDS", "15"))
+# Candidates checked together in one claim transaction
+CLAIM_BATCH_SIZE = int(os.getenv("XSPAND_WORKLIST_CLAIM_BATCH", "8"))
+# Transactions per claim before giving up on contention with other workers
+MAX_CLAIM_ROUNDS = 3
+
+def scan_confidence(scan: dict) -> float:
+    """
+    Highest AI confidence of a scan; ai_confidence is stored as "0.8, 0.6".
+    """
+    value = scan.get("ai_confidence")
+    if value is None or value == "":
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    scores = value.split(",") if isinstance(value, str) else value
+    try:
+        return max(float(score) for score in scores if str(score).strip())
+    except ValueError:
+        return 0.0
+
+class WorklistService:
+    """
+    Priority queue of unverified X-ray scans for radiologists: highest AI
+    confidence first, then highest disease severity_level, then oldest.
+
+    The queue is a heap kept in step with Firestore by a snapshot listener
+    on the unverified scans, so claiming never scans the collection. Heap
+    entries are invalidated lazily: an entry is skipped when its priority is
+    outdated or the scan is leased. Claims are leases written in a
+    transaction, which settles races between workers; a lease that expires
+    puts the scan back in the queue.
+    """
+    def __init__(self, db: FirebaseDB, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.db = db
+        self.poll_interval = poll_interval
+        self._priorities = {}
+        self._heap = []
+        self._leases = {}
+        self._expiries = []
+        self._finished = set()
+        self._severity = {}
+        self._severity_version = None
+        self._lock = threading.Lock()
+        self._watch = None
+        self._synced_at = None
+        self.claims = 0
+        self.contended = 0
+
+    def start(self):
+        try:
+            query = self.db.db.collection("xray_scans").where("radiologist_id", "==", None)
+            self._watch = query.on_snapshot(self._on_snapshot)
+        except Exception as e:
+            logger.warning("Worklist listener unavailable, polling instead: %s", e)
+            self._watch = None
+
+    def stop(self):
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception as e:
+                logger.warning("Error closing worklist listener: %s", e)
+            self._watch = None
+
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._lock:
+            for change in changes:
+                scan_id = change.document.id
+                if change.type.name == "REMOVED":
+                    self._priorities.pop(scan_id, None)
+                    if self._leases.pop(scan_id, None) is not None:
+                        self._finished.add(scan_id)
+                else:
+                    self._enqueue(scan_id, change.document.to_dict())
+            self._compact()
+            self._synced_at = time.time()
+
+    async def _sync(self):
+        # Without a live listener, reload the unverified scans every poll_interval
+        if self._watch is not None and getattr(self._watch, "is_active", True):
+            return
+        if self._synced_at is not None and time.time() - self._synced_at < self.poll_interval:
+            return
+        scans = await self.db.find_documents("xray_scans", "radiologist_id", None)
+        with self._lock:
+            pending = {scan["scan_id"] for scan in scans if scan.get("scan_id")}
+            for scan_id in set(self._priorities) - pending:
+                self._priorities.pop(scan_id, None)
+            for scan in scans:
+                if scan.get("scan_id"):
+                    self._enqueue(scan["scan_id"], scan)
+            self._compact()
+            self._synced_at = time.time()
+
+    def _enqueue(self, scan_id: str, scan: dict):
+        # Caller holds the lock
+        priority = (-scan_confidence(scan), -self._scan_severity(scan), str(scan.get("scan_timestamp") or ""))
+        if self._priorities.get(scan_id) == priority:
+            return
+        self._priorities[scan_id] = priority
+        heapq.heappush(self._heap, (priority, scan_id))
+
+    def _compact(self):
+        # Caller holds the lock; rebuild once outdated entries dominate the heap
+        if len(self._heap) > 2 * len(self._priorities) + 64:
+            self._heap = [(priority, scan_id) for scan_id, priority in self._priorities.items()]
+            heapq.heapify(self._heap)
+
+    def _scan_severity(self, scan: dict) -> int:
+        cache = self.db.reference_cache
+        if cache is None or not cache.is_cached("diseases"):
+            return 0
+        if self._severity_version != cache.version("diseases"):
+            severity = {}
+            for disease in cache.all("diseases"):
+                level = int(disease.get("severity_level") or 0)
+                for name in [disease.get("disease_name")] + list(disease.get("aliases") or []):
+                    if name:
+                        severity[normalize_label(name)] = level
+                if disease.get("disease_id"):
+                    severity[("id", disease["disease_id"])] = level
+            self._severity, self._severity_version = severity, cache.version("diseases")
+        levels = [self._severity.get(("id", scan.get("disease_id")), 0)]
+        levels += [self._severity.get(normalize_label(label), 0) for label in split_labels(scan.get("ai_classification"))]
+        return max(levels)
+
+    def _reap_expired(self, now: float):
+        # Caller holds the lock; expired leases go back in the queue
+        while self._expiries and self._expiries[0][0] <= now:
+            expires, scan_id = heapq.heappop(self._expiries)
+            lease = self._leases.get(scan_id)
+            if lease is None or lease[1] != expires:
+                continue
+            del self._leases[scan_id]
+            priority = self._priorities.get(scan_id)
+            if priority is not None:
+                heapq.heappush(self._heap, (priority, scan_id))
+
+    def _hold(self, scan_id: str, radiologist_id: str, expires: float):
+        # Caller holds the lock
+        self._leases[scan_id] = (radiologist_id, expires)
+        heapq.heappush(self._expiries, (expires, scan_id))
+
+    def _pop_next(self):
+        # Caller holds the lock; skip entries that are outdated, finished or leased
+        while self._heap:
+            priority, scan_id = heapq.heappop(self._heap)
+            if self._priorities.get(scan_id) == priority and scan_id not in self._leases:
+                return scan_id
+        return None
+
+    async def claim_next(self, radiologist_id: str, lease_seconds: float = LEASE_SECONDS) -> dict:
+        """
+        Lease the highest-priority unclaimed scan to radiologist_id. The next
+        CLAIM_BATCH_SIZE candidates are tried in one transaction, which grants
+        the first one still free, so contention costs no extra round trips.
+        """
+        await self._sync()
+        await self._release_finished()
+        lease_seconds = min(lease_seconds, MAX_LEASE_SECONDS)
+        for _ in range(MAX_CLAIM_ROUNDS):
+            now = time.time()
+            with self._lock:
+                self._reap_expired(now)
+                candidates = self._pop_batch(CLAIM_BATCH_SIZE)
+                if not candidates:
+                    raise HTTPException(status_code=404, detail="No unverified X-ray scans waiting")
+                # Provisional holds so concurrent claims in this process skip the candidates
+                for priority, scan_id in candidates:
+                    self._hold(scan_id, radiologist_id, now + lease_seconds)
+
+            try:
+                result = await self.db.acquire_scan_lease(
+                    [scan_id for _, scan_id in candidates], radiologist_id,
+                    self._timestamp(now + lease_seconds), self._timestamp(now)
+                )
+            except Exception:
+                with self._lock:
+                    for priority, scan_id in candidates:
+                        self._leases.pop(scan_id, None)
+                    self._requeue(candidates)
+                raise
+            with self._lock:
+                for priority, scan_id in candidates:
+                    self._leases.pop(scan_id, None)
+                for scan_id, lease in result["held"].items():
+                    # Claimed by another worker; skip it until that lease runs out
+                    self.contended += 1
+                    self._hold(scan_id, lease["radiologist_id"], self._epoch(lease["expires_at"]))
+                for scan_id in result["unavailable"]:
+                    self._priorities.pop(scan_id, None)
+                if result["scan_id"] is not None:
+                    self._hold(result["scan_id"], radiologist_id, now + lease_seconds)
+                # Candidates after the granted one were not looked at
+                self._requeue(candidates)
+                if result["scan_id"] is not None:
+                    self.claims += 1
+                    return {
+                        "message": "X-ray scan claimed successfully",
+                        "scan_details": result["scan"],
+                        "lease": result["lease"]
+                    }
+        raise HTTPException(status_code=409, detail="Could not claim an X-ray scan, please retry")
+
+    def _pop_batch(self, size: int) -> list:
+        # Caller holds the lock; the heap may hold a scan twice, so skip repeats
+        batch, seen = [], set()
+        while len(batch) < size:
+            scan_id = self._pop_next()
+            if scan_id is None:
+                break
+            if scan_id not in seen:
+                seen.add(scan_id)
+                batch.append((self._priorities[scan_id], scan_id))
+        return batch
+
+    def _requeue(self, candidates: list):
+        # Caller holds the lock; unleased candidates go back in the queue
+        for priority, scan_id in candidates:
+            if scan_id not in self._leases and self._priorities.get(scan_id) == priority:
+                heapq.heappush(self._heap, (priority, scan_id))
+
+    async def renew(self, scan_id: str, radiologist_id: str, lease_seconds: float = LEASE_SECONDS) -> dict:
+        now = time.time()
+        expires = now + min(lease_seconds, MAX_LEASE_SECONDS)
+        lease = await self.db.renew_scan_lease(scan_id, radiologist_id, self._timestamp(expires), self._timestamp(now))
+        with self._lock:
+            self._hold(scan_id, radiologist_id, expires)
+        return {"message": "Lease renewed successfully", "lease": lease}
+
+    async def release(self, scan_id: str, radiologist_id: str) -> dict:
+        await self.db.release_scan_lease(scan_id, radiologist_id)
+        with self._lock:
+            self._leases.pop(scan_id, None)
+            priority = self._priorities.get(scan_id)
+            if priority is not None:
+                heapq.heappush(self._heap, (priority, scan_id))
+        return {"message": "Lease released successfully", "scan_id": scan_id}
+
+    async def peek(self, limit: int = 20) -> list:
+        """
+        The next unclaimed scan IDs in priority order, without claiming them.
+        """
+        await self._sync()
+        with self._lock:
+            self._reap_expired(time.time())
+            waiting = [(priority, scan_id) for scan_id, priority in self._priorities.items() if scan_id not in self._leases]
+        return [
+            {"scan_id": scan_id, "ai_confidence": -priority[0], "severity_level": -priority[1], "scan_timestamp": priority[2]}
+            for priority, scan_id in heapq.nsmallest(limit, waiting)
+        ]
+
+    async def _release_finished(self):
+        # Verified scans leave the queue; drop their leftover lease documents
+        with self._lock:
+            finished, self._finished = self._finished, set()
+        if not finished:
+            return
+        try:
+            await self.db.delete_scan_leases(finished)
+        except Exception as e:
+            logger.warning("Error releasing leases of %d verified scans: %s", len(finished), e)
+
+    @staticmethod
+    def _timestamp(epoch: float) -> str:
+        return format_timestamp(datetime.fromtimestamp(epoch, timezone.utc))
+
+    @staticmethod
+    def _epoch(timestamp: str) -> float:
+        try:
+            return datetime.fromisoformat(timestamp).timestamp()
+        except (TypeError, ValueError):
+            return time.time() + LEASE_SECONDS
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "waiting": len(self._priorities) - len(set(self._leases) & set(self._priorities)),
+                "leased": len(self._leases),
+                "heap_size": len(self._heap),
+                "claims": self.claims,
+                "contended": self.contended,
+                "mode": "listening" if self._watch is not None else "polling"
+            }
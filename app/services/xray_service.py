@@ -1,17 +1,40 @@
 from app.database.firebase import FirebaseDB
-from app.models.schemas import XRayScan
+from app.models.schemas import XRayScan, PageRequest
 from fastapi import HTTPException
 from datetime import datetime
 from typing import List, Dict
 from firebase_admin import firestore
-from app.imageurl_classify import ImageClassifier
-from app.models.enums import TreatmentStatus
+from app.classifier import create_classifier
+from app.services.disease_index import DiseaseLabelIndex
+from app.core.single_flight import SingleFlight
+from app.core.events import EventBus, scan_topics
+from app.core.admission import (
+    AdmissionController, Overloaded,
+    INFERENCE_CONCURRENCY, INFERENCE_QUEUE_SIZE, INFERENCE_QUEUE_TIMEOUT_SECONDS
+)
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
-model = ImageClassifier()
+model = create_classifier()
 
 class XRayService:
-    def __init__(self, db: FirebaseDB):
+    def __init__(self, db: FirebaseDB, events: EventBus = None):
         self.db = db
+        self.events = events
+        self.disease_index = DiseaseLabelIndex(db, model.class_labels)
+        # Concurrent classifications of the same image share one inference
+        self.classify_flight = SingleFlight("classifier")
+        # Inference gets its own slots and threads, so a burst of classifications
+        # can't use up the shared threadpool the CRUD routes run on
+        self.inference_admission = AdmissionController(
+            "inference", INFERENCE_CONCURRENCY, INFERENCE_QUEUE_SIZE, INFERENCE_QUEUE_TIMEOUT_SECONDS
+        )
+        self.inference_executor = ThreadPoolExecutor(
+            max_workers=self.inference_admission.max_concurrent, thread_name_prefix="inference"
+        )
+
+    def close(self):
+        self.inference_executor.shutdown(wait=False, cancel_futures=True)
 
     async def add_xray_scan(self, scan: XRayScan) -> dict:
         """
@@ -34,8 +57,9 @@ class XRayService:
             # Add the ID to our data
             scan_dict['scan_id'] = doc_id
             
-            # Create the document with the data
-            doc_ref.set(scan_dict)
+            # Create the document and update the patient's status summary
+            created = await self.db.create_scan(doc_id, scan_dict)
+            self._publish("scan.created", created, unverified=not created.get("radiologist_id"))
             
             return {
                 "message": "X-ray scan added successfully",
@@ -61,11 +85,12 @@ class XRayService:
                 scan_dict['scan_timestamp'] = datetime.now().isoformat()
             
             try:
-                model = ImageClassifier()
-                results = model.classify(scan_dict['image_url'])
+                results = await self._classify(scan_dict['image_url'])
                 scan_dict['ai_classification'] = results['labels']
                 scan_dict['ai_confidence'] = results['confidence_scores']
 
+            except Overloaded:
+                raise
             except Exception as e:
                 raise HTTPException(
                 status_code=400,
@@ -80,14 +105,17 @@ class XRayService:
             # Add the ID to our data
             scan_dict['scan_id'] = doc_id
             
-            # Create the document with the data
-            doc_ref.set(scan_dict)
+            # Create the document and update the patient's status summary
+            created = await self.db.create_scan(doc_id, scan_dict)
+            self._publish("scan.classified", created, unverified=not created.get("radiologist_id"))
             
             return {
                 "message": "X-ray scan added successfully",
                 "scan_id": doc_id,
                 "scan_details": scan_dict
             }
+        except Overloaded:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=400,
@@ -102,70 +130,29 @@ class XRayService:
         try:
             if update_data.get('ai_approved'):
                 update_data['no_findings_detected'] = False
-                update_data['disease_name'] = update_data['ai_classification']
-                # Get disease id where disease name is matched
-                try:
-                    disease_query = self.db.db.collection("diseases").where("disease_name", "==", update_data['disease_name']).stream()
-                    disease = None
-                    for doc in disease_query:
-                        disease = doc.to_dict()
-                        break
-                    if not disease:
-                        raise HTTPException(
-                            status_code=404,
-                            detail=f"Disease with name {update_data['disease_name']} not found"
-                        )
-                    update_data['disease_id'] = disease['disease_id']
-                except Exception as e:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Error fetching disease document: {str(e)}"
-                    )
-
-            # Get the ongoing doctor_patient relationship
-            try:
-                current_scan = await self.db.get_document("xray_scans", scan_id)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Error fetching current X-ray scan document: {str(e)}"
-                )
+                update_data['disease_name'] = update_data.get('ai_classification')
+                # Multi-label predictions map to every matching disease; the first is the diagnosis
+                disease_ids = await self.disease_index.resolve_ids(update_data['disease_name'])
+                update_data['disease_ids'] = disease_ids
+                update_data['disease_id'] = disease_ids[0]
 
-            doc_id = f"{current_scan['doctor_id']}_{current_scan['patient_id']}"
-            try:
-                doc = await self.db.get_document("doctor_patient_relations", doc_id)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Error fetching doctor-patient relationship document: {str(e)}"
+            # A diagnosis also updates the relation, counters and status summary in the same transaction
+            if update_data.get('disease_id'):
+                updated_scan = await self._step(
+                    "Error updating X-ray scan document", self.db.update_scan_diagnosis(scan_id, update_data)
                 )
-
-            if doc and doc.get('treatment_status') == TreatmentStatus.ongoing:
-                try:
-                    await self.db.update_document("doctor_patient_relations", doc_id, {'diagnosed_disease_id': update_data['disease_id'], 'diagnosed_with_disease': True})
-                except Exception as e:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Error updating doctor-patient relationship document: {str(e)}"
-                    )
-
-            # Update the X-ray scan document
-            try:
-                await self.db.update_document("xray_scans", scan_id, update_data)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Error updating X-ray scan document: {str(e)}"
+            else:
+                updated_scan = await self._step(
+                    "Error updating X-ray scan document", self.db.update_scan(scan_id, update_data)
                 )
 
-            # Get and return the updated document
-            try:
-                updated_scan = await self.db.get_document("xray_scans", scan_id)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Error fetching updated X-ray scan document: {str(e)}"
-                )
+            # Approvals take the scan off the radiologist queue
+            approved = bool(update_data.get('ai_approved') or update_data.get('radiologist_id'))
+            self._publish(
+                "scan.approved" if approved else "scan.updated",
+                updated_scan,
+                unverified=approved or not updated_scan.get('radiologist_id')
+            )
 
             return {
                 "message": "X-ray scan updated successfully",
@@ -173,24 +160,59 @@ class XRayService:
                 "scan_details": updated_scan
             }
 
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=400,
                 detail=f"Error updating X-ray scan: {str(e)}"
             )
-    async def get_all_xrays(self) -> List[dict]:
+
+    def _publish(self, event_type: str, scan: dict, unverified: bool = False):
+        if self.events is not None and scan:
+            self.events.publish(event_type, scan_topics(scan, unverified), scan)
+
+    async def _classify(self, image_url: str) -> dict:
+        # Requests joining an in-flight classification don't take a slot
+        return await self.classify_flight.do(image_url, lambda: self._infer(image_url))
+
+    async def _infer(self, image_url: str) -> dict:
+        async with self.inference_admission.slot():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.inference_executor, model.classify, image_url)
+
+    @staticmethod
+    async def _step(error_message: str, awaitable):
+        try:
+            return await awaitable
+        except HTTPException:
+            # Already carries its status, such as 409 for a scan leased to someone else
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{error_message}: {str(e)}"
+            )
+
+    async def get_all_xrays(self, page: PageRequest = None) -> dict:
         """
-        Get all X-ray scans
+        Get all X-ray scans, or one page of them with the cursor for the next
         """
         try:
-            scans = await self.db.get_all_documents("xray_scans")
-            return scans
+            scans, next_cursor = await self.db.list_documents("xray_scans", page)
+            return {"message": "X-ray scans retrieved successfully", "scans": scans, "next_cursor": next_cursor}
         except Exception as e:
             raise HTTPException(
                 status_code=400,
                 detail=f"Error fetching X-ray scans: {str(e)}"
             )
 
+    def stream_xrays(self, fields: list = None, changed_since: str = None):
+        """
+        Stream every X-ray scan without loading the collection into memory
+        """
+        return self.db.stream_documents("xray_scans", fields, changed_since)
+
     async def get_unverified_xrays(self) -> List[dict]:
         """
         Get all X-ray scans that haven't been verified by a radiologist (radiologist_id is null)
@@ -220,8 +242,9 @@ class XRayService:
                     detail=f"X-ray scan {scan_id} not found"
                 )
 
-            model = ImageClassifier()
-            return model.classify(scan.get("image_url"))
+            return await self._classify(scan.get("image_url"))
+        except Overloaded:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=400,
@@ -234,8 +257,9 @@ class XRayService:
         Classify an X-ray image directly from an image URL
         """
         try:
-            model = ImageClassifier()
-            return model.classify(image_url)
+            return await self._classify(image_url)
+        except Overloaded:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=400,
@@ -265,7 +289,8 @@ class XRayService:
         Delete an X-ray scan based on its ID
         """
         try:
-            await self.db.delete_document("xray_scans", xray_scan_id)
+            deleted = await self.db.delete_scan(xray_scan_id)
+            self._publish("scan.deleted", deleted, unverified=bool(deleted) and not deleted.get("radiologist_id"))
             return {
                 "message": "X-ray scan deleted successfully",
                 "xray_scan_id": xray_scan_id
@@ -0,0 +1,55 @@
+"""
+Helpers for tests that drive the app in-process (httpx.AsyncClient with
+httpx.ASGITransport(app=app)).
+"""
+import contextlib
+from app.core import middleware
+
+COST_HEADERS = {
+    "queries": "X-Cost-Queries",
+    "documents_read": "X-Cost-Documents-Read",
+    "documents_written": "X-Cost-Documents-Written"
+}
+
+@contextlib.contextmanager
+def cost_headers():
+    """
+    Turn on the X-Cost-* debug headers for the duration of the block, and
+    turn off the response cache so every request is measured.
+    """
+    previous = middleware.COST_HEADERS_ENABLED, middleware.RESPONSE_CACHE_ENABLED
+    middleware.COST_HEADERS_ENABLED = True
+    middleware.RESPONSE_CACHE_ENABLED = False
+    try:
+        yield
+    finally:
+        middleware.COST_HEADERS_ENABLED, middleware.RESPONSE_CACHE_ENABLED = previous
+
+def response_cost(response) -> dict:
+    """
+    The Firestore cost reported in a response's X-Cost-* headers.
+    """
+    return {name: int(response.headers.get(header, 0)) for name, header in COST_HEADERS.items()}
+
+async def assert_max_reads(client, method: str, url: str, max_reads: int, **kwargs):
+    """
+    Send a request and fail if it read more than max_reads documents from
+    Firestore. Returns the response for further checks.
+
+        # A page of 50, plus one read to tell whether there is a next page
+        await assert_max_reads(client, "GET", "/api/v1/patients/status", 51, params={"page_size": 50})
+
+    Responses replayed from the response cache read nothing, so the cache
+    is turned off while the request runs.
+    """
+    with cost_headers():
+        response = await client.request(method, url, **kwargs)
+    if response.headers.get("X-Cache") in ("HIT", "STALE") or "X-Cost-Documents-Read" not in response.headers:
+        raise AssertionError(f"{method} {url} was not measured (X-Cache: {response.headers.get('X-Cache')})")
+    cost = response_cost(response)
+    if cost["documents_read"] > max_reads:
+        raise AssertionError(
+            f"{method} {url} read {cost['documents_read']} documents in {cost['queries']} queries, "
+            f"expected at most {max_reads}"
+        )
+    return response
@@ -0,0 +1,38 @@
+import os
+
+# Configuration is read at import time, so set it before the app is imported
+os.environ.setdefault("XSPAND_STORAGE_BACKEND", "memory")
+os.environ.setdefault("XSPAND_CLASSIFIER", "stub")
+os.environ.setdefault("XSPAND_STUB_CLASSIFIER_LATENCY_MS", "0")
+
+import pytest
+from app.loadtest.dataset import generate_dataset
+from app.loadtest.runner import seeded_client
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def dataset():
+    return generate_dataset(200, seed=0)
+
+@pytest.fixture
+def app():
+    from app.main import app
+    return app
+
+@pytest.fixture
+async def client(app, dataset):
+    """
+    An in-process client for the app, on the in-memory backend seeded with dataset.
+    """
+    async with seeded_client(app, dataset) as (client, _):
+        yield client
+
+@pytest.fixture
+def db(app, client):
+    """
+    The running app's FirebaseDB; db.db is the in-memory client.
+    """
+    return app.state.context.db
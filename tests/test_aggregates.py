@@ -0,0 +1,70 @@
+import pytest
+from app.database.aggregates import (
+    DISEASE_COUNTS_COLLECTION, PATIENT_STATUS_COLLECTION, rebuild_disease_counts, rebuild_patient_status
+)
+from app.models.enums import TreatmentStatus
+
+pytestmark = pytest.mark.anyio
+
+def snapshot(db, collection: str) -> dict:
+    documents = {}
+    for doc in db.db.collection(collection).stream():
+        data = doc.to_dict()
+        data.pop("updated_at", None)
+        # A counter decremented to zero is the same as no counter, which is what a rebuild leaves
+        if collection == DISEASE_COUNTS_COLLECTION and not data.get("total_patients") and not data.get("ongoing_patients"):
+            continue
+        documents[doc.id] = data
+    return documents
+
+def assert_matches_rebuild(db):
+    maintained = {collection: snapshot(db, collection) for collection in (DISEASE_COUNTS_COLLECTION, PATIENT_STATUS_COLLECTION)}
+    rebuild_disease_counts(db.db)
+    rebuild_patient_status(db.db)
+    assert maintained[DISEASE_COUNTS_COLLECTION] == snapshot(db, DISEASE_COUNTS_COLLECTION)
+    assert maintained[PATIENT_STATUS_COLLECTION] == snapshot(db, PATIENT_STATUS_COLLECTION)
+
+def ongoing_relation_with_scan(dataset: dict) -> tuple:
+    for scan in dataset["xray_scans"].values():
+        relation_id = f"{scan['doctor_id']}_{scan['patient_id']}"
+        relation = dataset["doctor_patient_relations"].get(relation_id)
+        if relation and relation["treatment_status"] == TreatmentStatus.ongoing and not scan.get("radiologist_id"):
+            return relation_id, relation, scan
+    pytest.fail("dataset has no unverified scan under an ongoing relation")
+
+async def test_relation_writes_keep_disease_counts(db, dataset):
+    relation_id, relation, _ = ongoing_relation_with_scan(dataset)
+    await db.set_relation("doctor_00000_patient_new", {
+        "doctor_id": "doctor_00000", "patient_id": relation["patient_id"],
+        "treatment_status": TreatmentStatus.ongoing.value,
+        "diagnosed_with_disease": True, "diagnosed_disease_id": "disease_nodule"
+    })
+    assert_matches_rebuild(db)
+    await db.update_relation(relation_id, {"treatment_status": TreatmentStatus.completed.value})
+    await db.update_relation("doctor_00000_patient_new", {"diagnosed_disease_id": "disease_effusion"})
+    await db.delete_relation("doctor_00000_patient_new")
+    assert_matches_rebuild(db)
+
+async def test_scan_writes_keep_patient_status(db, dataset):
+    scan = next(iter(dataset["xray_scans"].values()))
+    new_scan = dict(scan, scan_id="scan_new", radiologist_id=None, ai_approved=None, scan_timestamp="2030-01-01T00:00:00")
+    await db.create_scan("scan_new", new_scan)
+    assert_matches_rebuild(db)
+    # Verified, then moved to another patient, then deleted
+    await db.update_scan("scan_new", {"radiologist_id": "radiologist_00000"})
+    await db.update_scan("scan_new", {"radiologist_report": "Clear"})
+    assert_matches_rebuild(db)
+    await db.update_scan("scan_new", {"patient_id": "patient_000001", "scan_timestamp": "2029-01-01T00:00:00"})
+    assert_matches_rebuild(db)
+    await db.delete_scan("scan_new")
+    await db.delete_scan(scan["scan_id"])
+    assert_matches_rebuild(db)
+
+async def test_diagnosis_keeps_both_aggregates(db, dataset):
+    _, relation, scan = ongoing_relation_with_scan(dataset)
+    first = "disease_nodule" if relation.get("diagnosed_disease_id") != "disease_nodule" else "disease_effusion"
+    await db.update_scan_diagnosis(scan["scan_id"], {"disease_id": first, "radiologist_id": "radiologist_00000"})
+    assert_matches_rebuild(db)
+    # Re-diagnosed: the counter moves from the first disease to the second
+    await db.update_scan_diagnosis(scan["scan_id"], {"disease_id": "disease_mass", "radiologist_id": "radiologist_00000"})
+    assert_matches_rebuild(db)
@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+from app.services import patient_service
+
+pytestmark = pytest.mark.anyio
+
+ROWS = 50
+
+def registration(number: int) -> dict:
+    return {
+        "patient_id": f"patient_import_{number:03d}", "doctor_id": "doctor_00000", "full_name": f"Imported {number}",
+        "is_resident": True, "email_address": f"import{number}@example.org", "contact_number": "0123456789",
+        "age": 40, "height_cm": 170.0, "weight_kg": 70.0, "gender": "Female"
+    }
+
+async def upload(interrupt_after: int = None):
+    for number in range(1, ROWS + 1):
+        if number == interrupt_after:
+            # Let the dispatched chunks finish, then drop the connection
+            await asyncio.sleep(0.1)
+            raise ConnectionResetError("client went away")
+        yield number, registration(number)
+
+async def test_resumed_import_continues_from_the_checkpoint(app, db, dataset, monkeypatch):
+    monkeypatch.setattr(patient_service, "IMPORT_CHUNK_ROWS", 10)
+    service = app.state.context.patient_service
+
+    with pytest.raises(ConnectionResetError):
+        await service.import_patients(upload(interrupt_after=26), "import_1")
+    checkpoint = await db.get_import_progress("import_1")
+    assert (checkpoint["status"], checkpoint["rows_done"], checkpoint["imported"]) == ("interrupted", 20, 20)
+
+    report = await service.import_patients(upload(), "import_1")
+    assert (report["status"], report["resumed_from"]) == ("completed", 20)
+    # Rows 1-20 are passed over, not re-registered, so none come back as already existing
+    assert (report["imported"], report["skipped"], report["failed"]) == (ROWS, 0, 0)
+    patients = await db.get_documents("patients", [f"patient_import_{number:03d}" for number in range(1, ROWS + 1)])
+    assert all(patients.values())
+    assert len(list(db.db.collection("patients").stream())) == len(dataset["patients"]) + ROWS
@@ -0,0 +1,25 @@
+import logging
+import pytest
+from fastapi import HTTPException
+from app.classifier import CLASS_LABELS
+from app.services.disease_index import DiseaseLabelIndex
+
+pytestmark = pytest.mark.anyio
+
+async def test_unmapped_predictions_are_rejected_and_logged_once(db, caplog):
+    index = DiseaseLabelIndex(db, CLASS_LABELS, ttl=0)
+    assert await index.resolve_ids("Effusion, pleural-thickening") == ["disease_effusion", "disease_pleural_thickening"]
+
+    await db.delete_document("diseases", "disease_nodule")
+    with caplog.at_level(logging.WARNING, logger="app.services.disease_index"):
+        for _ in range(2):
+            with pytest.raises(HTTPException) as error:
+                await index.resolve_ids("Effusion, Nodule")
+            assert error.value.status_code == 404
+        # A label the classifier can't produce is the caller's mistake, not a gap in the diseases
+        with pytest.raises(HTTPException):
+            await index.resolve_ids("Broken arm")
+
+    warnings = [record.getMessage() for record in caplog.records]
+    assert warnings == ["Classifier labels Nodule match no disease name or alias"]
+    assert index.get_stats()["unmapped_class_labels"] == ["Nodule"]
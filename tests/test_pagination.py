@@ -0,0 +1,32 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def test_cursor_pages_cover_the_collection_once(client, dataset):
+    params = {"page_size": 40, "order_by": "-scan_timestamp", "fields": "scan_id,scan_timestamp"}
+    scans, cursor, pages = [], None, 0
+    while True:
+        response = await client.get("/api/v1/xrays/", params=dict(params, cursor=cursor) if cursor else params)
+        assert response.status_code == 200
+        body = response.json()
+        assert response.headers.get("X-Next-Cursor") == body["next_cursor"]
+        assert len(body["scans"]) <= 40
+        scans.extend(body["scans"])
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages > 1
+    assert sorted(scan["scan_id"] for scan in scans) == sorted(dataset["xray_scans"])
+    assert all(set(scan) <= {"scan_id", "scan_timestamp"} for scan in scans)
+    timestamps = [scan["scan_timestamp"] for scan in scans]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+async def test_cursor_is_checked(client):
+    first = (await client.get("/api/v1/patients/", params={"page_size": 10, "order_by": "age"})).json()
+    # The cursor was made for order_by=age
+    response = await client.get("/api/v1/patients/", params={"page_size": 10, "cursor": first["next_cursor"]})
+    assert response.status_code == 400
+    response = await client.get("/api/v1/patients/", params={"page_size": 10, "cursor": "not-a-cursor"})
+    assert response.status_code == 400
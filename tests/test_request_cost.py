@@ -0,0 +1,48 @@
+import pytest
+from app.testing import assert_max_reads, response_cost
+
+pytestmark = pytest.mark.anyio
+
+def doctor_relations(dataset: dict, doctor_id: str) -> list:
+    return [relation for relation in dataset["doctor_patient_relations"].values() if relation["doctor_id"] == doctor_id]
+
+async def test_patient_status_reads_one_page(client):
+    # Served from the status summaries, not recounted from the scans; one extra read finds the next page
+    for _ in range(2):
+        response = await assert_max_reads(client, "GET", "/api/v1/patients/status", 51, params={"page_size": 50})
+        assert response.status_code == 200
+        assert len(response.json()["patients"]) == 50
+
+async def test_patient_status_is_paged_by_default(client):
+    response = await assert_max_reads(client, "GET", "/api/v1/patients/status", 51)
+    assert len(response.json()["patients"]) == 50
+    assert response.json()["next_cursor"]
+
+async def test_doctor_patients_read_each_patient_once(client, dataset):
+    doctor_id = "doctor_00000"
+    relations = doctor_relations(dataset, doctor_id)
+    assert relations
+    # The relations, then every patient in one get_all
+    response = await assert_max_reads(client, "GET", f"/api/v1/patients/doctor/{doctor_id}", 2 * len(relations))
+    assert response.status_code == 200
+    assert len(response.json()["patients"]) == len(relations)
+    assert response_cost(response)["queries"] == 2
+
+async def test_delete_patient_reads_only_its_relations(client, dataset):
+    patient_id = "patient_000002"
+    relations = [relation for relation in dataset["doctor_patient_relations"].values() if relation["patient_id"] == patient_id]
+    # The relation query, then each relation (and its disease counters) inside its own transaction
+    response = await assert_max_reads(client, "DELETE", f"/api/v1/patients/{patient_id}", 3 * len(relations) + 1)
+    assert response.status_code == 200
+    assert (await client.get(f"/api/v1/patients/{patient_id}/complete")).status_code == 404
+
+async def test_cached_responses_are_still_measured(client):
+    from app.core import middleware
+    if not middleware.RESPONSE_CACHE_ENABLED:
+        pytest.skip("response cache disabled")
+    await client.get("/api/v1/patients/status")
+    assert (await client.get("/api/v1/patients/status")).headers.get("X-Cache") == "HIT"
+    # A cache hit reads nothing and would pass any limit
+    response = await assert_max_reads(client, "GET", "/api/v1/patients/status", 1000)
+    assert response.headers.get("X-Cache") is None
+    assert response_cost(response)["documents_read"] > 0
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+import pytest
+from app.database.local_backend import LocalDocumentReference
+
+pytestmark = pytest.mark.anyio
+
+async def test_reads_after_a_write_do_not_join_an_earlier_flight(db, monkeypatch):
+    original_get = LocalDocumentReference.get
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_get(self, *args, **kwargs):
+        snapshot = original_get(self, *args, **kwargs)
+        # Only the first read is held, after it has seen the old document
+        if not entered.is_set():
+            entered.set()
+            release.wait(5)
+        return snapshot
+
+    monkeypatch.setattr(LocalDocumentReference, "get", slow_get)
+    flights = db.single_flight
+    before = (flights.executions, flights.coalesced)
+
+    first = asyncio.ensure_future(db.get_document("patients", "patient_000001"))
+    while not entered.is_set():
+        await asyncio.sleep(0.01)
+    joined = asyncio.ensure_future(db.get_document("patients", "patient_000001"))
+    await asyncio.sleep(0)
+    await db.update_document("patients", "patient_000001", {"full_name": "Renamed"})
+    after = asyncio.ensure_future(db.get_document("patients", "patient_000001"))
+    await asyncio.sleep(0)
+    release.set()
+
+    first, joined, after = await asyncio.gather(first, joined, after)
+    assert first["full_name"] == joined["full_name"] != "Renamed"
+    # The read issued after the write ran on its own and saw it
+    assert after["full_name"] == "Renamed"
+    assert (flights.executions - before[0], flights.coalesced - before[1]) == (2, 1)
@@ -0,0 +1,44 @@
+import pytest
+from firebase_admin import auth
+
+pytestmark = pytest.mark.anyio
+
+def staff(email: str, role: str = "Doctor") -> dict:
+    return {"email": email, "password": "correct horse battery", "role": role, "full_name": "Dr. Staff", "specialization": "Radiology"}
+
+async def register(client, *users) -> dict:
+    response = await client.post("/api/v1/register/staff", json={"users": list(users)})
+    assert response.status_code == 200
+    return response.json()
+
+def accounts(db, *emails) -> list:
+    return db.auth.get_users([auth.EmailIdentifier(email) for email in emails]).users
+
+async def test_existing_and_repeated_emails_are_skipped(client, db):
+    first = await register(client, staff("Ada@Example.org"))
+    assert first["created"] == 1
+
+    result = await register(
+        client, staff("ada@example.org"), staff("grace@example.org", "Radiologist"),
+        staff("grace@example.org"), staff("admin@example.org", "Admin")
+    )
+    assert [user["status"] for user in result["results"]] == ["skipped", "created", "failed", "failed"]
+    assert len(accounts(db, "ada@example.org")) == 1
+    radiologist_id = result["results"][1]["user_id"]
+    assert db.db.collection("radiologists").document(radiologist_id).get().exists
+
+async def test_account_is_removed_when_its_profile_fails(client, db, monkeypatch):
+    create_documents = db.create_documents
+
+    async def reject_first(writes):
+        # The first profile's batch is refused; the rest are saved
+        failures = await create_documents(writes[1:])
+        return [(0, "write rejected")] + [(index + 1, reason) for index, reason in failures]
+
+    monkeypatch.setattr(db, "create_documents", reject_first)
+    result = await register(client, staff("alan@example.org"), staff("barbara@example.org"))
+    assert [user["status"] for user in result["results"]] == ["failed", "created"]
+    assert "write rejected" in result["results"][0]["error"]
+    # The rejected user's account is rolled back, so they can register again
+    assert accounts(db, "alan@example.org") == []
+    assert len(accounts(db, "barbara@example.org")) == 1
@@ -0,0 +1,31 @@
+import json
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+NDJSON = {"Accept": "application/x-ndjson"}
+
+async def stream_lines(client, url: str) -> list:
+    response = await client.get(url, headers=NDJSON)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+async def test_complete_stream_has_no_error_line(client, dataset):
+    lines = await stream_lines(client, "/api/v1/patients/")
+    assert sorted(line["patient_id"] for line in lines) == sorted(dataset["patients"])
+
+async def test_failed_stream_ends_with_an_error_line(client, db, monkeypatch):
+    chunked = db._chunked
+
+    def failing(iterator):
+        chunks = chunked(iterator)
+        yield next(chunks)
+        raise RuntimeError("stream reset by Firestore")
+
+    monkeypatch.setattr(db, "_chunked", failing)
+    lines = await stream_lines(client, "/api/v1/patients/")
+    # The documents sent before the failure, then the error
+    assert len(lines) > 1
+    assert all("error" not in line for line in lines[:-1])
+    assert lines[-1] == {"error": "stream reset by Firestore"}
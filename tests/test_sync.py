@@ -0,0 +1,30 @@
+import pytest
+from app.database.versioning import now_timestamp
+
+pytestmark = pytest.mark.anyio
+
+async def test_etag_answers_304_until_the_document_changes(client):
+    url = "/api/v1/patients/patient_000001/complete"
+    response = await client.get(url)
+    etag = response.headers["ETag"]
+    unchanged = await client.get(url, headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+
+    assert (await client.put("/api/v1/patients/patient_000001", json={"full_name": "Renamed"})).status_code == 200
+    changed = await client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+async def test_changed_since_returns_only_later_updates(client):
+    since = now_timestamp()
+    for patient_id in ("patient_000003", "patient_000004"):
+        assert (await client.put(f"/api/v1/patients/{patient_id}", json={"age": 50})).status_code == 200
+    response = await client.get("/api/v1/patients/", params={"changed_since": since})
+    assert response.status_code == 200
+    assert sorted(patient["patient_id"] for patient in response.json()["patients"]) == ["patient_000003", "patient_000004"]
+
+    # Paged changes come in updated_at order
+    page = (await client.get("/api/v1/patients/", params={"changed_since": since, "page_size": 1})).json()
+    assert [patient["patient_id"] for patient in page["patients"]] == ["patient_000003"]
+    assert page["next_cursor"]
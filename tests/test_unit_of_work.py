@@ -0,0 +1,38 @@
+import pytest
+from fastapi import HTTPException
+from app.database.unit_of_work import unit_of_work
+
+pytestmark = pytest.mark.anyio
+
+def stored(db, collection: str, doc_id: str):
+    return db.db.collection(collection).document(doc_id).get().to_dict()
+
+async def test_reads_see_staged_writes(db):
+    with unit_of_work() as unit:
+        await db.create_document("patients", "patient_new", {"patient_id": "patient_new", "full_name": "A"})
+        await db.update_document("patients", "patient_new", {"full_name": "B"})
+        await db.update_document("patients", "patient_new", {"age": 40})
+        # Served from the identity map; nothing has been sent yet
+        patient = await db.get_document("patients", "patient_new")
+        assert (patient["full_name"], patient["age"]) == ("B", 40)
+        assert stored(db, "patients", "patient_new") is None
+        assert unit.reads == 0
+
+        await db.delete_document("patients", "patient_000000")
+        with pytest.raises(HTTPException) as error:
+            await db.get_document("patients", "patient_000000")
+        assert error.value.status_code == 404
+        assert stored(db, "patients", "patient_000000") is not None
+
+        await db.flush_unit_of_work()
+        # One batch commit, holding the three writes to patient_new as one
+        assert unit.writes == 1
+
+    assert stored(db, "patients", "patient_new")["full_name"] == "B"
+    assert stored(db, "patients", "patient_000000") is None
+
+async def test_a_document_is_read_once_per_unit(db):
+    with unit_of_work() as unit:
+        for _ in range(3):
+            await db.get_document("patients", "patient_000001")
+        assert (unit.reads, unit.hits) == (1, 2)
@@ -0,0 +1,59 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def claim(client, radiologist_id: str) -> dict:
+    response = await client.post("/api/v1/xrays/worklist/claim", params={"radiologist_id": radiologist_id})
+    assert response.status_code == 200
+    return response.json()
+
+async def test_approval_needs_the_lease(client, db):
+    claimed = await claim(client, "radiologist_a")
+    scan_id = claimed["lease"]["scan_id"]
+    label = claimed["scan_details"]["ai_classification"]
+
+    response = await client.put(f"/api/v1/xrays/{scan_id}", json={
+        "radiologist_id": "radiologist_b", "ai_approved": True, "ai_classification": label
+    })
+    assert response.status_code == 409
+    assert db.db.collection("xray_scans").document(scan_id).get().to_dict().get("radiologist_id") is None
+
+    response = await client.put(f"/api/v1/xrays/{scan_id}", json={
+        "radiologist_id": "radiologist_a", "ai_approved": True, "ai_classification": label
+    })
+    assert response.status_code == 200
+    assert response.json()["scan_details"]["radiologist_id"] == "radiologist_a"
+
+async def test_approval_releases_the_lease(client, db):
+    claimed = await claim(client, "radiologist_a")
+    scan_id = claimed["lease"]["scan_id"]
+    response = await client.put(f"/api/v1/xrays/{scan_id}", json={"radiologist_id": "radiologist_a", "radiologist_report": "Clear"})
+    assert response.status_code == 200
+    # Released in the approval's transaction, not left for the listener to clean up
+    assert not db.db.collection("xray_scan_leases").document(scan_id).get().exists
+
+async def test_assignment_without_lease_is_refused(client):
+    scan_id = (await claim(client, "radiologist_a"))["lease"]["scan_id"]
+    response = await client.put(f"/api/v1/xrays/{scan_id}", json={"radiologist_id": "radiologist_b", "radiologist_report": "Clear"})
+    assert response.status_code == 409
+
+async def test_concurrent_claims_get_distinct_scans(client):
+    import asyncio
+    claims = await asyncio.gather(*(claim(client, f"radiologist_{i}") for i in range(12)))
+    scan_ids = [claimed["lease"]["scan_id"] for claimed in claims]
+    assert len(set(scan_ids)) == len(scan_ids)
+
+async def test_claim_skips_leases_held_elsewhere_in_one_transaction(client, db):
+    from app.testing import cost_headers, response_cost
+    # Leases written by another instance, which this one's queue doesn't know about
+    waiting = (await client.get("/api/v1/xrays/worklist", params={"limit": 5})).json()
+    held = [entry["scan_id"] for entry in waiting]
+    for scan_id in held:
+        db.db.collection("xray_scan_leases").document(scan_id).set({
+            "scan_id": scan_id, "radiologist_id": "radiologist_elsewhere", "expires_at": "9999-01-01T00:00:00.000000+00:00"
+        })
+    with cost_headers():
+        response = await client.post("/api/v1/xrays/worklist/claim", params={"radiologist_id": "radiologist_a"})
+    assert response.status_code == 200
+    assert response.json()["lease"]["scan_id"] not in held
+    assert response_cost(response)["queries"] == 1